@@ -1,32 +1,142 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
-from app.models import Device, DeviceParams, MqttPublishRequest, MqttSubscribeRequest
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Literal, Optional
+from app.models import Device, DeviceParams, DeviceRule, BulkDeviceCreate, LoadProfile, SyntheticLoadConfig, MqttPublishRequest, MqttSubscribeRequest
+from app import database
 from app.database import get_db
-from app.engine import engine
+from app.engine import engine, HIGH_RES_TIMING
+from app.datasets import CsvIngest, CsvUploadError
+from app.events import hub
 import aiosqlite
+import asyncio
+import json
+import time
 import uuid
 import logging
 from fastapi import UploadFile, File
-import shutil
 import os
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-@router.get("/devices", response_model=List[Device])
-async def list_devices(db: aiosqlite.Connection = Depends(get_db)):
-    cursor = await db.execute("SELECT * FROM devices")
+# CSV uploads are read, validated and written in pieces of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Bulk creation writes this many devices per executemany and reports progress after each
+BULK_CHUNK_SIZE = 5000
+
+# Device listing: page size cap, stored columns and those SQLite keeps as 0/1
+LIST_PAGE_MAX = 1000
+DEVICE_COLUMNS = [name for name in Device.model_fields if name not in ("params", "rules", "messages")]
+# Child rows listed with each device: field -> table
+CHILD_TABLES = {"params": "device_params", "rules": "device_rules"}
+BOOL_COLUMNS = ("retain", "csv_loop")
+
+INSERT_DEVICE_SQL = """
+    INSERT INTO devices (uuid, name, status, mode, publish_topic, subscribe_topic, interval_ms, qos, retain, csv_file_path, csv_loop, phase_offset_ms, csv_replay_speed)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+INSERT_PARAM_SQL = """
+    INSERT INTO device_params (device_uuid, param_name, type, min_val, max_val, precision, string_value,
+                               generator, step, period_s, phase_s, noise, spike_prob)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+INSERT_RULE_SQL = """
+    INSERT INTO device_rules (device_uuid, topic, field, equals, action, param_name, value_field, interval_ms, min_val, max_val, reply_topic, reply_payload)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def _device_row(device: Device, uuid: str, name: str, publish_topic: str, subscribe_topic: str | None):
+    return (
+        uuid, name, device.status, device.mode,
+        publish_topic, subscribe_topic, device.interval_ms,
+        device.qos, int(device.retain), device.csv_file_path, int(device.csv_loop),
+        device.phase_offset_ms, device.csv_replay_speed
+    )
+
+def _param_row(uuid: str, param: DeviceParams):
+    return (uuid, param.param_name, param.type, param.min_val, param.max_val, param.precision, param.string_value,
+            param.generator, param.step, param.period_s, param.phase_s, param.noise, param.spike_prob)
+
+def _rule_row(uuid: str, rule: DeviceRule):
+    return (uuid, rule.topic, rule.field, rule.equals, rule.action, rule.param_name, rule.value_field,
+            rule.interval_ms, rule.min_val, rule.max_val, rule.reply_topic, rule.reply_payload)
+
+@router.get("/devices", response_model=None)
+async def list_devices(
+    response: Response,
+    status: Optional[Literal['RUNNING', 'STOPPED']] = None,
+    mode: Optional[Literal['RANDOM', 'CSV_PLAYBACK']] = None,
+    limit: Optional[int] = Query(None, ge=1, le=LIST_PAGE_MAX),
+    cursor: Optional[int] = None,
+    fields: Optional[str] = None,
+    db: aiosqlite.Connection = Depends(get_db),
+):
+    """Devices in creation order, optionally filtered.
+
+    With limit, one page is returned; X-Next-Cursor (absent on the last page)
+    is the cursor for the next one and X-Total-Count counts all matches.
+    fields is a comma-separated projection; uuid is always included.
+    """
+    wanted = list(Device.model_fields) if not fields else ["uuid"] + [f.strip() for f in fields.split(",") if f.strip() != "uuid"]
+    unknown = [f for f in wanted if f not in Device.model_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    columns = [f for f in wanted if f in DEVICE_COLUMNS]
+
+    where, args = [], []
+    if status:
+        where.append("d.status = ?")
+        args.append(status)
+    if mode:
+        where.append("d.mode = ?")
+        args.append(mode)
+    filters = " AND ".join(where) or "1"
+    page_filters = filters
+    page_args = list(args)
+    if cursor is not None:
+        page_filters += " AND d.rowid > ?"
+        page_args.append(cursor)
+
+    query = f"SELECT d.rowid AS _row, {', '.join('d.' + c for c in columns)} FROM devices d WHERE {page_filters} ORDER BY d.rowid"
+    if limit:
+        query += f" LIMIT {limit + 1}"
+    rows = await (await db.execute(query, page_args)).fetchall()
+    if limit:
+        if len(rows) > limit:
+            rows = rows[:limit]
+            response.headers["X-Next-Cursor"] = str(rows[-1]["_row"])
+        total = await (await db.execute(f"SELECT COUNT(*) FROM devices d WHERE {filters}", args)).fetchone()
+        response.headers["X-Total-Count"] = str(total[0])
+
     devices = []
-    rows = await cursor.fetchall()
     for row in rows:
-        device_data = dict(row)
-        # Fetch params for each device
-        params_cursor = await db.execute("SELECT * FROM device_params WHERE device_uuid = ?", (device_data['uuid'],))
-        params_rows = await params_cursor.fetchall()
-        device_data['params'] = [dict(p) for p in params_rows]
-        # Fetch messages from engine
-        device_data['messages'] = engine.received_messages.get(device_data['uuid'], [])
-        devices.append(Device(**device_data))
+        device = {c: row[c] for c in columns}
+        for c in BOOL_COLUMNS:
+            if c in device:
+                device[c] = bool(device[c])
+        devices.append(device)
+
+    for field, table in CHILD_TABLES.items():
+        if field not in wanted:
+            continue
+        # One grouped query for the whole page instead of one per device
+        children: Dict[str, List[Dict]] = {d["uuid"]: [] for d in devices}
+        if limit:
+            placeholders = ", ".join("?" * len(children))
+            p_cursor = await db.execute(f"SELECT * FROM {table} WHERE device_uuid IN ({placeholders}) ORDER BY id", list(children))
+        else:
+            p_cursor = await db.execute(f"""
+                SELECT p.* FROM {table} p JOIN devices d ON d.uuid = p.device_uuid
+                WHERE {filters} ORDER BY p.id
+            """, args)
+        async for p in p_cursor:
+            children[p["device_uuid"]].append(dict(p))
+        for device in devices:
+            device[field] = children[device["uuid"]]
+    if "messages" in wanted:
+        messages = await engine.device_messages([d["uuid"] for d in devices])
+        for device in devices:
+            device["messages"] = messages.get(device["uuid"], [])
     return devices
 
 @router.post("/devices", response_model=Device)
@@ -38,22 +148,13 @@ async def create_device(device: Device, db: aiosqlite.Connection = Depends(get_d
     logger.info(f"Creating device: {device}")
     
     try:
-        await db.execute("""
-            INSERT INTO devices (uuid, name, status, mode, publish_topic, subscribe_topic, interval_ms, qos, retain, csv_file_path, csv_loop)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            device.uuid, device.name, device.status, device.mode,
-            device.publish_topic, device.subscribe_topic, device.interval_ms,
-            device.qos, int(device.retain), device.csv_file_path, int(device.csv_loop)
-        ))
+        await db.execute(INSERT_DEVICE_SQL, _device_row(device, device.uuid, device.name, device.publish_topic, device.subscribe_topic))
         
         for param in device.params:
             if not param.device_uuid:
                 param.device_uuid = device.uuid
-            await db.execute("""
-                INSERT INTO device_params (device_uuid, param_name, type, min_val, max_val, precision, string_value)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (device.uuid, param.param_name, param.type, param.min_val, param.max_val, param.precision, param.string_value))
+        await db.executemany(INSERT_PARAM_SQL, [_param_row(device.uuid, param) for param in device.params])
+        await db.executemany(INSERT_RULE_SQL, [_rule_row(device.uuid, rule) for rule in device.rules or []])
         
         await db.commit()
     except aiosqlite.IntegrityError as e:
@@ -63,8 +164,70 @@ async def create_device(device: Device, db: aiosqlite.Connection = Depends(get_d
         logger.error(f"Create Device Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     
+    await engine.device_changed(device.uuid)
+    hub.publish("device", {"action": "created", "uuid": device.uuid})
     return device
 
+@router.post("/devices/bulk")
+async def create_devices_bulk(request: BulkDeviceCreate):
+    """Provision a fleet from a template in one transaction; progress streams back as NDJSON lines"""
+    # Up to a million devices: formatting them would stall the tick loop and every other request
+    try:
+        fleet = await asyncio.to_thread(_expand_template, request)
+    except (KeyError, IndexError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid pattern: {e!r}")
+    if not await asyncio.to_thread(_unique_uuids, fleet):
+        raise HTTPException(status_code=400, detail="uuid_pattern does not produce unique UUIDs")
+    logger.info(f"Bulk creating {len(fleet)} devices")
+    return StreamingResponse(_bulk_insert(request.template, fleet), media_type="application/x-ndjson")
+
+def _expand_template(request: BulkDeviceCreate):
+    """(uuid, name, publish_topic, subscribe_topic) for every device in the fleet"""
+    template = request.template
+    name_pattern = template.name if "{n}" in template.name else template.name + "-{n}"
+    fleet = []
+    for n in range(request.start_index, request.start_index + request.count):
+        device_uuid = request.uuid_pattern.format(n=n) if request.uuid_pattern else str(uuid.uuid4())
+        fields = {"n": n, "uuid": device_uuid}
+        fleet.append((
+            device_uuid,
+            name_pattern.format(**fields),
+            template.publish_topic.format(**fields),
+            template.subscribe_topic.format(**fields) if template.subscribe_topic else None,
+        ))
+    return fleet
+
+def _unique_uuids(fleet) -> bool:
+    return len({uuid for uuid, *_ in fleet}) == len(fleet)
+
+async def _bulk_insert(template: Device, fleet):
+    started = time.monotonic()
+    total = len(fleet)
+    async with database.connect() as db:
+        try:
+            for start in range(0, total, BULK_CHUNK_SIZE):
+                chunk = fleet[start:start + BULK_CHUNK_SIZE]
+                await db.executemany(INSERT_DEVICE_SQL, [_device_row(template, *device) for device in chunk])
+                await db.executemany(INSERT_PARAM_SQL, [
+                    _param_row(device[0], param) for device in chunk for param in template.params
+                ])
+                if template.rules:
+                    await db.executemany(INSERT_RULE_SQL, [
+                        _rule_row(device[0], rule) for device in chunk for rule in template.rules
+                    ])
+                yield json.dumps({"status": "writing", "written": start + len(chunk), "total": total}) + "\n"
+            await db.commit()
+        except aiosqlite.Error as e:
+            await db.rollback()
+            logger.error(f"Bulk create failed, rolled back: {e}")
+            yield json.dumps({"status": "error", "detail": str(e), "created": 0}) + "\n"
+            return
+    # One reconcile picks up the whole fleet instead of an event per device
+    if template.status == 'RUNNING':
+        await engine.resync()
+    hub.publish("resync", {})
+    yield json.dumps({"status": "done", "created": total, "elapsed_s": round(time.monotonic() - started, 3)}) + "\n"
+
 @router.get("/devices/{device_uuid}", response_model=Device)
 async def get_device(device_uuid: str, db: aiosqlite.Connection = Depends(get_db)):
     cursor = await db.execute("SELECT * FROM devices WHERE uuid = ?", (device_uuid,))
@@ -76,8 +239,10 @@ async def get_device(device_uuid: str, db: aiosqlite.Connection = Depends(get_db
     params_cursor = await db.execute("SELECT * FROM device_params WHERE device_uuid = ?", (device_uuid,))
     params_rows = await params_cursor.fetchall()
     device_data['params'] = [dict(p) for p in params_rows]
+    rules_cursor = await db.execute("SELECT * FROM device_rules WHERE device_uuid = ? ORDER BY id", (device_uuid,))
+    device_data['rules'] = [dict(r) for r in await rules_cursor.fetchall()]
     # Fetch messages from engine
-    device_data['messages'] = engine.received_messages.get(device_uuid, [])
+    device_data['messages'] = (await engine.device_messages([device_uuid])).get(device_uuid, [])
     
     return Device(**device_data)
 
@@ -99,13 +264,15 @@ async def update_device(device_uuid: str, device: Device, db: aiosqlite.Connecti
                 qos = ?, 
                 retain = ?, 
                 csv_file_path = ?, 
-                csv_loop = ?
+                csv_loop = ?,
+                phase_offset_ms = ?,
+                csv_replay_speed = ?
             WHERE uuid = ?
         """, (
             device.name, device.mode,
             device.publish_topic, device.subscribe_topic, device.interval_ms,
             device.qos, int(device.retain), device.csv_file_path, int(device.csv_loop),
-            device_uuid
+            device.phase_offset_ms, device.csv_replay_speed, device_uuid
         ))
         
         # Update params: delete and re-insert
@@ -113,24 +280,35 @@ async def update_device(device_uuid: str, device: Device, db: aiosqlite.Connecti
         for param in device.params:
             if not param.device_uuid:
                 param.device_uuid = device_uuid
-            await db.execute("""
-                INSERT INTO device_params (device_uuid, param_name, type, min_val, max_val, precision, string_value)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (device_uuid, param.param_name, param.type, param.min_val, param.max_val, param.precision, param.string_value))
+        await db.executemany(INSERT_PARAM_SQL, [_param_row(device_uuid, param) for param in device.params])
+        
+        # Rules are only replaced when sent (the dashboard form doesn't edit them)
+        if device.rules is not None:
+            await db.execute("DELETE FROM device_rules WHERE device_uuid = ?", (device_uuid,))
+            await db.executemany(INSERT_RULE_SQL, [_rule_row(device_uuid, rule) for rule in device.rules])
         
         await db.commit()
     except Exception as e:
         logger.error(f"Update Device Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     
+    await engine.device_changed(device_uuid)
+    # status isn't part of an update
+    hub.publish("device", {"action": "updated", "uuid": device_uuid,
+                           "device": device.model_dump(exclude={"status", "messages"})})
     return device
 
 @router.delete("/devices/{device_uuid}")
 async def delete_device(device_uuid: str, db: aiosqlite.Connection = Depends(get_db)):
     cursor = await db.execute("DELETE FROM devices WHERE uuid = ?", (device_uuid,))
+    # Foreign keys aren't enforced, so the cascade is done here
+    for table in CHILD_TABLES.values():
+        await db.execute(f"DELETE FROM {table} WHERE device_uuid = ?", (device_uuid,))
     await db.commit()
     if cursor.rowcount == 0:
         raise HTTPException(status_code=404, detail="Device not found")
+    await engine.device_removed(device_uuid)
+    hub.publish("device", {"action": "deleted", "uuid": device_uuid})
     return {"message": "Device deleted"}
 
 @router.post("/devices/{device_uuid}/upload-csv")
@@ -140,45 +318,77 @@ async def upload_csv(device_uuid: str, file: UploadFile = File(...), db: aiosqli
     if not await cursor.fetchone():
         raise HTTPException(status_code=404, detail="Device not found")
     
-    # Save file
-    file_path = f"data/csv/{device_uuid}_{file.filename}"
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    filename = os.path.basename(file.filename or "")
+    if not filename:
+        raise HTTPException(status_code=400, detail="The uploaded file has no filename")
     
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Stream to disk while validating; the columnar copy playback reads is built alongside
+    file_path = f"data/csv/{device_uuid}_{filename}"
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    tmp_path = file_path + ".upload"
+    ingest = CsvIngest(file_path)
+    try:
+        with await asyncio.to_thread(open, tmp_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await asyncio.to_thread(_store_chunk, buffer, ingest, chunk)
+        await asyncio.to_thread(ingest.finish)
+        await asyncio.to_thread(os.replace, tmp_path, file_path)
+        await asyncio.to_thread(ingest.commit)
+    except CsvUploadError as e:
+        ingest.abort()
+        raise HTTPException(status_code=400, detail=f"Invalid CSV: {e}")
+    except BaseException:
+        # Write errors, a client disconnect, cancellation: no column files left behind
+        ingest.abort()
+        raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
         
     # Update device config
     await db.execute("UPDATE devices SET mode='CSV_PLAYBACK', csv_file_path=? WHERE uuid=?", (file_path, device_uuid))
     await db.commit()
+    await engine.device_changed(device_uuid)
+    hub.publish("device", {"action": "changed", "uuid": device_uuid})
     
-    return {"message": "CSV uploaded and device updated", "file_path": file_path}
+    return {"message": "CSV uploaded and device updated", "file_path": file_path,
+            "rows": ingest.rows, "columns": ingest.headers}
+
+def _store_chunk(buffer, ingest: CsvIngest, chunk: bytes):
+    buffer.write(chunk)
+    ingest.feed(chunk)
 
 @router.post("/devices/{device_uuid}/start")
-async def start_device(device_uuid: str, db: aiosqlite.Connection = Depends(get_db)):
-    cursor = await db.execute("UPDATE devices SET status='RUNNING' WHERE uuid=?", (device_uuid,))
-    await db.commit()
-    if cursor.rowcount == 0:
+async def start_device(device_uuid: str):
+    # Concurrent start/stop calls are committed together
+    if not await database.set_device_status(device_uuid, 'RUNNING'):
         raise HTTPException(status_code=404, detail="Device not found")
+    await engine.device_changed(device_uuid)
+    hub.publish("device", {"action": "status", "uuid": device_uuid, "status": "RUNNING"})
     return {"status": "RUNNING"}
 
 @router.post("/devices/{device_uuid}/stop")
-async def stop_device(device_uuid: str, db: aiosqlite.Connection = Depends(get_db)):
-    cursor = await db.execute("UPDATE devices SET status='STOPPED' WHERE uuid=?", (device_uuid,))
-    await db.commit()
-    if cursor.rowcount == 0:
+async def stop_device(device_uuid: str):
+    if not await database.set_device_status(device_uuid, 'STOPPED'):
         raise HTTPException(status_code=404, detail="Device not found")
+    await engine.device_changed(device_uuid)
+    hub.publish("device", {"action": "status", "uuid": device_uuid, "status": "STOPPED"})
     return {"status": "STOPPED"}
 
 @router.post("/devices/start-all")
 async def start_all_devices(db: aiosqlite.Connection = Depends(get_db)):
     await db.execute("UPDATE devices SET status='RUNNING'")
     await db.commit()
+    await engine.resync()
+    hub.publish("resync", {})
     return {"message": "All devices started"}
 
 @router.post("/devices/stop-all")
 async def stop_all_devices(db: aiosqlite.Connection = Depends(get_db)):
     await db.execute("UPDATE devices SET status='STOPPED'")
     await db.commit()
+    await engine.resync()
+    hub.publish("resync", {})
     return {"message": "All devices stopped"}
 
 @router.post("/mqtt/publish")
@@ -210,18 +420,83 @@ async def unsubscribe_mqtt(request: MqttSubscribeRequest):
 
 @router.get("/mqtt/listener-messages")
 async def get_listener_messages():
-    return engine.manual_received_messages
+    return list(engine.manual_received_messages)
 
 @router.delete("/mqtt/listener-messages")
 async def clear_listener_messages():
     engine.manual_received_messages.clear()
+    hub.publish("listener_cleared", {})
     return {"message": "Listener messages cleared"}
 
+@router.get("/messages")
+async def query_messages(
+    device: Optional[str] = None,
+    topic: Optional[str] = Query(None, description="MQTT topic filter, wildcards allowed"),
+    since: Optional[float] = Query(None, description="Epoch seconds"),
+    until: Optional[float] = Query(None, description="Epoch seconds"),
+    limit: int = Query(100, ge=1, le=10000),
+    spilled: bool = Query(False, description="Also search messages evicted to the spill file"),
+    source: Literal["devices", "listener"] = "devices",
+):
+    """Received-message history, newest first"""
+    if source == "listener":
+        return engine.manual_received_messages.query(topic, since, until, limit)
+    messages = await engine.query_messages(key=device, topic=topic, since=since, until=until, limit=limit, spilled=spilled)
+    # Keyed by device UUID in the store
+    return [{"uuid": m.pop("key"), **m} for m in messages]
+
+@router.get("/events")
+async def events():
+    """Server-sent events: device deltas, received messages and throttled stats"""
+    subscriber = hub.subscribe()
+    return StreamingResponse(hub.stream(subscriber), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/load-profiles")
+async def list_load_profiles():
+    """Running load profiles with their current target and achieved rates"""
+    return (await engine.get_stats())["load_profiles"]
+
+@router.post("/load-profiles")
+async def set_load_profile(profile: LoadProfile):
+    """Start a load profile now (replacing a running one of the same name)"""
+    await engine.set_load_profile(profile.model_dump())
+    logger.info(f"Load profile {profile.name} started ({len(profile.phases)} phases)")
+    return {"message": f"Load profile {profile.name} started"}
+
+@router.delete("/load-profiles/{name}")
+async def clear_load_profile(name: str):
+    if not await engine.clear_load_profile(name):
+        raise HTTPException(status_code=404, detail="Load profile not found")
+    return {"message": f"Load profile {name} stopped"}
+
+@router.post("/synthetic")
+async def start_synthetic(config: SyntheticLoadConfig):
+    """Publish config.rate msgs/s from in-memory virtual devices, independent of the devices table"""
+    for template in (config.topic, config.name):
+        try:
+            template.format(n=0)
+        except (KeyError, IndexError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid pattern {template!r}: {e!r}")
+    await engine.start_synthetic(config.model_dump())
+    return {"message": "Synthetic load started"}
+
+@router.get("/synthetic")
+async def synthetic_status():
+    """Target vs. achieved rate, publish latency percentiles and CPU use of the synthetic run"""
+    status = (await engine.get_stats())["synthetic"]
+    if status is None:
+        raise HTTPException(status_code=404, detail="No synthetic load has been started")
+    return status
+
+@router.delete("/synthetic")
+async def stop_synthetic():
+    await engine.stop_synthetic()
+    return {"message": "Synthetic load stopped"}
+
 @router.get("/stats")
 async def get_stats():
-    return {
-        "mqtt_connected": engine.is_mqtt_connected,
-        "total_devices": len(engine.active_devices),
-        "running_devices": sum(1 for d in engine.active_devices.values() if d.get('status') == 'RUNNING')
-    }
+    stats = await engine.get_stats()
+    stats["high_res_timing"] = HIGH_RES_TIMING
+    return stats
 
@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Response
+from app.engine import engine
+from app.metrics import PrometheusText
+
+router = APIRouter()
+
+PREFIX = "iot_simulator"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# stats["timing"] key -> (metric name, help)
+TIMING_METRICS = {
+    "tick_duration": ("tick_duration_seconds", "Work time of one tick loop pass"),
+    "tick_lateness": ("tick_lateness_seconds", "How late the tick loop woke up (event loop lag)"),
+    "serialize": ("serialize_seconds", "Time building and encoding one device payload"),
+    "sync_duration": ("sync_duration_seconds", "Duration of a full DB sync"),
+}
+
+def render(stats) -> str:
+    """Prometheus exposition of engine stats (already merged over workers)"""
+    out = PrometheusText()
+    out.gauge(f"{PREFIX}_mqtt_connected", "Primary MQTT connection is up", stats["mqtt_connected"])
+    out.gauge(f"{PREFIX}_devices", "Devices in the database", stats["total_devices"])
+    out.gauge(f"{PREFIX}_running_devices", "Devices being simulated", stats["running_devices"])
+
+    published = {mode: dict(counts) for mode, counts in stats["published_by_mode"].items()}
+    if stats["synthetic"]:
+        published["SYNTHETIC"] = {"messages": stats["synthetic"]["sent"], "bytes": stats["synthetic"]["bytes"]}
+    for mode, counts in published.items():
+        out.counter(f"{PREFIX}_messages_published_total", "Messages handed to MQTT", counts["messages"], {"mode": mode})
+    for mode, counts in published.items():
+        out.counter(f"{PREFIX}_published_bytes_total", "Payload bytes handed to MQTT", counts["bytes"], {"mode": mode})
+    out.counter(f"{PREFIX}_publish_errors_total", "Publishes that raised or were refused by the client", stats["publish_errors"])
+
+    out.histogram(f"{PREFIX}_publish_lateness_seconds", "Delay between a device's deadline and its publish", stats["publish_lateness"])
+    for key, (name, help_text) in TIMING_METRICS.items():
+        out.histogram(f"{PREFIX}_{name}", help_text, stats["timing"][key])
+
+    out.gauge(f"{PREFIX}_mqtt_outgoing_queue", "Packets waiting in paho outgoing queues", stats["mqtt_queue"]["queued"])
+    out.gauge(f"{PREFIX}_mqtt_outgoing_queue_max", "Longest outgoing queue of a single connection", stats["mqtt_queue"]["max"])
+    out.gauge(f"{PREFIX}_qos_inflight", "QoS 1/2 publishes awaiting acknowledgement", stats["qos"]["inflight"])
+    out.histogram(f"{PREFIX}_qos_ack_latency_seconds", "Time from QoS 1/2 publish to acknowledgement", stats["qos"]["ack_latency"])
+
+    inbound = stats["inbound"]
+    out.counter(f"{PREFIX}_inbound_received_total", "MQTT messages received", inbound["received"])
+    out.counter(f"{PREFIX}_inbound_dropped_total", "Received messages dropped by a full inbound queue", inbound["dropped"])
+    out.gauge(f"{PREFIX}_inbound_queued", "Received messages waiting to be processed", inbound["queued"])
+    out.histogram(f"{PREFIX}_command_latency_seconds", "Time from receiving a command to a rule reacting", stats["rules"]["latency"])
+    return out.render()
+
+@router.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(render(await engine.get_stats()), media_type=CONTENT_TYPE)
@@ -0,0 +1,119 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+# File layout: MAGIC | u32 meta length | meta JSON | per column: i64 value ends (rows + 1) | UTF-8 values.
+# Meta holds headers, row count, byte order and the (rare) None cells of padded short rows.
+MAGIC = b"IOTCOL01"
+SUFFIX = ".cols"
+
+def columnar_path(csv_path: str) -> str:
+    """Where the converted copy of a CSV file lives"""
+    return csv_path + SUFFIX
+
+
+class ColumnarWriter:
+    """Streams rows into the columnar format; each column's values spill to a temp file until finish()"""
+
+    def __init__(self, path: str, headers: List[str]):
+        self.path = path
+        self.headers = headers
+        self.rows = 0
+        self._ends = [array('q', [0]) for _ in headers]
+        self._nulls: Dict[int, List[int]] = {}
+        self._blobs = [open(f"{path}.{i}.tmp", "wb") for i in range(len(headers))]
+
+    def add_row(self, row: List[Optional[str]]):
+        for i, (value, blob, ends) in enumerate(zip(row, self._blobs, self._ends)):
+            if value is None:
+                self._nulls.setdefault(i, []).append(self.rows)
+                ends.append(ends[-1])
+                continue
+            data = value.encode()
+            blob.write(data)
+            ends.append(ends[-1] + len(data))
+        self.rows += 1
+
+    def finish(self):
+        meta = json.dumps({
+            "headers": self.headers,
+            "rows": self.rows,
+            "byteorder": sys.byteorder,
+            "nulls": self._nulls,
+        }).encode()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as out:
+            out.write(MAGIC)
+            out.write(struct.pack("<I", len(meta)))
+            out.write(meta)
+            for blob, ends in zip(self._blobs, self._ends):
+                blob.close()
+                out.write(ends.tobytes())
+                with open(blob.name, "rb") as f:
+                    while chunk := f.read(1 << 20):
+                        out.write(chunk)
+        os.replace(tmp_path, self.path)
+        self._cleanup()
+
+    def abort(self):
+        for blob in self._blobs:
+            blob.close()
+        self._cleanup()
+
+    def _cleanup(self):
+        for blob in self._blobs:
+            if os.path.exists(blob.name):
+                os.remove(blob.name)
+
+
+class BinaryColumn:
+    """One column of a memory-mapped columnar file; values are decoded on access"""
+
+    def __init__(self, buf: mmap.mmap, ends: array, start: int, nulls: List[int]):
+        self._buf = buf
+        self._ends = ends
+        self._start = start
+        self._nulls = set(nulls)
+
+    def __len__(self) -> int:
+        return len(self._ends) - 1
+
+    def __getitem__(self, index: int) -> Optional[str]:
+        if self._nulls and index in self._nulls:
+            return None
+        ends = self._ends
+        return self._buf[self._start + ends[index]:self._start + ends[index + 1]].decode()
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+def read_columnar(path: str) -> Tuple[List[str], List[BinaryColumn], int, mmap.mmap]:
+    """Map a columnar file: (headers, columns, row count, mmap to close when done)"""
+    with open(path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buf[:len(MAGIC)] != MAGIC:
+        buf.close()
+        raise ValueError(f"{path} is not a columnar dataset")
+    pos = len(MAGIC)
+    (meta_len,) = struct.unpack_from("<I", buf, pos)
+    pos += 4
+    meta = json.loads(buf[pos:pos + meta_len])
+    pos += meta_len
+
+    rows = meta["rows"]
+    columns = []
+    for i in range(len(meta["headers"])):
+        ends = array('q')
+        ends.frombytes(buf[pos:pos + (rows + 1) * ends.itemsize])
+        if meta["byteorder"] != sys.byteorder:
+            ends.byteswap()
+        pos += (rows + 1) * ends.itemsize
+        columns.append(BinaryColumn(buf, ends, pos, meta["nulls"].get(str(i), [])))
+        pos += ends[-1]
+    return meta["headers"], columns, rows, buf
@@ -1,16 +1,176 @@
 import aiosqlite
+import asyncio
+import logging
 import os
+from contextlib import asynccontextmanager
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
 DB_PATH = "data/simulator.db"
+# Connections kept open for API requests
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 4))
+# Per-connection tuning: WAL lets readers run alongside the writer; NORMAL sync is durable in WAL mode
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",  # ~16 MB page cache
+    "PRAGMA mmap_size=268435456",  # 256 MB
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+# Prepared statements sqlite3 keeps per connection
+CACHED_STATEMENTS = 256
 
-async def get_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+async def open_connection() -> aiosqlite.Connection:
+    """A tuned connection to DB_PATH; the caller closes it"""
+    db = await aiosqlite.connect(DB_PATH, cached_statements=CACHED_STATEMENTS)
+    db.row_factory = aiosqlite.Row
+    for pragma in PRAGMAS:
+        await db.execute(pragma)
+    return db
+
+@asynccontextmanager
+async def connect():
+    """A short-lived tuned connection (for callers outside the request pool)"""
+    db = await open_connection()
+    try:
         yield db
+    finally:
+        await db.close()
+
+
+class ConnectionPool:
+    """Long-lived connections shared by API requests, one request at a time each"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._connections: List[aiosqlite.Connection] = []
+
+    async def open(self):
+        for _ in range(self.size):
+            db = await open_connection()
+            self._connections.append(db)
+            self._idle.put_nowait(db)
+
+    async def close(self):
+        for db in self._connections:
+            await db.close()
+        self._connections.clear()
+
+    @asynccontextmanager
+    async def acquire(self):
+        db = await self._idle.get()
+        try:
+            yield db
+        finally:
+            # Never hand the next request someone else's half-finished transaction
+            if db.in_transaction:
+                await db.rollback()
+            self._idle.put_nowait(db)
+
+
+class StatusWriter:
+    """Group commit for device start/stop: concurrent updates share one transaction"""
+
+    def __init__(self):
+        self._db: Optional[aiosqlite.Connection] = None
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.updates = 0
+
+    async def open(self):
+        self._db = await open_connection()
+
+    async def close(self):
+        if self._task:
+            await self._task
+        if self._db:
+            await self._db.close()
+            self._db = None
+
+    async def set_status(self, uuid: str, status: str) -> bool:
+        """Queue the update; returns whether the device exists once its batch has committed"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((uuid, status, future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush())
+        return await future
+
+    async def _flush(self):
+        # Let requests arriving in the same loop iteration join the batch
+        await asyncio.sleep(0)
+        while self._pending:
+            batch, self._pending = self._pending, []
+            try:
+                found = []
+                for uuid, status, _ in batch:
+                    cursor = await self._db.execute("UPDATE devices SET status=? WHERE uuid=?", (status, uuid))
+                    found.append(cursor.rowcount > 0)
+                await self._db.commit()
+            except Exception as e:
+                logger.error(f"Status batch of {len(batch)} failed: {e}")
+                if self._db.in_transaction:
+                    await self._db.rollback()
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.updates += len(batch)
+            for (_, _, future), exists in zip(batch, found):
+                future.set_result(exists)
+
+
+pool: Optional[ConnectionPool] = None
+status_writer: Optional[StatusWriter] = None
+
+async def open_pool():
+    """App startup: open the request pool and the status writer"""
+    global pool, status_writer
+    pool = ConnectionPool(DB_POOL_SIZE)
+    await pool.open()
+    status_writer = StatusWriter()
+    await status_writer.open()
+    logger.info(f"Opened {DB_POOL_SIZE} pooled SQLite connections to {DB_PATH} (WAL)")
+
+async def close_pool():
+    global pool, status_writer
+    if status_writer:
+        await status_writer.close()
+        status_writer = None
+    if pool:
+        await pool.close()
+        pool = None
+
+async def get_db():
+    if pool is not None:
+        async with pool.acquire() as db:
+            yield db
+    else:
+        async with connect() as db:
+            yield db
+
+async def count_devices() -> int:
+    """Devices in the DB, running or not"""
+    async for db in get_db():
+        cursor = await db.execute("SELECT COUNT(*) FROM devices")
+        (total,) = await cursor.fetchone()
+    return total
+
+async def set_device_status(uuid: str, status: str) -> bool:
+    """Start/stop one device; False if it doesn't exist"""
+    if status_writer is not None:
+        return await status_writer.set_status(uuid, status)
+    async with connect() as db:
+        cursor = await db.execute("UPDATE devices SET status=? WHERE uuid=?", (status, uuid))
+        await db.commit()
+        return cursor.rowcount > 0
 
 async def init_db():
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with connect() as db:
         await db.execute("""
             CREATE TABLE IF NOT EXISTS devices (
                 uuid TEXT PRIMARY KEY,
@@ -23,7 +183,9 @@ async def init_db():
                 qos INTEGER DEFAULT 0,
                 retain INTEGER DEFAULT 0,
                 csv_file_path TEXT,
-                csv_loop INTEGER DEFAULT 1
+                csv_loop INTEGER DEFAULT 1,
+                phase_offset_ms INTEGER,
+                csv_replay_speed REAL
             )
         """)
         await db.execute("""
@@ -36,7 +198,54 @@ async def init_db():
                 max_val REAL,
                 precision INTEGER,
                 string_value TEXT,
+                generator TEXT DEFAULT 'uniform',
+                step REAL,
+                period_s REAL,
+                phase_s REAL,
+                noise REAL,
+                spike_prob REAL,
                 FOREIGN KEY(device_uuid) REFERENCES devices(uuid) ON DELETE CASCADE
             )
         """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS device_rules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                device_uuid TEXT NOT NULL,
+                topic TEXT,
+                field TEXT,
+                equals TEXT,
+                action TEXT NOT NULL,
+                param_name TEXT,
+                value_field TEXT,
+                interval_ms INTEGER,
+                min_val REAL,
+                max_val REAL,
+                reply_topic TEXT,
+                reply_payload TEXT,
+                FOREIGN KEY(device_uuid) REFERENCES devices(uuid) ON DELETE CASCADE
+            )
+        """)
+        # Params and rules are always looked up by device
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_device_params_device_uuid ON device_params(device_uuid)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_device_rules_device_uuid ON device_rules(device_uuid)")
+        await _add_missing_columns(db, "devices", {
+            "phase_offset_ms": "INTEGER",
+            "csv_replay_speed": "REAL",
+        })
+        await _add_missing_columns(db, "device_params", {
+            "generator": "TEXT DEFAULT 'uniform'",
+            "step": "REAL",
+            "period_s": "REAL",
+            "phase_s": "REAL",
+            "noise": "REAL",
+            "spike_prob": "REAL",
+        })
         await db.commit()
+
+async def _add_missing_columns(db, table, columns):
+    """Bring databases created by older versions up to the current schema"""
+    cursor = await db.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in await cursor.fetchall()}
+    for name, definition in columns.items():
+        if name not in existing:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
@@ -0,0 +1,318 @@
+import codecs
+import csv
+import logging
+import os
+import re
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.columnar import ColumnarWriter, columnar_path, read_columnar
+
+logger = logging.getLogger(__name__)
+
+# Column names recognised as the recorded time of each row (case-insensitive)
+TIMESTAMP_COLUMNS = ("timestamp", "time", "ts")
+# Physical lines as the csv module sees them (only CR/LF end a line)
+_LINE = re.compile(r"[^\r\n]*(?:\r\n|\n|\r)|[^\r\n]+$")
+
+def parse_timestamp(value: Optional[str]) -> Optional[float]:
+    """ISO 8601 or epoch-seconds string -> epoch seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.strip()).timestamp()
+    except ValueError:
+        return None
+
+
+class CsvDataset:
+    """A CSV file parsed once into columns; rows are addressed by index.
+
+    Parsing follows csv.DictReader: blank lines are skipped, short rows are
+    padded with None and values beyond the header are ignored. A file that was
+    converted at upload time is memory-mapped from its columnar copy instead.
+    """
+
+    def __init__(self, file_path: str, headers: List[str], columns: List[Sequence[Optional[str]]], row_count: int,
+                 signature: Tuple = (), buffer=None):
+        self.file_path = file_path
+        self.headers = headers
+        self.columns = columns
+        self.row_count = row_count
+        self.signature = signature # Source file and its (mtime_ns, size) when loaded
+        self._buffer = buffer # mmap backing columnar datasets
+        self._offsets: Optional[List[float]] = None
+
+    @staticmethod
+    def source_of(file_path: str) -> Tuple:
+        """The file to load (the columnar copy if it is up to date) and its signature"""
+        st = os.stat(file_path)
+        converted = columnar_path(file_path)
+        try:
+            cst = os.stat(converted)
+            if cst.st_mtime_ns >= st.st_mtime_ns:
+                return (converted, cst.st_mtime_ns, cst.st_size)
+        except FileNotFoundError:
+            pass
+        return (file_path, st.st_mtime_ns, st.st_size)
+
+    @classmethod
+    def open(cls, file_path: str) -> "CsvDataset":
+        signature = cls.source_of(file_path)
+        if signature[0] == file_path:
+            return cls.load(file_path)
+        headers, columns, rows, buffer = read_columnar(signature[0])
+        return cls(file_path, headers, columns, rows, signature, buffer)
+
+    @classmethod
+    def load(cls, file_path: str) -> "CsvDataset":
+        st = os.stat(file_path)
+        with open(file_path, 'r', newline='') as f:
+            reader = csv.reader(f)
+            headers = next(reader, None) or []
+            width = len(headers)
+            columns: List[List[Optional[str]]] = [[] for _ in range(width)]
+            row_count = 0
+            for row in reader:
+                if not row:
+                    continue
+                if len(row) < width:
+                    row = row + [None] * (width - len(row))
+                for column, value in zip(columns, row):
+                    column.append(value)
+                row_count += 1
+        return cls(file_path, headers, columns, row_count, (file_path, st.st_mtime_ns, st.st_size))
+
+    def close(self):
+        if self._buffer is not None:
+            self._buffer.close()
+            self._buffer = None
+
+    def __len__(self) -> int:
+        return self.row_count
+
+    def row(self, index: int) -> Dict[str, Optional[str]]:
+        return {header: column[index] for header, column in zip(self.headers, self.columns)}
+
+    def timestamp_column(self) -> Optional[int]:
+        lowered = [h.strip().lower() for h in self.headers]
+        for name in TIMESTAMP_COLUMNS:
+            if name in lowered:
+                return lowered.index(name)
+        return None
+
+    def offsets(self) -> Optional[List[float]]:
+        """Seconds from the first row to each row's recorded time, or None without a timestamp column.
+
+        Unparseable or out-of-order timestamps reuse the previous row's offset,
+        so the replay timeline never runs backwards.
+        """
+        if self._offsets is None:
+            index = self.timestamp_column()
+            if index is None:
+                return None
+            offsets = []
+            start = None
+            last = 0.0
+            for value in self.columns[index]:
+                ts = parse_timestamp(value)
+                if ts is not None and start is None:
+                    start = ts
+                if ts is not None and ts - start > last:
+                    last = ts - start
+                offsets.append(last)
+            self._offsets = offsets
+        return self._offsets
+
+
+class DatasetCache:
+    """One parsed CsvDataset per file, shared by every device replaying it.
+
+    Datasets are reference counted: the last release() drops the parsed copy.
+    A file rewritten on disk (e.g. a re-upload) is parsed again on the next
+    acquire(); cursors already holding the old copy keep it until released,
+    so counts are kept per dataset, not per path.
+    """
+
+    def __init__(self):
+        self._datasets: Dict[str, CsvDataset] = {}
+        self._refs: Dict[int, int] = {} # id(dataset) -> holders
+        self._lock = threading.Lock()
+
+    def acquire(self, file_path: str) -> CsvDataset:
+        path = os.path.abspath(file_path)
+        signature = CsvDataset.source_of(path)
+        with self._lock:
+            dataset = self._datasets.get(path)
+            if dataset is None or dataset.signature != signature:
+                dataset = CsvDataset.open(path)
+                self._datasets[path] = dataset
+                logger.info(f"Loaded CSV dataset {file_path}: {len(dataset)} rows x {len(dataset.headers)} columns")
+            self._refs[id(dataset)] = self._refs.get(id(dataset), 0) + 1
+            return dataset
+
+    def release(self, dataset: CsvDataset):
+        path = dataset.file_path
+        with self._lock:
+            refs = self._refs.get(id(dataset), 0) - 1
+            if refs > 0:
+                self._refs[id(dataset)] = refs
+                return
+            self._refs.pop(id(dataset), None)
+            # A newer copy of the file may have replaced this one in the cache
+            if self._datasets.get(path) is dataset:
+                del self._datasets[path]
+            dataset.close()
+
+    def __contains__(self, file_path: str) -> bool:
+        return os.path.abspath(file_path) in self._datasets
+
+    def __len__(self) -> int:
+        return len(self._datasets)
+
+
+datasets = DatasetCache()
+
+
+class CsvUploadError(ValueError):
+    """The uploaded file is not a usable CSV dataset"""
+
+
+class _Starved(Exception):
+    """Raised through csv.reader when a record continues past the text received so far"""
+
+
+class _LineFeed:
+    """Line iterator csv.reader pulls from as upload chunks arrive.
+
+    Running dry mid-upload raises _Starved instead of ending the input, and the
+    lines handed out for the interrupted record are kept so it can be parsed
+    again once more text is in.
+    """
+
+    def __init__(self):
+        self.lines = deque()
+        self.taken: List[str] = [] # Lines of the record being parsed
+        self.final = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if self.lines:
+            line = self.lines.popleft()
+            self.taken.append(line)
+            return line
+        if self.final and not self.taken:
+            raise StopIteration
+        # More text is coming, or (at the end) a quoted field was never closed
+        raise _Starved()
+
+    def rewind(self):
+        self.lines.extendleft(reversed(self.taken))
+        self.taken = []
+
+
+class CsvIngest:
+    """Validates a CSV upload chunk by chunk and writes its columnar copy as it goes.
+
+    Bytes may be split anywhere, including inside a multi-byte character or a
+    quoted field spanning lines. Blank lines are skipped and short rows padded
+    as in CsvDataset.load; an empty or duplicate header, a row with more
+    fields than the header or non-UTF-8 data is rejected.
+    """
+
+    def __init__(self, csv_path: str):
+        self.csv_path = csv_path
+        self.headers: Optional[List[str]] = None
+        self.rows = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._pending = "" # Text after the last complete line
+        self._lines = _LineFeed()
+        # One reader for the whole upload, so records are split exactly as CsvDataset.load splits them
+        self._reader = csv.reader(self._lines)
+        self._writer: Optional[ColumnarWriter] = None
+
+    def feed(self, chunk: bytes):
+        try:
+            text = self._pending + self._decoder.decode(chunk)
+        except UnicodeDecodeError as e:
+            raise CsvUploadError(f"File is not UTF-8 text: {e.reason}")
+        lines = _LINE.findall(text)
+        # Hold back a partial line, and a CR that may be the first half of a CRLF
+        if lines and (not lines[-1].endswith(("\n", "\r")) or text.endswith("\r")):
+            self._pending = lines.pop()
+        else:
+            self._pending = ""
+        self._lines.lines.extend(lines)
+        self._parse()
+
+    def finish(self):
+        """Flush and validate the last record"""
+        tail = self._pending + self._decoder.decode(b"", final=True)
+        self._pending = ""
+        if tail:
+            self._lines.lines.append(tail)
+        self._lines.final = True
+        self._parse()
+        if self.headers is None:
+            raise CsvUploadError("File is empty")
+        if not self.rows:
+            self.abort()
+            raise CsvUploadError("File has a header but no data rows")
+
+    def commit(self):
+        """Publish the columnar copy; call once the CSV itself is in place so the copy is the newer file"""
+        self._writer.finish()
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.abort()
+
+    def _parse(self):
+        """Take every complete record out of the received lines"""
+        lines = self._lines
+        while True:
+            lines.taken = []
+            try:
+                row = next(self._reader)
+            except StopIteration:
+                return
+            except _Starved:
+                lines.rewind()
+                if lines.final:
+                    self.abort()
+                    raise CsvUploadError("Unterminated quoted field at end of file")
+                return
+            except csv.Error as e:
+                self.abort()
+                raise CsvUploadError(f"Malformed CSV near row {self.rows + 1}: {e}")
+            if not row:
+                continue
+            if self.headers is None:
+                self._set_headers(row)
+                continue
+            width = len(self.headers)
+            if len(row) > width:
+                self.abort()
+                raise CsvUploadError(f"Row {self.rows + 1} has {len(row)} fields, header has {width}")
+            if len(row) < width:
+                row = row + [None] * (width - len(row))
+            self._writer.add_row(row)
+            self.rows += 1
+
+    def _set_headers(self, headers: List[str]):
+        names = [h.strip() for h in headers]
+        if any(not name for name in names):
+            raise CsvUploadError("Header has an empty column name")
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise CsvUploadError(f"Duplicate column names: {', '.join(duplicates)}")
+        self.headers = headers
+        self._writer = ColumnarWriter(columnar_path(self.csv_path), headers)
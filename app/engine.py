@@ -1,15 +1,31 @@
 import asyncio
 import time
 from datetime import datetime, timezone
+from contextlib import asynccontextmanager
 import json
-import random
 import logging
-import csv
 import os
+import zlib
 import paho.mqtt.client as mqtt
+from app import database
 from app.database import get_db, DB_PATH
+from app.scheduler import DeviceScheduler
+from app.metrics import Histogram, DURATION_BUCKETS, SERIALIZE_BUCKETS
+from app.workers import WorkerPool, shard_of
+from app.payloads import BatchPayloadGenerator, generate_values
+from app.encoders import PayloadEncoder, resolve_backend
+from app.mqtt_pool import MqttConnectionPool, parse_pool_size
+from app.transport import MqttTransport, make_transport
+from app.datasets import CsvDataset, datasets
+from app.events import hub
+from app.topics import TopicTrie
+from app.messages import MessageRing, MessageStore
+from app.inbound import InboundPipeline
+from app.rules import RuleSet
+from app.profiles import ProfileRunner
+from app.synthetic import SyntheticLoad
 import aiosqlite
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,286 +36,1005 @@ MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
 MQTT_USERNAME = os.getenv("MQTT_USERNAME", "backend_service")
 MQTT_PASSWORD = os.getenv("MQTT_PASSWORD", "secure_password")
 
+# Device publish connections: 1 = share the primary client, N = pool of N, "per-device"
+MQTT_POOL_SIZE = parse_pool_size(os.getenv("MQTT_POOL_SIZE", "1"))
+MQTT_CLIENT_ID_PREFIX = os.getenv("MQTT_CLIENT_ID_PREFIX", "iot-simulator")
+MQTT_RECONNECT_MAX_S = float(os.getenv("MQTT_RECONNECT_MAX_S", 60))
+# asyncio: paho driven by the event loop (no network thread); thread: paho loop_start()
+MQTT_TRANSPORT = os.getenv("MQTT_TRANSPORT", "asyncio")
+# Publishers wait once this many packets are queued on a connection
+MQTT_MAX_QUEUED = int(os.getenv("MQTT_MAX_QUEUED", 10000))
+# QoS 1/2 publishes awaiting acknowledgement per connection
+MQTT_INFLIGHT_WINDOW = int(os.getenv("MQTT_INFLIGHT_WINDOW", 100))
+# Full in-flight window: "defer" retries shortly (same phase grid), "skip" drops the publish
+QOS_BACKPRESSURE_POLICY = os.getenv("QOS_BACKPRESSURE_POLICY", "defer")
+QOS_DEFER_S = float(os.getenv("QOS_DEFER_MS", 10)) / 1000.0
+# Most CSV rows one device publishes per tick when timestamped replay bursts or catches up
+CSV_REPLAY_BATCH = int(os.getenv("CSV_REPLAY_BATCH", 1000))
+
+# Received-message history: messages kept per device, bytes per device and in total,
+# and an optional NDJSON file that evicted messages are appended to
+MESSAGE_HISTORY_DEPTH = int(os.getenv("MESSAGE_HISTORY_DEPTH", 100))
+MESSAGE_DEVICE_BUDGET_BYTES = int(os.getenv("MESSAGE_DEVICE_BUDGET_KB", 256)) * 1024
+MESSAGE_GLOBAL_BUDGET_BYTES = int(os.getenv("MESSAGE_GLOBAL_BUDGET_MB", 64)) * 1024 * 1024
+MESSAGE_SPILL_PATH = os.getenv("MESSAGE_SPILL_PATH") or None
+LISTENER_HISTORY_DEPTH = int(os.getenv("LISTENER_HISTORY_DEPTH", 50))
+# Newest messages shown with each device in listings
+MESSAGE_PREVIEW = 5
+# Received messages waiting to be processed (the oldest are dropped beyond this), and per batch
+INBOUND_QUEUE_SIZE = int(os.getenv("INBOUND_QUEUE_SIZE", 10000))
+INBOUND_BATCH_SIZE = int(os.getenv("INBOUND_BATCH_SIZE", 500))
+
+# High-resolution timing: sleep to the next absolute deadline instead of a fixed
+# 100ms cycle, allowing intervals down to 1ms
+HIGH_RES_TIMING = os.getenv("HIGH_RES_TIMING", "false").lower() in ("1", "true", "yes")
+# Below this remaining delay the loop yields instead of sleeping (timer resolution)
+HIGH_RES_SPIN_S = 0.001
+
+# Payload serializer: template (precompiled, default), orjson, or json (plain dict + json.dumps)
+PAYLOAD_ENCODER = resolve_backend(os.getenv("PAYLOAD_ENCODER", "template"))
+
+# Full DB consistency check period; API changes are pushed to the engine immediately
+SYNC_INTERVAL_S = float(os.getenv("SYNC_INTERVAL_S", 60))
+
+# Number of worker processes sharing the running devices (1 = run in-process)
+ENGINE_WORKERS = int(os.getenv("ENGINE_WORKERS", 1))
+
+# Trie subscriber standing for the manual topic listener
+MANUAL_LISTENER = object()
+
 class CsvPlayer:
-    def __init__(self, file_path, loop=True):
+    """Per-device cursor over a shared, pre-parsed CSV dataset.
+
+    With a replay speed the player follows the file's timestamp column instead
+    of the device interval: each row comes due at its recorded offset from the
+    first row divided by speed (0 = as fast as possible).
+    """
+
+    def __init__(self, file_path, loop=True, speed=None, loop_gap_s=1.0):
         self.file_path = file_path
         self.loop = loop
-        self.file = open(file_path, 'r')
-        self.reader = csv.DictReader(self.file)
-        self.headers = self.reader.fieldnames
-    
+        self.speed = speed
+        self.dataset = datasets.acquire(file_path)
+        self.headers = self.dataset.headers
+        self.position = 0
+        self.offsets = self.dataset.offsets() if speed is not None else None
+        if speed is not None and self.offsets is None:
+            logger.warning(f"{file_path} has no timestamp column; replaying one row per interval")
+        # Pause between the last row and the first one again (average row spacing)
+        self.loop_gap_s = loop_gap_s
+        if self.offsets and len(self.offsets) > 1 and self.offsets[-1] > 0:
+            self.loop_gap_s = self.offsets[-1] / (len(self.offsets) - 1)
+        self.epoch = None # Monotonic time of the first row in the current pass
+        self.lag = 0.0 # Seconds the last replayed batch was behind its timeline
+        self.rows_replayed = 0
+        self._held: List[Dict] = [] # Due rows handed back unpublished, replayed first
+
+    @property
+    def timestamped(self) -> bool:
+        return bool(self.offsets)
+
     def next_row(self):
-        try:
-            row = next(self.reader)
-            return row
-        except StopIteration:
-            if self.loop:
-                self.file.seek(0)
-                # Skip header
-                next(self.file) 
-                # Re-create reader or just continue? CSV reader wrapper might need reset
-                # Simplest: Close and reopen or seek 0 and consume header
-                self.file.seek(0)
-                self.reader = csv.DictReader(self.file)
-                try:
-                    return next(self.reader)
-                except StopIteration:
-                    return None # Empty file
-            else:
+        dataset = self.dataset
+        if dataset is None:
+            return None
+        if self.position >= len(dataset):
+            if not self.loop or not len(dataset):
+                return None # End of file (or empty file)
+            self.position = 0
+        row = dataset.row(self.position)
+        self.position += 1
+        return row
+
+    def _wrap(self):
+        if self.speed:
+            self.epoch += (self.offsets[-1] + self.loop_gap_s) / self.speed
+        self.position = 0
+
+    def due_rows(self, now: float, limit: int) -> List[Dict]:
+        """Timestamp replay: every row whose replay time has passed, at most limit per call"""
+        if self.epoch is None:
+            self.epoch = now
+        rows = self._held[:limit]
+        del self._held[:limit]
+        lag = self.lag if rows else 0.0
+        count = len(self.dataset)
+        while len(rows) < limit:
+            if self.position >= count:
+                if not self.loop:
+                    break
+                self._wrap()
+            if self.speed:
+                due = self.epoch + self.offsets[self.position] / self.speed
+                if due > now:
+                    break
+                lag = max(lag, now - due)
+            rows.append(self.dataset.row(self.position))
+            self.position += 1
+        self.lag = lag
+        self.rows_replayed += len(rows)
+        return rows
+
+    def hold(self, rows: List[Dict]):
+        """Give back due rows that couldn't be published; the next due_rows() returns them first"""
+        self._held[:0] = rows
+        self.rows_replayed -= len(rows)
+
+    def next_due(self, now: float) -> Optional[float]:
+        """When the next row comes due; None once a non-looping replay has finished"""
+        if self._held:
+            return now
+        if self.position >= len(self.dataset):
+            if not self.loop:
                 return None
+            if not self.speed:
+                return now
+            return self.epoch + (self.offsets[-1] + self.loop_gap_s) / self.speed
+        if not self.speed:
+            return now
+        return self.epoch + self.offsets[self.position] / self.speed
 
     def close(self):
-        if self.file:
-            self.file.close()
+        if self.dataset is not None:
+            datasets.release(self.dataset)
+            self.dataset = None
 
 class SimulationEngine:
-    def __init__(self):
+    def __init__(self, shard_index: int = 0, shard_count: int = 1):
         self.running = False
-        self.mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-        self.mqtt_client.on_message = self.on_message
-        self.mqtt_client.on_connect = self.on_connect
+        # Sharding: a worker engine only simulates devices hashed to its shard
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.worker_pool: WorkerPool | None = None
+        self.transport = self._new_transport("")
+        self.transport.on_message = self.on_message
+        self.transport.on_message_threadsafe = True # Only enqueues; see InboundPipeline
+        self.transport.on_connect = self.on_connect
+        # Extra publish connections (pooled or per device); subscriptions stay on the primary transport
+        self.pool = MqttConnectionPool(
+            MQTT_POOL_SIZE, f"{MQTT_CLIENT_ID_PREFIX}-{shard_index}",
+            transport_factory=self._new_transport,
+            reconnect_max_s=MQTT_RECONNECT_MAX_S,
+        )
         
         # Caches
         self.active_devices: Dict[str, Dict] = {} # UUID -> Device Dict
         self.device_params: Dict[str, List[Dict]] = {} # UUID -> List of Params
         self.csv_players: Dict[str, CsvPlayer] = {} # UUID -> CsvPlayer instance
-        self.last_publish_times: Dict[str, float] = {} # UUID -> timestamp
+        self.scheduler = DeviceScheduler() # Next publish deadline per device
+        self.publish_lateness = Histogram() # Seconds between deadline and actual publish
+        self.messages_published = 0
+        self.publish_errors = 0
+        self.published_by_mode: Dict[str, Dict[str, int]] = {} # Mode -> {"messages", "bytes"}
+        self.tick_duration = Histogram(DURATION_BUCKETS) # Seconds of work per tick loop pass
+        self.tick_lateness = Histogram() # Seconds the tick loop woke up after it meant to
+        self.serialize_time = Histogram(SERIALIZE_BUCKETS) # Seconds building and encoding one payload
+        self.sync_duration = Histogram(DURATION_BUCKETS) # Seconds per full DB sync
+        self._wake_at: Optional[float] = None
         self.device_sequences: Dict[str, int] = {} # UUID -> incremental sequence
+        self.payload_generator = BatchPayloadGenerator()
+        self.encoders: Dict[str, PayloadEncoder] = {} # UUID -> compiled payload encoder
+        self.device_rules: Dict[str, RuleSet] = {} # UUID -> compiled command rules (listening devices)
+        self.rule_overrides: Dict[str, Dict] = {} # UUID -> device fields changed by rules, until the device is edited
+        self.command_latency = Histogram() # Seconds from receiving a command to having reacted
+        self.rule_counts = {"matched": 0, "replies": 0, "interval_changes": 0, "range_changes": 0}
+        self.load_profiles: Dict[str, ProfileRunner] = {} # Name -> running profile; the first that covers a device applies
+        self._profile_of: Dict[str, Optional[ProfileRunner]] = {} # UUID -> profile limiting it (cached)
+        self.synthetic: SyntheticLoad | None = None # Target-throughput run with virtual devices
         
         # Listening
         self.topic_map: Dict[str, List[str]] = {} # Topic -> List of UUIDs
-        self.received_messages: Dict[str, List[Dict]] = {} # UUID -> List of messages
+        self.subscriptions = TopicTrie() # Filter -> device UUIDs / MANUAL_LISTENER, for inbound routing
+        self._sync_lock = asyncio.Lock() # Serializes full syncs and API change events
+        self._db: aiosqlite.Connection | None = None # Own connection, used under _sync_lock
+        self.received_messages = MessageStore( # UUID -> recent messages, kept after the device stops
+            MESSAGE_HISTORY_DEPTH, MESSAGE_DEVICE_BUDGET_BYTES, MESSAGE_GLOBAL_BUDGET_BYTES,
+            # Workers spill to one file each
+            spill_path=f"{MESSAGE_SPILL_PATH}.{shard_index}" if MESSAGE_SPILL_PATH and shard_count > 1 else MESSAGE_SPILL_PATH,
+        )
         
         # Manual Listener
         self.manual_topics: set[str] = set()
-        self.manual_received_messages: List[Dict] = []
+        self.manual_received_messages = MessageRing(LISTENER_HISTORY_DEPTH, MESSAGE_DEVICE_BUDGET_BYTES)
+        self.inbound = InboundPipeline(self._process_inbound, INBOUND_QUEUE_SIZE, INBOUND_BATCH_SIZE)
+        self.listener_matches = 0
+
+    @property
+    def mqtt_client(self) -> mqtt.Client:
+        """paho client behind the primary transport"""
+        return self.transport.client
+
+    @mqtt_client.setter
+    def mqtt_client(self, client: mqtt.Client):
+        self.transport.client = client
 
     @property
     def is_mqtt_connected(self) -> bool:
-        return self.mqtt_client.is_connected()
+        return self.transport.is_connected()
 
     def on_connect(self, client, userdata, flags, rc, properties=None):
         if rc == 0:
             logger.info("Connected to MQTT Broker")
             # Re-subscribe to all manual topics
             for topic in self.manual_topics:
-                self.mqtt_client.subscribe(topic)
+                self.transport.subscribe(topic)
                 logger.info(f"Re-subscribed to manual topic: {topic}")
             
             # Re-subscribe to all device topics if any
             for topic in self.topic_map.keys():
-                self.mqtt_client.subscribe(topic)
+                self.transport.subscribe(topic)
                 logger.info(f"Re-subscribed to device topic: {topic}")
         else:
             logger.error(f"MQTT Connection failed with code {rc}")
 
     def start_mqtt(self):
         try:
-            if MQTT_USERNAME and MQTT_PASSWORD:
-                self.mqtt_client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
-            self.mqtt_client.connect(MQTT_HOST, MQTT_PORT, 60)
-            self.mqtt_client.loop_start()
-            logger.info(f"Connected to MQTT Broker at {MQTT_HOST}:{MQTT_PORT}")
+            # Non-blocking; on_connect reports the outcome
+            self.transport.connect()
+            logger.info(f"Connecting to MQTT Broker at {MQTT_HOST}:{MQTT_PORT} ({MQTT_TRANSPORT} transport)")
         except Exception as e:
             logger.error(f"Failed to connect to MQTT: {e}")
 
+    def _new_transport(self, client_id: str) -> MqttTransport:
+        return make_transport(
+            MQTT_TRANSPORT, client_id, MQTT_HOST, MQTT_PORT,
+            username=MQTT_USERNAME, password=MQTT_PASSWORD, max_queued=MQTT_MAX_QUEUED,
+            inflight_window=MQTT_INFLIGHT_WINDOW,
+        )
+
+    def transport_for(self, uuid: str) -> MqttTransport:
+        """Connection a device publishes through"""
+        transport = self.pool.client_for(uuid)
+        return self.transport if transport is None else transport
+
     def on_message(self, client, userdata, msg):
-        try:
-            topic = msg.topic
-            payload = msg.payload.decode()
-            timestamp = int(time.time())
-            
-            logger.debug(f"Received MQTT message on {topic}: {payload}")
-            
-            uuids = self.topic_map.get(topic, [])
-            for uuid in uuids:
-                if uuid not in self.received_messages:
-                    self.received_messages[uuid] = []
-                
-                self.received_messages[uuid].append({
-                    "timestamp": timestamp,
-                    "topic": topic,
-                    "payload": payload
-                })
-                
-                # Keep last 5 messages
-                if len(self.received_messages[uuid]) > 5:
-                    self.received_messages[uuid].pop(0)
-
-            # Manual Listener capture
-            matched = False
-            for sub in self.manual_topics:
-                if mqtt.topic_matches_sub(sub, topic):
-                    matched = True
-                    self.manual_received_messages.append({
-                        "timestamp": timestamp,
+        # Runs on the receiving thread: hand over and return
+        self.inbound.put(msg.topic, msg.payload)
+
+    def _process_inbound(self, batch):
+        """Decode, route and store a batch of received messages (on the event loop)"""
+        routes: Dict[str, set] = {} # Topic -> matched subscribers, bursts often repeat topics
+        for topic, raw, timestamp in batch:
+            try:
+                payload = raw.decode()
+                matched = routes.get(topic)
+                if matched is None:
+                    # Devices and the manual listener share one trie; wildcards included
+                    matched = routes[topic] = self.subscriptions.match(topic)
+
+                for uuid in matched:
+                    message = {
+                        "timestamp": round(timestamp, 3),
                         "topic": topic,
                         "payload": payload
-                    })
-                    break
-            
-            if matched:
-                logger.info(f"Manual Listener match found for topic {topic}")
-                # Keep last 50 manual messages
-                if len(self.manual_received_messages) > 50:
-                    self.manual_received_messages.pop(0)
-                    
-        except Exception as e:
-            logger.error(f"Error processing message: {e}")
+                    }
+                    if uuid is MANUAL_LISTENER:
+                        self.manual_received_messages.append(message)
+                        self.listener_matches += 1
+                        hub.publish("listener", message)
+                        continue
+                    self.received_messages.add(uuid, message)
+                    hub.publish("message", {"uuid": uuid, **message})
+                    rules = self.device_rules.get(uuid)
+                    if rules:
+                        self._react(uuid, rules, topic, payload, timestamp)
+            except Exception as e:
+                logger.error(f"Error processing message on {topic}: {e}")
+
+    def _react(self, uuid: str, rules: RuleSet, topic: str, payload: str, received_at: float):
+        """Run a device's matching rules for one received message, right away"""
+        device = self.active_devices.get(uuid)
+        if device is None:
+            return
+        document, matched = rules.evaluate(topic, payload)
+        if not matched:
+            return
+        self.rule_counts["matched"] += 1
+        iso_now = None
+        for rule in matched:
+            if rule.action == "reply":
+                if iso_now is None:
+                    iso_now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+                reply = rules.reply(rule, topic, payload, document, iso_now)
+                self.transport_for(uuid).publish(rule.reply_topic, reply, qos=device['qos'])
+                self.rule_counts["replies"] += 1
+            elif rule.action == "set_interval":
+                value = rule.value(document)
+                interval_ms = int(value) if value is not None else rule.interval_ms
+                if interval_ms is None or interval_ms < 1:
+                    continue
+                device['interval_ms'] = interval_ms
+                self.rule_overrides.setdefault(uuid, {})['interval_ms'] = interval_ms
+                self.scheduler.schedule(uuid, interval_ms)
+                self.rule_counts["interval_changes"] += 1
+            elif rule.action == "set_range":
+                value = rule.value(document)
+                if value is None and rule.min_val is None:
+                    continue # value_field missing from this payload
+                # Params are cached until the device is edited, so they hold the change
+                for p in self.device_params.get(uuid, []):
+                    if p['param_name'] != rule.param_name:
+                        continue
+                    if value is not None:
+                        half_width = (p['max_val'] - p['min_val']) / 2
+                        p['min_val'], p['max_val'] = value - half_width, value + half_width
+                    else:
+                        p['min_val'], p['max_val'] = rule.min_val, rule.max_val
+                    self.rule_counts["range_changes"] += 1
+        self.command_latency.observe(time.time() - received_at)
+
+    @staticmethod
+    def _relay_events(batch):
+        """Coordinator: republish events that worker engines produced to the SSE clients here"""
+        for event, data in batch:
+            hub.publish(event, data)
+
+    def owns_device(self, uuid: str) -> bool:
+        return self.shard_count == 1 or shard_of(uuid, self.shard_count) == self.shard_index
 
     async def start(self):
         self.running = True
+        self.inbound.start()
         self.start_mqtt()
+        if ENGINE_WORKERS > 1 and self.shard_count == 1:
+            # Coordinator: devices run in worker processes, this client serves manual publish/listen
+            self.worker_pool = WorkerPool(ENGINE_WORKERS, on_events=self._relay_events)
+            self.worker_pool.start(database.DB_PATH)
+            hub.share_listening(self.worker_pool.listening)
+            logger.info(f"Simulation Engine Started with {ENGINE_WORKERS} workers")
+            return
+        self.pool.start()
+        self._db = await database.open_connection()
         asyncio.create_task(self._tick_loop())
         asyncio.create_task(self._sync_devices_loop())
         logger.info("Simulation Engine Started")
 
     async def stop(self):
         self.running = False
-        self.mqtt_client.loop_stop()
-        self.mqtt_client.disconnect()
+        if self.worker_pool:
+            await self.worker_pool.stop()
+            self.worker_pool = None
+            hub.share_listening(None)
+        await self.stop_synthetic()
+        self.pool.stop()
+        self.transport.disconnect()
+        await self.inbound.stop()
+        async with self._sync_lock:
+            if self._db is not None:
+                await self._db.close()
+                self._db = None
         # Close all CSV handles
         for player in self.csv_players.values():
             player.close()
+        self.received_messages.close()
         logger.info("Simulation Engine Stopped")
 
     async def _sync_devices_loop(self):
-        """Periodically sync active devices from DB to Memory"""
+        """Periodic full DB consistency check; API changes arrive as events in between"""
         while self.running:
             try:
-                async with aiosqlite.connect(DB_PATH) as db:
-                    db.row_factory = aiosqlite.Row
-                    cursor = await db.execute("SELECT * FROM devices WHERE status='RUNNING'")
-                    rows = await cursor.fetchall()
-                    
-                    current_active_uuids = set()
-                    new_topic_map = {}
-                    
-                    for row in rows:
-                        device = dict(row)
-                        uuid = device['uuid']
-                        current_active_uuids.add(uuid)
-                        
-                        # Update cache if changed or new
-                        self.active_devices[uuid] = device
-                        
-                        # Handle Subscriptions & Topic Map
-                        sub_topic = device.get('subscribe_topic')
-                        if sub_topic:
-                            if sub_topic not in new_topic_map:
-                                new_topic_map[sub_topic] = []
-                            new_topic_map[sub_topic].append(uuid)
-                            # Subscribe (idempotent in paho)
-                            self.mqtt_client.subscribe(sub_topic)
-                        
-                        # Load Params if Random mode and not cached
-                        if device['mode'] == 'RANDOM' and uuid not in self.device_params:
-                            p_cursor = await db.execute("SELECT * FROM device_params WHERE device_uuid = ?", (uuid,))
-                            p_rows = await p_cursor.fetchall()
-                            self.device_params[uuid] = [dict(p) for p in p_rows]
-                        
-                        # Load CSV Player if CSV mode and not cached
-                        if device['mode'] == 'CSV_PLAYBACK' and uuid not in self.csv_players:
-                            if device['csv_file_path'] and os.path.exists(device['csv_file_path']):
-                                self.csv_players[uuid] = CsvPlayer(device['csv_file_path'], loop=bool(device['csv_loop']))
-
-                    # Replace topic map
-                    self.topic_map = new_topic_map
-
-                    # Cleanup stopped devices
-                    cached_uuids = list(self.active_devices.keys())
-                    for uuid in cached_uuids:
-                        if uuid not in current_active_uuids:
-                            del self.active_devices[uuid]
-                            self.device_params.pop(uuid, None)
-                            self.received_messages.pop(uuid, None) # Clear messages for stopped devices? Or keep? Let's clear for now to save memory
-                            if uuid in self.csv_players:
-                                self.csv_players[uuid].close()
-                                del self.csv_players[uuid]
-
+                await self.sync_devices()
             except Exception as e:
                 logger.error(f"Error syncing devices: {e}")
             
-            await asyncio.sleep(5) # Sync every 5 seconds
+            await asyncio.sleep(SYNC_INTERVAL_S)
+
+    @asynccontextmanager
+    async def _connection(self):
+        """The engine's long-lived connection; a temporary one if the engine isn't started"""
+        if self._db is not None:
+            yield self._db
+        else:
+            async with database.connect() as db:
+                yield db
+
+    async def sync_devices(self):
+        """Reconcile the in-memory device set with every RUNNING row in the DB"""
+        async with self._sync_lock:
+            started = time.monotonic()
+            async with self._connection() as db:
+                cursor = await db.execute("SELECT * FROM devices WHERE status='RUNNING'")
+                rows = await cursor.fetchall()
+                await self._preload_params(db, rows)
+                await self._preload_rules(db, rows)
+                
+                current_active_uuids = set()
+                for row in rows:
+                    device = dict(row)
+                    if not self.owns_device(device['uuid']):
+                        continue
+                    current_active_uuids.add(device['uuid'])
+                    await self._apply_device(db, device)
+
+            # Cleanup stopped devices
+            for uuid in list(self.active_devices.keys()):
+                if uuid not in current_active_uuids:
+                    self._remove_device(uuid)
+            self.sync_duration.observe(time.monotonic() - started)
+
+    async def _preload_params(self, db, rows):
+        """Load params of newly running RANDOM devices in one query rather than one per device"""
+        missing = {row['uuid'] for row in rows if row['mode'] == 'RANDOM' and row['uuid'] not in self.device_params
+                   and self.owns_device(row['uuid'])}
+        if not missing:
+            return
+        params: Dict[str, List[Dict]] = {uuid: [] for uuid in missing}
+        cursor = await db.execute("""
+            SELECT p.* FROM device_params p JOIN devices d ON d.uuid = p.device_uuid
+            WHERE d.status = 'RUNNING' AND d.mode = 'RANDOM' ORDER BY p.id
+        """)
+        async for row in cursor:
+            if row['device_uuid'] in params:
+                params[row['device_uuid']].append(dict(row))
+        self.device_params.update(params)
+
+    async def _preload_rules(self, db, rows):
+        """Load rules of newly running listening devices in one query"""
+        missing = {row['uuid']: dict(row) for row in rows if row['subscribe_topic'] and row['uuid'] not in self.device_rules
+                   and self.owns_device(row['uuid'])}
+        if not missing:
+            return
+        rules: Dict[str, List[Dict]] = {uuid: [] for uuid in missing}
+        cursor = await db.execute("""
+            SELECT r.* FROM device_rules r JOIN devices d ON d.uuid = r.device_uuid
+            WHERE d.status = 'RUNNING' AND d.subscribe_topic IS NOT NULL ORDER BY r.id
+        """)
+        async for row in cursor:
+            if row['device_uuid'] in rules:
+                rules[row['device_uuid']].append(dict(row))
+        for uuid, device in missing.items():
+            self.device_rules[uuid] = RuleSet(device, rules[uuid])
+
+    async def device_changed(self, uuid: str):
+        """Event from the API: a device row was created or updated"""
+        if self.worker_pool:
+            await self.worker_pool.request(shard_of(uuid, self.worker_pool.count), {"op": "reload", "uuid": uuid})
+            return
+        async with self._sync_lock:
+            async with self._connection() as db:
+                cursor = await db.execute("SELECT * FROM devices WHERE uuid = ?", (uuid,))
+                row = await cursor.fetchone()
+                if row and row['status'] == 'RUNNING' and self.owns_device(uuid):
+                    await self._apply_device(db, dict(row), reload_params=True)
+                else:
+                    self._remove_device(uuid)
+
+    async def device_removed(self, uuid: str):
+        """Event from the API: a device row was deleted"""
+        if self.worker_pool:
+            await self.worker_pool.request(shard_of(uuid, self.worker_pool.count), {"op": "remove", "uuid": uuid})
+            return
+        async with self._sync_lock:
+            self._remove_device(uuid)
+            self.received_messages.discard(uuid)
+
+    async def resync(self):
+        """Event from the API: many rows changed at once (start-all / stop-all)"""
+        if self.worker_pool:
+            await self.worker_pool.broadcast({"op": "sync"})
+        else:
+            await self.sync_devices()
+
+    async def _apply_device(self, db, device: Dict, reload_params: bool = False):
+        """Add or update one running device in the caches"""
+        uuid = device['uuid']
+        previous = self.active_devices.get(uuid)
+        self.active_devices[uuid] = device
+        self._profile_of.pop(uuid, None)
+        # Changes made by command rules last until the device is edited, started or stopped
+        if reload_params:
+            self.rule_overrides.pop(uuid, None)
+            self.payload_generator.release(uuid) # Signals restart from the edited params
+        else:
+            device.update(self.rule_overrides.get(uuid, {}))
+        self.pool.assign(uuid)
+        self.scheduler.schedule(uuid, device['interval_ms'], phase_ms=self._phase_offset_ms(device))
+        
+        # Subscriptions only change when the topic does
+        old_topic = previous.get('subscribe_topic') if previous else None
+        if old_topic != device.get('subscribe_topic'):
+            self._unsubscribe_device(uuid, old_topic)
+            self._subscribe_device(uuid, device.get('subscribe_topic'))
+        
+        # Load Params if Random mode and not cached (or the device was just edited)
+        if device['mode'] == 'RANDOM':
+            if reload_params or uuid not in self.device_params:
+                p_cursor = await db.execute("SELECT * FROM device_params WHERE device_uuid = ?", (uuid,))
+                p_rows = await p_cursor.fetchall()
+                self.device_params[uuid] = [dict(p) for p in p_rows]
+        else:
+            self.device_params.pop(uuid, None)
+        
+        # Command rules; only devices that listen can react
+        if device.get('subscribe_topic'):
+            if reload_params or uuid not in self.device_rules:
+                r_cursor = await db.execute("SELECT * FROM device_rules WHERE device_uuid = ? ORDER BY id", (uuid,))
+                self.device_rules[uuid] = RuleSet(device, [dict(r) for r in await r_cursor.fetchall()])
+        else:
+            self.device_rules.pop(uuid, None)
+        
+        # Load CSV Player if CSV mode and not cached (or the file/loop setting changed)
+        player = self.csv_players.get(uuid)
+        wanted = device['mode'] == 'CSV_PLAYBACK' and device['csv_file_path'] and os.path.exists(device['csv_file_path'])
+        speed = device.get('csv_replay_speed')
+        if player and (not wanted or player.file_path != device['csv_file_path'] or player.loop != bool(device['csv_loop'])
+                       or player.speed != speed or self._csv_replaced(player)):
+            player.close()
+            del self.csv_players[uuid]
+            player = None
+        if wanted and not player:
+            # First device on a file parses it; keep that off the event loop
+            self.csv_players[uuid] = await asyncio.to_thread(
+                CsvPlayer, device['csv_file_path'], bool(device['csv_loop']), speed, device['interval_ms'] / 1000.0,
+            )
+        
+        # Recompile the payload encoder for the current name/params/CSV headers
+        if device['mode'] == 'CSV_PLAYBACK' and uuid in self.csv_players:
+            self.encoders[uuid] = PayloadEncoder.compile(device, headers=self.csv_players[uuid].headers, backend=PAYLOAD_ENCODER)
+        elif device['mode'] == 'RANDOM':
+            self.encoders[uuid] = PayloadEncoder.compile(device, params=self.device_params[uuid], backend=PAYLOAD_ENCODER)
+        else:
+            self.encoders.pop(uuid, None)
+
+    @staticmethod
+    def _csv_replaced(player: CsvPlayer) -> bool:
+        """The file was rewritten (e.g. re-uploaded under the same name) since the player loaded it"""
+        if player.dataset is None:
+            return False
+        try:
+            return CsvDataset.source_of(os.path.abspath(player.file_path)) != player.dataset.signature
+        except OSError:
+            return False
+
+    def _remove_device(self, uuid: str):
+        device = self.active_devices.pop(uuid, None)
+        self.scheduler.remove(uuid)
+        self.pool.release(uuid)
+        self.device_params.pop(uuid, None)
+        self.encoders.pop(uuid, None)
+        self.device_rules.pop(uuid, None)
+        self.rule_overrides.pop(uuid, None)
+        self.payload_generator.release(uuid)
+        self._profile_of.pop(uuid, None)
+        if uuid in self.csv_players:
+            self.csv_players[uuid].close()
+            del self.csv_players[uuid]
+        if device:
+            self._unsubscribe_device(uuid, device.get('subscribe_topic'))
+
+    def _subscribe_device(self, uuid: str, topic: str | None):
+        if not topic:
+            return
+        uuids = self.topic_map.setdefault(topic, [])
+        if not uuids:
+            # First device on this topic
+            self.transport.subscribe(topic)
+        if uuid not in uuids:
+            uuids.append(uuid)
+            self.subscriptions.add(topic, uuid)
+
+    def _unsubscribe_device(self, uuid: str, topic: str | None):
+        uuids = self.topic_map.get(topic) if topic else None
+        if not uuids or uuid not in uuids:
+            return
+        uuids.remove(uuid)
+        self.subscriptions.remove(topic, uuid)
+        if not uuids:
+            # Last device left; keep the broker subscription if the manual listener uses it
+            del self.topic_map[topic]
+            if topic not in self.manual_topics:
+                self.transport.unsubscribe(topic)
+
+    def _phase_offset_ms(self, device) -> int:
+        """Explicit phase offset, or a stable per-device spread in high-res mode"""
+        if device.get('phase_offset_ms') is not None:
+            return device['phase_offset_ms']
+        if HIGH_RES_TIMING:
+            return zlib.crc32(device['uuid'].encode()) % max(device['interval_ms'], 1)
+        return 0
 
     async def _tick_loop(self):
         """Main Simulation Loop"""
         while self.running:
-            start_time = time.time()
-            current_time_ms = int(start_time * 1000)
+            start_time = time.monotonic()
+            if self._wake_at is not None:
+                # Event loop lag: sleeps overrun when the loop is busy elsewhere
+                self.tick_lateness.observe(max(start_time - self._wake_at, 0.0))
+            for runner in self.load_profiles.values():
+                runner.refill(start_time)
             
-            # Iterate over a copy to allow modification during iteration if needed (though sync loop handles that)
-            # Use list(self.active_devices.values()) is safer
-            devices = list(self.active_devices.values())
+            # Only devices whose deadline has passed come off the heap
+            due_devices = []
+            for uuid, due in self.scheduler.pop_due(start_time):
+                device = self.active_devices.get(uuid)
+                if device:
+                    if self.load_profiles and not self._admit(device):
+                        continue # Over the profile's rate: this slot is skipped
+                    due_devices.append((device, due))
             
-            for device in devices:
-                uuid = device['uuid']
-                interval = device['interval_ms']
-                last_pub = self.last_publish_times.get(uuid, 0)
-                
-                if current_time_ms - last_pub >= interval:
-                    # Time to publish
-                    await self.publish_device(device)
-                    self.last_publish_times[uuid] = current_time_ms
+            if due_devices:
+                iso_now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+                # RANDOM payloads for the whole tick are drawn in one batch
+                random_values = self.payload_generator.generate([
+                    (device['uuid'], self.device_params.get(device['uuid'], []))
+                    for device, _ in due_devices if device['mode'] == 'RANDOM'
+                ], iso_now)
+                for device, due in due_devices:
+                    if device['qos'] and self._window_full(device):
+                        continue
+                    self.publish_lateness.observe(time.monotonic() - due)
+                    player = self.csv_players.get(device['uuid'])
+                    if player and player.timestamped:
+                        await self._replay_csv(device, player, iso_now)
+                        continue
+                    if await self.publish_device(device, values=random_values.get(device['uuid']), iso_now=iso_now):
+                        self.messages_published += 1
+            
+            elapsed = time.monotonic() - start_time
+            self.tick_duration.observe(elapsed)
+            if HIGH_RES_TIMING:
+                await self._sleep_until_next_due()
+                continue
             
             # Sleep mechanism to maintain loop but yield release
-            elapsed = time.time() - start_time
             # Adaptive sleep: minimal 10ms, but try to hit 100ms cycle
             sleep_time = max(0.01, 0.1 - elapsed)
+            self._wake_at = time.monotonic() + sleep_time
             await asyncio.sleep(sleep_time)
 
-    async def publish_device(self, device):
+    async def _replay_csv(self, device, player: CsvPlayer, iso_now: str):
+        """Timestamp replay: publish every row that has come due, then wake up for the next one"""
+        uuid = device['uuid']
+        now = time.monotonic()
+        rows = player.due_rows(now, CSV_REPLAY_BATCH)
+        window = self.transport_for(uuid).inflight if device['qos'] else None
+        for i, row in enumerate(rows):
+            if window is not None and window.full():
+                # Keep the rest for the next tick, where the backpressure policy applies
+                player.hold(rows[i:])
+                break
+            if await self.publish_device(device, values=row, iso_now=iso_now):
+                self.messages_published += 1
+
+        next_due = player.next_due(now)
+        if next_due is not None:
+            self.scheduler.reschedule(uuid, next_due)
+        elif not rows:
+            # Finished: report end_of_file on the regular interval like row-per-interval playback
+            if await self.publish_device(device, iso_now=iso_now):
+                self.messages_published += 1
+
+    def _admit(self, device) -> bool:
+        """Load profiles: take a token from the profile covering the device, if any"""
         uuid = device['uuid']
-        now = datetime.now(timezone.utc)
-        iso_now = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+        if uuid in self._profile_of:
+            runner = self._profile_of[uuid]
+        else:
+            runner = next((r for r in self.load_profiles.values() if r.covers(device['publish_topic'])), None)
+            self._profile_of[uuid] = runner
+        return runner is None or runner.admit()
+
+    async def set_load_profile(self, profile: Dict):
+        """Start (or restart) a load profile; each worker enforces its share of the rates"""
+        if self.worker_pool:
+            await self.worker_pool.broadcast({"op": "set_load_profile", "profile": profile})
+            return
+        self.load_profiles[profile['name']] = ProfileRunner(profile, time.monotonic(), share=1.0 / self.shard_count)
+        self._profile_of.clear()
+
+    async def clear_load_profile(self, name: str) -> bool:
+        if self.worker_pool:
+            replies = await self.worker_pool.broadcast({"op": "clear_load_profile", "name": name})
+            return any(reply and reply.get("cleared") for reply in replies)
+        cleared = self.load_profiles.pop(name, None) is not None
+        self._profile_of.clear()
+        return cleared
+
+    async def start_synthetic(self, config: Dict):
+        """Start a target-throughput run (replacing any running one); workers each run a slice of the devices"""
+        if self.worker_pool:
+            await self.worker_pool.broadcast({"op": "start_synthetic", "config": config})
+            return
+        await self.stop_synthetic()
+        self.synthetic = SyntheticLoad(config, self._synthetic_transports, PAYLOAD_ENCODER,
+                                       shard_index=self.shard_index, shard_count=self.shard_count,
+                                       qos_policy=QOS_BACKPRESSURE_POLICY, defer_s=QOS_DEFER_S)
+        self.synthetic.on_published = self._count_published
+        self.synthetic.start()
+        logger.info(f"Synthetic load started: {config['rate']} msgs/s from {self.synthetic.devices} virtual devices")
+
+    async def stop_synthetic(self):
+        if self.worker_pool:
+            await self.worker_pool.broadcast({"op": "stop_synthetic"})
+        if self.synthetic:
+            await self.synthetic.stop()
+
+    def _synthetic_transports(self) -> List[MqttTransport]:
+        """Virtual devices share the pooled connections (or the primary one)"""
+        return self.pool.clients() or [self.transport]
+
+    def _count_published(self, count: int):
+        self.messages_published += count
+
+    def _window_full(self, device) -> bool:
+        """QoS 1/2 backpressure: apply the policy when the connection's in-flight window is full"""
+        uuid = device['uuid']
+        window = self.transport_for(uuid).inflight
+        now = time.monotonic()
+        if not window.full(now):
+            return False
+        if QOS_BACKPRESSURE_POLICY == "defer" and self.scheduler.defer(uuid, now + QOS_DEFER_S):
+            window.deferred += 1
+        else:
+            window.dropped += 1
+        return True
+
+    async def _sleep_until_next_due(self):
+        """Sleep to the next absolute deadline (capped so new devices are picked up)"""
+        next_due = self.scheduler.next_due()
+        now = time.monotonic()
+        delay = 0.1 if next_due is None else min(next_due - now, 0.1)
+        self._wake_at = now + max(delay, 0.0)
+        if delay > HIGH_RES_SPIN_S:
+            # Wake slightly early; the remainder is covered by yielding
+            await asyncio.sleep(delay - HIGH_RES_SPIN_S)
+        else:
+            await asyncio.sleep(0)
+
+    async def publish_device(self, device, values: Dict[str, Any] | None = None, iso_now: str | None = None) -> bool:
+        """Publish one message; values are pre-generated RANDOM params (drawn here if omitted).
+
+        Returns whether the client accepted it (False if it raised or returned an error code).
+        """
+        uuid = device['uuid']
+        if iso_now is None:
+            iso_now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
         
         # Incremental sequence
-        if uuid not in self.device_sequences:
-            self.device_sequences[uuid] = 0
-        self.device_sequences[uuid] += 1
-        
-        payload = {
-            "device_id": device['name'],
-            "time": iso_now,
-            "sequence_id": self.device_sequences[uuid]
-        }
+        sequence_id = self.device_sequences.get(uuid, 0) + 1
+        self.device_sequences[uuid] = sequence_id
         
         try:
+            started = time.perf_counter()
+            # Compiled encoders cover the common case; anything else goes through a plain dict
+            encoder = self.encoders.get(uuid)
+            data = None
+            extra = None
             if device['mode'] == 'RANDOM':
-                params = self.device_params.get(uuid, [])
-                for p in params:
-                    val = None
-                    if p['type'] == 'int':
-                        val = random.randint(int(p['min_val']), int(p['max_val']))
-                    elif p['type'] == 'float':
-                        val = round(random.uniform(p['min_val'], p['max_val']), p['precision'])
-                    elif p['type'] == 'bool':
-                        val = random.choice([True, False])
-                    elif p['type'] == 'timestamp':
-                        val = iso_now
-                    elif p['type'] == 'string':
-                        val = p.get('string_value', "")
-                    
-                    if val is not None:
-                        payload[p['param_name']] = val
+                if values is None:
+                    values = generate_values(self.device_params.get(uuid, []), iso_now)
+                if encoder:
+                    data = encoder.encode(iso_now, sequence_id, values)
+                else:
+                    extra = values
                          
             elif device['mode'] == 'CSV_PLAYBACK':
                 player = self.csv_players.get(uuid)
                 if player:
-                    row = player.next_row()
-                    if row:
-                        payload.update(row)
+                    row = values if values is not None else player.next_row()
+                    if row and encoder:
+                        data = encoder.encode(iso_now, sequence_id, row)
+                    elif row:
+                        extra = row
                     else:
-                        payload["status"] = "end_of_file"
+                        extra = {"status": "end_of_file"}
                 else:
-                    payload['data'] = {"error": "csv_reader_not_ready"}
+                    extra = {"data": {"error": "csv_reader_not_ready"}}
+            
+            if data is None:
+                payload = {
+                    "device_id": device['name'],
+                    "time": iso_now,
+                    "sequence_id": sequence_id
+                }
+                if extra:
+                    payload.update(extra)
+                data = json.dumps(payload)
+            self.serialize_time.observe(time.perf_counter() - started)
                 
             topic = device['publish_topic']
-            # Blocking publish is okay here if fast, but paho loop_start handles it in background thread usually.
-            # actually publish() is async-compatible in paho (queues it)
-            self.mqtt_client.publish(topic, json.dumps(payload), qos=device['qos'], retain=bool(device['retain']))
+            transport = self.transport_for(uuid)
+            if transport.queue_depth >= transport.max_queued:
+                # Backpressure: let the socket drain before queueing more
+                await transport.wait_writable()
+            info = transport.publish(topic, data, qos=device['qos'], retain=bool(device['retain']))
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                self.publish_errors += 1
+                return False
+            counts = self.published_by_mode.get(device['mode'])
+            if counts is None:
+                counts = self.published_by_mode[device['mode']] = {"messages": 0, "bytes": 0}
+            counts["messages"] += 1
+            counts["bytes"] += len(data)
+            return True
         except Exception as e:
+            self.publish_errors += 1
             logger.error(f"Error publishing for {uuid}: {e}")
+            return False
+
+    def local_stats(self) -> Dict[str, Any]:
+        """Counters of this engine only (one shard when running as a worker)"""
+        return {
+            "mqtt_connected": self.is_mqtt_connected,
+            # Devices this engine simulates; the DB-wide total is added by get_stats
+            "running_devices": len(self.active_devices),
+            "messages_published": self.messages_published,
+            "publish_errors": self.publish_errors,
+            "published_by_mode": {mode: dict(counts) for mode, counts in self.published_by_mode.items()},
+            "publish_lateness": self.publish_lateness.state(),
+            "timing": {
+                "tick_duration": self.tick_duration.state(),
+                "tick_lateness": self.tick_lateness.state(),
+                "serialize": self.serialize_time.state(),
+                "sync_duration": self.sync_duration.state(),
+            },
+            "mqtt_queue": self._queue_state(),
+            "mqtt_pool": self.pool.stats(),
+            "qos": self._qos_state(),
+            "csv_replay": self._replay_state(),
+            "message_history": self.received_messages.stats(),
+            "inbound": {**self.inbound.stats(), "listener_matches": self.listener_matches},
+            "load_profiles": [runner.state(time.monotonic()) for runner in self.load_profiles.values()],
+            "synthetic": self.synthetic.state() if self.synthetic else None,
+            "rules": {
+                "devices": sum(1 for rules in self.device_rules.values() if rules),
+                **self.rule_counts,
+                "latency": self.command_latency.state(),
+            },
+        }
+
+    def _replay_state(self) -> Dict[str, Any]:
+        """Timestamp-replay progress; max_lag_s is how far the slowest device is behind its timeline"""
+        players = [p for p in self.csv_players.values() if p.timestamped]
+        return {
+            "devices": len(players),
+            "rows_replayed": sum(p.rows_replayed for p in players),
+            "max_lag_s": max((p.lag for p in players), default=0.0),
+        }
+
+    def _queue_state(self) -> Dict[str, int]:
+        """Packets waiting in paho's outgoing queues of this engine's connections"""
+        depths = [transport.queue_depth for transport in [self.transport] + self.pool.clients()]
+        return {"queued": sum(depths), "max": max(depths)}
+
+    def _qos_state(self) -> Dict[str, Any]:
+        """In-flight window counters summed over this engine's connections"""
+        totals = {"policy": QOS_BACKPRESSURE_POLICY, "inflight": 0, "acked": 0, "dropped": 0, "deferred": 0, "expired": 0}
+        ack_latency = Histogram()
+        for transport in [self.transport] + self.pool.clients():
+            state = transport.inflight.state()
+            for key in ("inflight", "acked", "dropped", "deferred", "expired"):
+                totals[key] += state[key]
+            ack_latency.merge(state["ack_latency"])
+        totals["ack_latency"] = ack_latency.state()
+        return totals
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """Engine stats, aggregated over all workers when sharded"""
+        stats = self.local_stats()
+        lateness = Histogram()
+        lateness.merge(stats["publish_lateness"])
+        ack_latency = Histogram()
+        ack_latency.merge(stats["qos"]["ack_latency"])
+        command_latency = Histogram()
+        command_latency.merge(stats["rules"]["latency"])
+        timing = {
+            "tick_duration": Histogram(DURATION_BUCKETS),
+            "tick_lateness": Histogram(),
+            "serialize": Histogram(SERIALIZE_BUCKETS),
+            "sync_duration": Histogram(DURATION_BUCKETS),
+        }
+        for key, hist in timing.items():
+            hist.merge(stats["timing"][key])
+        if self.worker_pool:
+            stats["workers"] = []
+            replies = await self.worker_pool.broadcast({"op": "stats"})
+            for index, reply in enumerate(replies):
+                if not reply or not reply.get("ok"):
+                    stats["workers"].append({"shard": index, "alive": False})
+                    continue
+                worker = reply["stats"]
+                for key in ("running_devices", "messages_published", "publish_errors"):
+                    stats[key] += worker[key]
+                for mode, counts in worker["published_by_mode"].items():
+                    totals = stats["published_by_mode"].setdefault(mode, {"messages": 0, "bytes": 0})
+                    for key in ("messages", "bytes"):
+                        totals[key] += counts[key]
+                lateness.merge(worker["publish_lateness"])
+                for key, hist in timing.items():
+                    hist.merge(worker["timing"][key])
+                stats["mqtt_queue"]["queued"] += worker["mqtt_queue"]["queued"]
+                stats["mqtt_queue"]["max"] = max(stats["mqtt_queue"]["max"], worker["mqtt_queue"]["max"])
+                for key in ("connections", "connected"):
+                    stats["mqtt_pool"][key] += worker["mqtt_pool"][key]
+                for key in ("inflight", "acked", "dropped", "deferred", "expired"):
+                    stats["qos"][key] += worker["qos"][key]
+                ack_latency.merge(worker["qos"]["ack_latency"])
+                for key in ("devices", "rows_replayed"):
+                    stats["csv_replay"][key] += worker["csv_replay"][key]
+                stats["csv_replay"]["max_lag_s"] = max(stats["csv_replay"]["max_lag_s"], worker["csv_replay"]["max_lag_s"])
+                for key, value in worker["message_history"].items():
+                    stats["message_history"][key] += value
+                for key, value in worker["inbound"].items():
+                    stats["inbound"][key] = max(stats["inbound"][key], value) if key == "max_depth" else stats["inbound"][key] + value
+                for key in ("devices", *self.rule_counts):
+                    stats["rules"][key] += worker["rules"][key]
+                command_latency.merge(worker["rules"]["latency"])
+                self._merge_profiles(stats["load_profiles"], worker["load_profiles"])
+                stats["synthetic"] = self._merge_synthetic(stats["synthetic"], worker["synthetic"])
+                stats["workers"].append({
+                    "shard": index,
+                    "alive": True,
+                    "mqtt_connected": worker["mqtt_connected"],
+                    "running_devices": worker["running_devices"],
+                    "messages_published": worker["messages_published"],
+                })
+        stats["total_devices"] = await database.count_devices()
+        stats["publish_lateness"] = lateness.snapshot()
+        stats["timing"] = {key: hist.snapshot() for key, hist in timing.items()}
+        stats["qos"]["ack_latency"] = ack_latency.snapshot()
+        stats["rules"]["latency"] = command_latency.snapshot()
+        if stats["synthetic"]:
+            latency = Histogram()
+            latency.merge(stats["synthetic"]["publish_latency"])
+            stats["synthetic"]["publish_latency"] = latency.snapshot()
+        return stats
+
+    @staticmethod
+    def _merge_synthetic(total: Optional[Dict], shard: Optional[Dict]) -> Optional[Dict]:
+        """Fleet-wide synthetic run figures; CPU is reported for the busiest worker"""
+        if not shard:
+            return total
+        if not total:
+            return dict(shard)
+        for key in ("target_rate", "achieved_rate"):
+            total[key] = round(total[key] + shard[key], 3)
+        for key in ("devices", "sent", "bytes", "missed", "errors"):
+            total[key] += shard[key]
+        for key in ("elapsed_s", "cpu_percent"):
+            total[key] = max(total[key], shard[key])
+        total["running"] = total["running"] or shard["running"]
+        total["saturated"] = total["saturated"] or shard["saturated"]
+        latency = Histogram()
+        latency.merge(total["publish_latency"])
+        latency.merge(shard["publish_latency"])
+        total["publish_latency"] = latency.state()
+        return total
+
+    @staticmethod
+    def _merge_profiles(totals: List[Dict], shard: List[Dict]):
+        """Add one worker's share of each load profile into the fleet-wide figures"""
+        by_name = {profile["name"]: profile for profile in totals}
+        for profile in shard:
+            total = by_name.get(profile["name"])
+            if total is None:
+                totals.append(dict(profile))
+                by_name[profile["name"]] = totals[-1]
+                continue
+            for key in ("target_rate", "achieved_rate", "admitted", "throttled"):
+                total[key] = round(total[key] + profile[key], 3)
+            total["finished"] = total["finished"] and profile["finished"]
+
+    async def device_messages(self, uuids: Optional[List[str]] = None, limit: int = MESSAGE_PREVIEW) -> Dict[str, List[Dict]]:
+        """Newest received messages per device UUID, collected from the workers when sharded"""
+        if not self.worker_pool:
+            return self.received_messages.latest(limit, uuids)
+        messages = {}
+        for reply in await self.worker_pool.broadcast({"op": "messages", "uuids": uuids, "limit": limit}):
+            if reply and reply.get("ok"):
+                messages.update(reply["messages"])
+        return messages
+
+    async def query_messages(self, **query) -> List[Dict]:
+        """Search received-message history (MessageStore.query arguments), across workers when sharded"""
+        if not self.worker_pool:
+            return self.received_messages.query(**query)
+        found = []
+        for reply in await self.worker_pool.broadcast({"op": "query_messages", "query": query}):
+            if reply and reply.get("ok"):
+                found += reply["messages"]
+        found.sort(key=lambda m: m["timestamp"], reverse=True)
+        return found[:query.get("limit", 100)]
 
     async def publish_manual(self, topic: str, payload: Any, qos: int = 0, retain: bool = False):
         try:
@@ -309,7 +1044,7 @@ class SimulationEngine:
                 payload_str = str(payload)
             
             logger.info(f"Manual publish to {topic}: {payload_str}")
-            self.mqtt_client.publish(topic, payload_str, qos=qos, retain=retain)
+            self.transport.publish(topic, payload_str, qos=qos, retain=retain)
         except Exception as e:
             logger.error(f"Error in manual publish: {e}")
             raise e
@@ -317,7 +1052,8 @@ class SimulationEngine:
     async def subscribe_manual(self, topic: str):
         try:
             self.manual_topics.add(topic)
-            self.mqtt_client.subscribe(topic)
+            self.subscriptions.add(topic, MANUAL_LISTENER)
+            self.transport.subscribe(topic)
             logger.info(f"Manual subscribe to {topic}")
         except Exception as e:
             logger.error(f"Error in manual subscribe: {e}")
@@ -327,7 +1063,10 @@ class SimulationEngine:
         try:
             if topic in self.manual_topics:
                 self.manual_topics.remove(topic)
-                self.mqtt_client.unsubscribe(topic)
+                self.subscriptions.remove(topic, MANUAL_LISTENER)
+                # Devices may still be listening on the same topic
+                if topic not in self.topic_map:
+                    self.transport.unsubscribe(topic)
                 logger.info(f"Manual unsubscribe from {topic}")
         except Exception as e:
             logger.error(f"Error in manual unsubscribe: {e}")
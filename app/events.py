@@ -0,0 +1,198 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Seconds between aggregated stats pushes to dashboard clients
+STATS_PUSH_INTERVAL_S = float(os.getenv("STATS_PUSH_INTERVAL_S", 1.0))
+# Events buffered per client; a client that falls this far behind is told to resync instead
+CLIENT_QUEUE_SIZE = 1000
+# SSE comment sent on idle streams so proxies keep the connection open
+KEEPALIVE_S = 15.0
+# Worker processes ship their events to the coordinator's hub in batches this often
+FORWARD_INTERVAL_S = 0.05
+
+
+class Subscriber:
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.lagged = False
+
+
+class EventHub:
+    """Fan-out of dashboard deltas to connected clients.
+
+    publish() never blocks: with no clients it is a no-op, and a client whose
+    queue is full stops receiving deltas until it has drained, then gets a
+    single 'resync' event telling it to refetch.
+    """
+
+    def __init__(self, queue_size: int = CLIENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Set[Subscriber] = set()
+        self._stats_task: Optional[asyncio.Task] = None
+        self.forwarder: Optional["EventForwarder"] = None # Worker processes: events go to the coordinator
+        self._listening = None # Shared flag telling worker processes whether anyone is connected
+
+    @property
+    def client_count(self) -> int:
+        return len(self._subscribers)
+
+    def share_listening(self, flag):
+        """Keep a shared multiprocessing.Value set while clients are connected"""
+        self._listening = flag
+        self._update_listening()
+
+    def _update_listening(self):
+        if self._listening is not None:
+            self._listening.value = 1 if self._subscribers else 0
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self.queue_size)
+        self._subscribers.add(subscriber)
+        self._update_listening()
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+        self._update_listening()
+
+    def publish(self, event: str, data: Any):
+        if self.forwarder is not None:
+            self.forwarder.add(event, data)
+            return
+        if not self._subscribers:
+            return
+        for subscriber in self._subscribers:
+            if subscriber.lagged:
+                continue
+            try:
+                subscriber.queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                subscriber.lagged = True
+
+    async def stream(self, subscriber: Subscriber):
+        """Server-sent events for one client"""
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(subscriber.queue.get(), KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if subscriber.lagged and subscriber.queue.empty():
+                    subscriber.lagged = False
+                    yield "event: resync\ndata: {}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    def start_stats(self, source: Callable[[], Awaitable[Dict]], interval_s: float = STATS_PUSH_INTERVAL_S):
+        """Push aggregated stats (plus a msgs/s rate) every interval_s while anyone is listening"""
+        if self._stats_task is None or self._stats_task.done():
+            self._stats_task = asyncio.create_task(self._stats_loop(source, interval_s))
+
+    async def stop_stats(self):
+        if self._stats_task:
+            self._stats_task.cancel()
+            try:
+                await self._stats_task
+            except asyncio.CancelledError:
+                pass
+            self._stats_task = None
+
+    async def _stats_loop(self, source: Callable[[], Awaitable[Dict]], interval_s: float):
+        last_count = None
+        last_time = time.monotonic()
+        last_sent = None
+        while True:
+            await asyncio.sleep(interval_s)
+            if not self._subscribers:
+                last_count = None
+                continue
+            try:
+                stats = await source()
+            except Exception as e:
+                logger.error(f"Stats push failed: {e}")
+                continue
+            now = time.monotonic()
+            count = stats.get("messages_published", 0)
+            rate = (count - last_count) / (now - last_time) if last_count is not None else 0.0
+            last_count, last_time = count, now
+            summary = {
+                "mqtt_connected": stats.get("mqtt_connected"),
+                "total_devices": stats.get("total_devices"),
+                "running_devices": stats.get("running_devices"),
+                "messages_published": count,
+                "messages_per_s": round(rate, 1),
+                # Load profiles: target vs. achieved msgs/s
+                "load_profiles": [
+                    {key: profile[key] for key in ("name", "target_rate", "achieved_rate", "finished")}
+                    for profile in stats.get("load_profiles", [])
+                ],
+            }
+            # Idle fleets don't generate traffic
+            if summary != last_sent:
+                self.publish("stats", summary)
+                last_sent = summary
+
+
+class EventForwarder:
+    """Worker side of the hub: batches events for the coordinator, which republishes them.
+
+    Events are only collected while the coordinator has clients (the shared
+    listening flag). A batch is capped at max_batch events; the overflow is
+    replaced by a single 'resync' so clients refetch instead of missing deltas.
+    """
+
+    def __init__(self, conn, listening, max_batch: int = CLIENT_QUEUE_SIZE):
+        self.conn = conn
+        self.listening = listening
+        self.max_batch = max_batch
+        self.pending = []
+        self.overflowed = False
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, event: str, data: Any):
+        if not self.listening.value:
+            return
+        if len(self.pending) >= self.max_batch:
+            self.overflowed = True
+            return
+        self.pending.append((event, data))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(FORWARD_INTERVAL_S)
+            if not self.pending and not self.overflowed:
+                continue
+            batch, self.pending = self.pending, []
+            if self.overflowed:
+                batch.append(("resync", {}))
+                self.overflowed = False
+            try:
+                await asyncio.to_thread(self.conn.send, batch)
+            except (OSError, ValueError) as e:
+                logger.error(f"Event forwarding stopped: {e}")
+                return
+
+
+hub = EventHub()
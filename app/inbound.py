@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (topic, raw payload, arrival time)
+RawMessage = Tuple[str, bytes, float]
+
+
+class InboundPipeline:
+    """Bounded hand-off between MQTT receive callbacks and message processing.
+
+    put() only records the raw message and may be called from any thread
+    (paho's network thread included). When maxsize messages are waiting the
+    oldest is dropped and counted, so a flood costs memory and CPU only up to
+    that bound. A consumer task on the event loop passes waiting messages to
+    the handler in batches of up to batch_size, yielding between batches so
+    the tick loop keeps publishing.
+    """
+
+    def __init__(self, handler: Callable[[List[RawMessage]], None], maxsize: int = 10000, batch_size: int = 500):
+        self.handler = handler
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self._queue: Deque[RawMessage] = deque(maxlen=maxsize)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._sleeping = False
+        self._task: Optional[asyncio.Task] = None
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.batches = 0
+        self.max_depth = 0
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def put(self, topic: str, payload: bytes):
+        queue = self._queue
+        if len(queue) >= self.maxsize:
+            self.dropped += 1 # The deque pushes out the oldest message
+        queue.append((topic, payload, time.time()))
+        self.received += 1
+        if self._sleeping:
+            self._sleeping = False
+            self._wake()
+
+    def _wake(self):
+        if self._wakeup is None:
+            return
+        if threading.get_ident() == self._loop_thread:
+            self._wakeup.set()
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread = threading.get_ident()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._sleeping = False
+        self.drain()
+
+    async def _run(self):
+        while True:
+            self._sleeping = True
+            if not self._queue:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+            self._sleeping = False
+            self._process_batch()
+            await asyncio.sleep(0)
+
+    def _process_batch(self) -> int:
+        queue = self._queue
+        depth = len(queue)
+        if depth > self.max_depth:
+            self.max_depth = depth
+        batch = []
+        for _ in range(min(depth, self.batch_size)):
+            batch.append(queue.popleft())
+        if batch:
+            try:
+                self.handler(batch)
+            except Exception as e:
+                logger.error(f"Error processing inbound messages: {e}")
+            self.processed += len(batch)
+            self.batches += 1
+        return len(batch)
+
+    def drain(self):
+        """Process everything waiting now (shutdown, tests)"""
+        while self._process_batch():
+            pass
+
+    def stats(self) -> Dict:
+        return {
+            "queued": len(self._queue),
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "max_depth": self.max_depth,
+        }
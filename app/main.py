@@ -1,9 +1,10 @@
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
-from app.database import init_db
-from app.api import devices
+from app.database import init_db, open_pool, close_pool
+from app.api import devices, metrics
 from app.engine import engine
+from app.events import hub
 import logging
 
 # Configure logging
@@ -15,17 +16,22 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Initializing Database...")
     await init_db()
+    await open_pool()
     logger.info("Starting Simulation Engine...")
     await engine.start()
+    hub.start_stats(engine.get_stats)
     yield
     # Shutdown
     logger.info("Stopping Simulation Engine...")
+    await hub.stop_stats()
     await engine.stop()
+    await close_pool()
 
 app = FastAPI(lifespan=lifespan)
 
 # Mount API routes
 app.include_router(devices.router, prefix="/api")
+app.include_router(metrics.router)
 
 # Mount Static Files (Frontend)
 app.mount("/", StaticFiles(directory="static", html=True), name="static")
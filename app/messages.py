@@ -0,0 +1,242 @@
+import json
+import logging
+import os
+from collections import deque
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import paho.mqtt.client as mqtt
+
+logger = logging.getLogger(__name__)
+
+# Rough per-message bookkeeping cost on top of topic + payload, for budget accounting
+ENTRY_OVERHEAD_BYTES = 200
+# Spill files are rotated (to <path>.1) past this size
+SPILL_MAX_BYTES = 100 * 1024 * 1024
+
+def entry_size(message: Dict) -> int:
+    return len(message["topic"]) + len(message["payload"]) + ENTRY_OVERHEAD_BYTES
+
+def matches(message: Dict, topic: Optional[str], since: Optional[float], until: Optional[float]) -> bool:
+    if since is not None and message["timestamp"] < since:
+        return False
+    if until is not None and message["timestamp"] > until:
+        return False
+    return topic is None or mqtt.topic_matches_sub(topic, message["topic"])
+
+
+class MessageRing:
+    """Oldest-first ring of received messages, bounded by count and bytes"""
+
+    def __init__(self, depth: int, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: Deque[Tuple[int, Dict]] = deque(maxlen=depth) # (sequence, message)
+        self._sizes: Deque[int] = deque()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __getitem__(self, index: int) -> Dict:
+        return self._entries[index][1]
+
+    def __iter__(self) -> Iterator[Dict]:
+        return (message for _, message in self._entries)
+
+    def append(self, message: Dict, seq: int = 0) -> List[Dict]:
+        """Add a message; returns those evicted to stay within depth and budget"""
+        evicted = []
+        if len(self._entries) == self._entries.maxlen:
+            evicted.append(self._popleft())
+        size = entry_size(message)
+        self._entries.append((seq, message))
+        self._sizes.append(size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            evicted.append(self._popleft())
+        return evicted
+
+    def _popleft(self) -> Dict:
+        _, message = self._entries.popleft()
+        self.bytes -= self._sizes.popleft()
+        return message
+
+    def pop_oldest_if(self, seq: int) -> Optional[Dict]:
+        """Evict the oldest entry if it is the given sequence number (global budget eviction)"""
+        if self._entries and self._entries[0][0] == seq:
+            return self._popleft()
+        return None
+
+    def clear(self):
+        self._entries.clear()
+        self._sizes.clear()
+        self.bytes = 0
+
+    def latest(self, limit: int) -> List[Dict]:
+        if limit >= len(self._entries):
+            return list(self)
+        return [self._entries[i][1] for i in range(len(self._entries) - limit, len(self._entries))]
+
+    def query(self, topic: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None,
+              limit: int = 100) -> List[Dict]:
+        """Newest matches first"""
+        found = []
+        for _, message in reversed(self._entries):
+            if since is not None and message["timestamp"] < since:
+                break # Older entries are older still
+            if matches(message, topic, None, until):
+                found.append(message)
+                if len(found) >= limit:
+                    break
+        return found
+
+
+class MessageStore:
+    """Received-message history per key (device UUID), within memory budgets.
+
+    Each key keeps up to depth messages and key_budget bytes; across all keys
+    at most global_budget bytes are kept, evicting the oldest message overall.
+    With a spill path, evicted messages are appended there as NDJSON instead
+    of being lost.
+    """
+
+    def __init__(self, depth: int, key_budget: int, global_budget: int, spill_path: Optional[str] = None):
+        self.depth = depth
+        self.key_budget = key_budget
+        self.global_budget = global_budget
+        self.spill_path = spill_path
+        self._rings: Dict[str, MessageRing] = {}
+        self._order: Deque[Tuple[int, str]] = deque() # (sequence, key) in arrival order, for global eviction
+        self._seq = 0
+        self.bytes = 0
+        self.count = 0 # Messages currently held
+        self.stored = 0
+        self.evicted = 0
+        self.spilled = 0
+        self._spill_file = None
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rings
+
+    def __getitem__(self, key: str) -> MessageRing:
+        return self._rings[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rings)
+
+    def __len__(self) -> int:
+        return len(self._rings)
+
+    def add(self, key: str, message: Dict):
+        ring = self._rings.get(key)
+        if ring is None:
+            ring = self._rings[key] = MessageRing(self.depth, self.key_budget)
+        self._seq += 1
+        before = ring.bytes
+        evicted = ring.append(message, self._seq)
+        self.bytes += ring.bytes - before
+        self._order.append((self._seq, key))
+        self.stored += 1
+        self.count += 1
+        self._evicted(key, evicted)
+
+        while self.bytes > self.global_budget and self._order:
+            seq, oldest_key = self._order.popleft()
+            oldest = self._rings.get(oldest_key)
+            dropped = oldest.pop_oldest_if(seq) if oldest is not None else None
+            if dropped is not None:
+                self.bytes -= entry_size(dropped)
+                self._evicted(oldest_key, [dropped])
+        # Entries already evicted per key leave stale references behind; drop them in bulk
+        if len(self._order) > 2 * max(self.count, 1024):
+            self._compact()
+
+    def _compact(self):
+        live = {seq for ring in self._rings.values() for seq, _ in ring._entries}
+        self._order = deque(entry for entry in self._order if entry[0] in live)
+
+    def _evicted(self, key: str, messages: List[Dict]):
+        if not messages:
+            return
+        self.count -= len(messages)
+        self.evicted += len(messages)
+        if self.spill_path:
+            self._spill(key, messages)
+
+    def _spill(self, key: str, messages: List[Dict]):
+        try:
+            if self._spill_file is None:
+                os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+                self._spill_file = open(self.spill_path, "a")
+            for message in messages:
+                self._spill_file.write(json.dumps({"key": key, **message}) + "\n")
+            self.spilled += len(messages)
+            if self._spill_file.tell() > SPILL_MAX_BYTES:
+                self._spill_file.close()
+                os.replace(self.spill_path, self.spill_path + ".1")
+                self._spill_file = None
+        except OSError as e:
+            logger.error(f"Message spill to {self.spill_path} failed: {e}")
+
+    def flush(self):
+        if self._spill_file is not None:
+            self._spill_file.flush()
+
+    def close(self):
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def discard(self, key: str):
+        ring = self._rings.pop(key, None)
+        if ring is not None:
+            self.bytes -= ring.bytes
+            self.count -= len(ring)
+
+    def clear(self):
+        self._rings.clear()
+        self._order.clear()
+        self.bytes = 0
+        self.count = 0
+
+    def latest(self, limit: int, keys: Optional[Iterable[str]] = None) -> Dict[str, List[Dict]]:
+        """The newest messages of each key (or of the given keys)"""
+        if keys is None:
+            keys = self._rings.keys()
+        return {key: self._rings[key].latest(limit) for key in keys if key in self._rings}
+
+    def query(self, key: Optional[str] = None, topic: Optional[str] = None, since: Optional[float] = None,
+              until: Optional[float] = None, limit: int = 100, spilled: bool = False) -> List[Dict]:
+        """Messages matching a key, topic filter and time range, newest first"""
+        keys = [key] if key is not None else list(self._rings)
+        found = []
+        for k in keys:
+            ring = self._rings.get(k)
+            if ring is not None:
+                found += [{"key": k, **m} for m in ring.query(topic, since, until, limit)]
+        if spilled and self.spill_path:
+            found += self._query_spill(key, topic, since, until)
+        found.sort(key=lambda m: m["timestamp"], reverse=True)
+        return found[:limit]
+
+    def _query_spill(self, key, topic, since, until) -> List[Dict]:
+        self.flush()
+        found = []
+        for path in (self.spill_path + ".1", self.spill_path):
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                for line in f:
+                    message = json.loads(line)
+                    if (key is None or message["key"] == key) and matches(message, topic, since, until):
+                        found.append(message)
+        return found
+
+    def stats(self) -> Dict:
+        return {
+            "keys": len(self._rings),
+            "messages": self.count,
+            "bytes": self.bytes,
+            "stored": self.stored,
+            "evicted": self.evicted,
+            "spilled": self.spilled,
+        }
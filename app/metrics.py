@@ -0,0 +1,121 @@
+import bisect
+from typing import Dict, List, Optional, Sequence
+
+# Seconds; tuned for publish lateness (sub-ms up to multi-second stalls)
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+# Seconds; loop passes and DB syncs, which can run long on big fleets
+DURATION_BUCKETS = LATENCY_BUCKETS + (5.0, 10.0, 30.0)
+# Seconds; building and encoding one payload (microseconds)
+SERIALIZE_BUCKETS = (
+    0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005,
+    0.0001, 0.00025, 0.001,
+)
+
+class Histogram:
+    """Fixed-bucket histogram. observe() is a bisect plus two adds."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets: List[float] = sorted(buckets)
+        self.reset()
+
+    def reset(self):
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def state(self) -> Dict:
+        """Raw counters, picklable so other processes can merge them"""
+        return {"counts": list(self.counts), "count": self.count, "sum": self.sum, "max": self.max}
+
+    def merge(self, state: Dict):
+        """Add another histogram's state() (same buckets) into this one"""
+        for i, c in enumerate(state["counts"]):
+            self.counts[i] += c
+        self.count += state["count"]
+        self.sum += state["sum"]
+        self.max = max(self.max, state["max"])
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation (never above the largest seen)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict:
+        labels = [str(b) for b in self.buckets] + ["+Inf"]
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+def _label_text(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items())
+    return "{" + pairs + "}"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class PrometheusText:
+    """Builds a Prometheus text exposition (format 0.0.4) from stats values"""
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self._declared = set()
+
+    def _declare(self, name: str, kind: str, help_text: str):
+        if name not in self._declared:
+            self._declared.add(name)
+            self.lines.append(f"# HELP {name} {help_text}")
+            self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, kind: str, help_text: str, value: float, labels: Optional[Dict[str, str]] = None):
+        """One counter or gauge sample; samples of a family must be added together"""
+        self._declare(name, kind, help_text)
+        self.lines.append(f"{name}{_label_text(labels or {})} {float(value)!r}")
+
+    def counter(self, name: str, help_text: str, value: float, labels: Optional[Dict[str, str]] = None):
+        self.sample(name, "counter", help_text, value, labels)
+
+    def gauge(self, name: str, help_text: str, value: float, labels: Optional[Dict[str, str]] = None):
+        self.sample(name, "gauge", help_text, value, labels)
+
+    def histogram(self, name: str, help_text: str, snapshot: Dict, labels: Optional[Dict[str, str]] = None):
+        """A Histogram.snapshot() as cumulative le buckets plus _sum and _count"""
+        self._declare(name, "histogram", help_text)
+        labels = labels or {}
+        seen = 0
+        for bound, count in snapshot["buckets"].items():
+            seen += count
+            self.lines.append(f"{name}_bucket{_label_text({**labels, 'le': bound})} {seen}")
+        self.lines.append(f"{name}_sum{_label_text(labels)} {float(snapshot['sum'])!r}")
+        self.lines.append(f"{name}_count{_label_text(labels)} {snapshot['count']}")
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Optional, Union, Literal
 
 class DeviceParams(BaseModel):
@@ -10,6 +10,49 @@ class DeviceParams(BaseModel):
     max_val: float
     precision: Optional[int] = 2
     string_value: Optional[str] = None
+    # Signal shape of int/float params (see app/signals.py); uniform draws by default
+    generator: Literal['uniform', 'random_walk', 'sine', 'drift', 'step', 'spike', 'gaussian'] = 'uniform'
+    step: Optional[float] = None # random_walk: largest move per publish; drift: move per publish
+    period_s: Optional[float] = Field(None, gt=0) # sine: period; step: how long a level is held
+    phase_s: Optional[float] = None # sine: time shift
+    noise: Optional[float] = Field(None, ge=0) # Std of added Gaussian noise (gaussian: its spread)
+    spike_prob: Optional[float] = Field(None, ge=0, le=1) # Chance per publish of a one-range-wide spike
+
+class DeviceRule(BaseModel):
+    """Reaction to a message received on the device's subscribe topic.
+
+    A rule matches when the message topic matches topic (any, if omitted) and
+    the JSON payload has field (a dotted path) equal to equals (any value, if
+    omitted). Every matching rule runs, in order:
+    - reply: publish reply_payload (a $field template; a JSON ack by default)
+      to reply_topic (default "<publish_topic>/reply", may use {uuid}/{name})
+    - set_interval: publish every interval_ms, or every value_field ms
+    - set_range: set param_name's range to min_val..max_val, or re-center it on value_field
+    """
+    id: Optional[int] = None
+    device_uuid: Optional[str] = None
+    topic: Optional[str] = None
+    field: Optional[str] = None
+    equals: Optional[str] = None
+    action: Literal['reply', 'set_interval', 'set_range']
+    param_name: Optional[str] = None
+    value_field: Optional[str] = None
+    interval_ms: Optional[int] = Field(None, ge=1)
+    min_val: Optional[float] = None
+    max_val: Optional[float] = None
+    reply_topic: Optional[str] = None
+    reply_payload: Optional[str] = None
+
+    @model_validator(mode="after")
+    def check_action(self):
+        if self.action == 'set_interval' and self.interval_ms is None and not self.value_field:
+            raise ValueError("set_interval needs interval_ms or value_field")
+        if self.action == 'set_range':
+            if not self.param_name:
+                raise ValueError("set_range needs param_name")
+            if not self.value_field and (self.min_val is None or self.max_val is None):
+                raise ValueError("set_range needs min_val and max_val, or value_field")
+        return self
 
 class Device(BaseModel):
     uuid: str
@@ -18,14 +61,85 @@ class Device(BaseModel):
     mode: Literal['RANDOM', 'CSV_PLAYBACK'] = 'RANDOM'
     publish_topic: str
     subscribe_topic: Optional[str] = None
-    interval_ms: int = 1000
+    interval_ms: int = Field(1000, ge=1)
+    phase_offset_ms: Optional[int] = None # Delay of the first publish; spreads devices sharing an interval
     qos: Literal[0, 1, 2] = 0
     retain: bool = False
     csv_file_path: Optional[str] = None
     csv_loop: bool = True
+    # None: one row per interval_ms. Otherwise replay rows at their recorded timestamps,
+    # sped up by this factor (1 = real time, 10 = ten times faster, 0 = as fast as possible)
+    csv_replay_speed: Optional[float] = Field(None, ge=0)
     params: List[DeviceParams] = []
+    rules: Optional[List[DeviceRule]] = None # Command reactions; None on update keeps the stored rules
     messages: List[dict] = [] # Received MQTT messages
 
+class BulkDeviceCreate(BaseModel):
+    """Fleet provisioning: count copies of a template device.
+
+    name, publish_topic and subscribe_topic of the template may use {n} (the
+    device index) and {uuid}; a name without {n} gets "-{n}" appended.
+    """
+    template: Device
+    count: int = Field(ge=1, le=1_000_000)
+    start_index: int = 1
+    uuid_pattern: Optional[str] = None # e.g. "sensor-{n}"; random UUIDs when omitted
+
+class LoadPhase(BaseModel):
+    """One stretch of a load profile; rates are fleet-wide msgs/s.
+
+    - ramp: from from_rate (default: where the previous phase ended) to to_rate
+    - soak: a steady rate
+    - burst: rate, raised to burst_rate for the first burst_s of every period_s
+    - diurnal: cosine between min_rate and max_rate over period_s, peaking at peak_s
+    """
+    type: Literal['ramp', 'soak', 'burst', 'diurnal']
+    duration_s: float = Field(gt=0)
+    rate: Optional[float] = Field(None, ge=0)
+    from_rate: Optional[float] = Field(None, ge=0)
+    to_rate: Optional[float] = Field(None, ge=0)
+    burst_rate: Optional[float] = Field(None, ge=0)
+    burst_s: Optional[float] = Field(None, gt=0)
+    period_s: Optional[float] = Field(None, gt=0)
+    min_rate: Optional[float] = Field(None, ge=0)
+    max_rate: Optional[float] = Field(None, ge=0)
+    peak_s: Optional[float] = None
+
+    @model_validator(mode="after")
+    def check_type(self):
+        required = {
+            'ramp': ('to_rate',),
+            'soak': ('rate',),
+            'burst': ('rate', 'burst_rate', 'burst_s', 'period_s'),
+            'diurnal': ('min_rate', 'max_rate', 'period_s'),
+        }[self.type]
+        missing = [name for name in required if getattr(self, name) is None]
+        if missing:
+            raise ValueError(f"{self.type} phase needs {', '.join(missing)}")
+        return self
+
+class LoadProfile(BaseModel):
+    """Publish-rate ceiling over time for all running devices, or those whose publish_topic matches match"""
+    name: str
+    match: Optional[str] = None # MQTT topic filter selecting the device group
+    phases: List[LoadPhase] = Field(min_length=1)
+    loop: bool = False
+
+class SyntheticLoadConfig(BaseModel):
+    """Target-throughput run: rate msgs/s in total from virtual devices kept in memory only.
+
+    Without devices, enough virtual devices are created to reach rate with
+    each publishing every interval_ms. topic and name may use {n}, the device index.
+    """
+    rate: float = Field(gt=0)
+    devices: Optional[int] = Field(None, ge=1, le=10_000_000)
+    interval_ms: int = Field(1000, ge=1)
+    topic: str = "synthetic/{n}"
+    name: str = "synthetic-{n}"
+    params: List[DeviceParams] = []
+    qos: Literal[0, 1, 2] = 0
+    duration_s: Optional[float] = Field(None, gt=0) # Runs until stopped when omitted
+
 class MqttPublishRequest(BaseModel):
     topic: str
     payload: Union[str, dict]
@@ -0,0 +1,105 @@
+import logging
+import random
+from typing import Callable, Dict, List, Optional
+
+from app.transport import MqttTransport
+from app.workers import shard_of
+
+logger = logging.getLogger(__name__)
+
+PER_DEVICE = "per-device"
+
+def parse_pool_size(value: str) -> Optional[int]:
+    """MQTT_POOL_SIZE: a connection count, or 'per-device' (returned as None)"""
+    if value.strip().lower() == PER_DEVICE:
+        return None
+    return max(int(value), 1)
+
+
+class MqttConnectionPool:
+    """Publish connections for simulated devices.
+
+    size=1 publishes everything through the engine's primary transport
+    (client_for returns None). size=N spreads devices over N shared
+    connections; size=None gives every device its own connection, using the
+    device UUID as MQTT client id.
+    """
+
+    def __init__(self, size: Optional[int], client_id_prefix: str,
+                 transport_factory: Callable[[str], MqttTransport],
+                 reconnect_min_s: float = 1.0, reconnect_max_s: float = 60.0):
+        self.size = size
+        self.client_id_prefix = client_id_prefix
+        self._transport_factory = transport_factory
+        self.reconnect_min_s = reconnect_min_s
+        self.reconnect_max_s = reconnect_max_s
+        self.shared: List[MqttTransport] = []
+        self.device_clients: Dict[str, MqttTransport] = {} # UUID -> transport (per-device mode)
+        self.started = False
+
+    @property
+    def per_device(self) -> bool:
+        return self.size is None
+
+    def _open(self, client_id: str) -> MqttTransport:
+        transport = self._transport_factory(client_id)
+        # Randomized minimum delay so a broker restart isn't followed by a reconnect storm;
+        # the delay doubles up to the maximum on repeated failures
+        transport.reconnect_delay_set(
+            min_delay=self.reconnect_min_s * random.uniform(1.0, 3.0),
+            max_delay=self.reconnect_max_s,
+        )
+        try:
+            transport.connect()
+        except Exception as e:
+            logger.error(f"Failed to connect MQTT client {client_id}: {e}")
+        return transport
+
+    def _close(self, transport: MqttTransport):
+        try:
+            transport.disconnect()
+        except Exception as e:
+            logger.error(f"Error closing MQTT client: {e}")
+
+    def start(self):
+        """Open the shared connections; per-device clients open as devices are assigned"""
+        self.started = True
+        if not self.per_device and self.size > 1:
+            self.shared = [self._open(f"{self.client_id_prefix}-pool-{i}") for i in range(self.size)]
+            logger.info(f"Opened {self.size} pooled MQTT connections")
+
+    def stop(self):
+        for client in self.shared + list(self.device_clients.values()):
+            self._close(client)
+        self.shared.clear()
+        self.device_clients.clear()
+        self.started = False
+
+    def assign(self, uuid: str):
+        """Device started: give it a connection (per-device mode opens one)"""
+        if self.per_device and self.started and uuid not in self.device_clients:
+            self.device_clients[uuid] = self._open(uuid)
+
+    def release(self, uuid: str):
+        """Device stopped: drop its own connection, if it has one"""
+        client = self.device_clients.pop(uuid, None)
+        if client is not None:
+            self._close(client)
+
+    def client_for(self, uuid: str) -> Optional[MqttTransport]:
+        if self.per_device:
+            return self.device_clients.get(uuid)
+        if self.shared:
+            return self.shared[shard_of(uuid, len(self.shared))]
+        return None
+
+    def clients(self) -> List[MqttTransport]:
+        return self.shared + list(self.device_clients.values())
+
+    def stats(self) -> Dict:
+        clients = self.clients()
+        return {
+            "mode": PER_DEVICE if self.per_device else self.size,
+            "connections": len(clients),
+            "connected": sum(1 for c in clients if c.is_connected()),
+        }
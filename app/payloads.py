@@ -0,0 +1,163 @@
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.signals import SignalState, generator_of, next_value, signal_column
+
+try:
+    import numpy as np
+except ImportError:  # Optional: without NumPy every device takes the scalar path
+    np = None
+
+# Smaller schema groups aren't worth the array setup cost
+BATCH_MIN_GROUP = 8
+# Schema keys are cached per params list; reset past this many entries
+SCHEMA_CACHE_SIZE = 100_000
+
+def schema_key(params: List[Dict]) -> Tuple:
+    """Devices whose params have the same names, types and signal generators (in order) share a schema"""
+    return tuple((p['param_name'], p['type'], generator_of(p)) for p in params)
+
+def _has_signals(key: Tuple) -> bool:
+    return any(generator != 'uniform' for _, _, generator in key)
+
+def generate_values(params: List[Dict], iso_now: str, state: Optional[SignalState] = None, slot: int = 0) -> Dict[str, Any]:
+    """Scalar path: draw one device's RANDOM-mode values (signal generators continue from state)"""
+    values = {}
+    now = None
+    for column, p in enumerate(params):
+        val = None
+        if generator_of(p) != 'uniform':
+            if now is None:
+                now = time.time()
+            val = next_value(p, now, state, slot, column)
+            val = int(round(val)) if p['type'] == 'int' else round(val, p['precision'])
+        elif p['type'] == 'int':
+            val = random.randint(int(p['min_val']), int(p['max_val']))
+        elif p['type'] == 'float':
+            val = round(random.uniform(p['min_val'], p['max_val']), p['precision'])
+        elif p['type'] == 'bool':
+            val = random.choice([True, False])
+        elif p['type'] == 'timestamp':
+            val = iso_now
+        elif p['type'] == 'string':
+            val = p.get('string_value', "")
+
+        if val is not None:
+            values[p['param_name']] = val
+    return values
+
+
+class BatchPayloadGenerator:
+    """Draws values for all due RANDOM devices at once, one NumPy call per schema column.
+
+    Signal generator state (random walks, drifts, held steps) is kept per schema
+    in a SignalState; release() frees a device's row when it stops or is edited.
+    """
+
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed) if np is not None else None
+        self._schema_cache: Dict[int, Tuple[List[Dict], Tuple]] = {} # id(params) -> (params, key)
+        self._states: Dict[Tuple, SignalState] = {} # schema key -> generator state
+
+    def release(self, uuid: str):
+        for state in self._states.values():
+            state.release(uuid)
+
+    def _state(self, key: Tuple) -> SignalState:
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = SignalState(len(key))
+        return state
+
+    def _schema_key(self, params: List[Dict]) -> Tuple:
+        cached = self._schema_cache.get(id(params))
+        if cached is not None and cached[0] is params:
+            return cached[1]
+        if len(self._schema_cache) >= SCHEMA_CACHE_SIZE:
+            self._schema_cache.clear()
+        key = schema_key(params)
+        self._schema_cache[id(params)] = (params, key)
+        return key
+
+    def generate(self, batch: List[Tuple[str, List[Dict]]], iso_now: str) -> Dict[str, Dict[str, Any]]:
+        """(uuid, params) pairs -> uuid -> {param_name: value}"""
+        groups: Dict[Tuple, List[Tuple[str, List[Dict]]]] = {}
+        for uuid, params in batch:
+            groups.setdefault(self._schema_key(params), []).append((uuid, params))
+
+        values = {}
+        for key, members in groups.items():
+            state = self._state(key) if _has_signals(key) else None
+            if self.rng is None or len(members) < BATCH_MIN_GROUP:
+                for uuid, params in members:
+                    values[uuid] = generate_values(params, iso_now, state, state.row(uuid) if state is not None else 0)
+            else:
+                values.update(self._generate_group(key, members, iso_now, state))
+        return values
+
+    def _generate_group(self, key: Tuple, members: List[Tuple[str, List[Dict]]], iso_now: str,
+                        state: Optional[SignalState] = None) -> Dict[str, Dict[str, Any]]:
+        n = len(members)
+        if state is not None:
+            # Rows are allocated before any array view of the state is taken
+            rows = np.array([state.row(uuid) for uuid, _ in members], dtype=np.intp)
+            now = time.time()
+        names = []
+        columns = []
+        for j, (name, ptype, generator) in enumerate(key):
+            column_params = [params[j] for _, params in members]
+            if generator != 'uniform':
+                draws = signal_column(generator, column_params, state, rows, j, now, self.rng)
+                column = self._round_draws(ptype, draws, column_params)
+            else:
+                column = self._generate_column(ptype, column_params, n, iso_now)
+            if column is not None:
+                names.append(name)
+                columns.append(column)
+
+        uuids = [uuid for uuid, _ in members]
+        if not columns:
+            return {uuid: {} for uuid in uuids}
+        return {uuid: dict(zip(names, row)) for uuid, row in zip(uuids, zip(*columns))}
+
+    def _generate_column(self, ptype: str, column_params: List[Dict], n: int, iso_now: str) -> List[Any]:
+        rng = self.rng
+        if ptype == 'int':
+            low = np.array([int(p['min_val']) for p in column_params], dtype=np.int64)
+            high = np.array([int(p['max_val']) for p in column_params], dtype=np.int64)
+            # Inverted ranges collapse to min_val instead of failing the whole group
+            return rng.integers(low, np.maximum(high, low), endpoint=True).tolist()
+        if ptype == 'float':
+            low = np.array([p['min_val'] for p in column_params], dtype=np.float64)
+            high = np.array([p['max_val'] for p in column_params], dtype=np.float64)
+            draws = low + rng.random(n) * (high - low)
+            return self._round_draws(ptype, draws, column_params)
+        if ptype == 'bool':
+            return (rng.random(n) < 0.5).tolist()
+        if ptype == 'timestamp':
+            return [iso_now] * n
+        if ptype == 'string':
+            return [p.get('string_value', "") for p in column_params]
+        return None
+
+    def _round_draws(self, ptype: str, draws, column_params: List[Dict]) -> List[Any]:
+        """Float draws as the param type: ints, or floats at each param's precision"""
+        if ptype == 'int':
+            return np.rint(draws).astype(np.int64).tolist()
+        precisions = [p['precision'] for p in column_params]
+        if len(set(precisions)) == 1:
+            return _round_column(draws, precisions[0]).tolist()
+        # Mixed precision within a column: round each precision's rows separately
+        out = draws.astype(object)
+        prec_array = np.array([-1 if p is None else p for p in precisions])
+        for prec in set(precisions):
+            mask = prec_array == (-1 if prec is None else prec)
+            out[mask] = _round_column(draws[mask], prec).tolist()
+        return out.tolist()
+
+def _round_column(draws, precision):
+    """Same result types as round(): precision None yields ints"""
+    if precision is None:
+        return np.rint(draws).astype(np.int64)
+    return np.round(draws, precision)
@@ -0,0 +1,128 @@
+import math
+from typing import Dict, Optional
+
+import paho.mqtt.client as mqtt
+
+# Tokens a bucket can hold, in seconds of the current rate (how far a lull can be made up)
+BUCKET_DEPTH_S = 0.25
+# Achieved rate is measured over windows of this length
+RATE_WINDOW_S = 1.0
+
+def phase_rate(phase: Dict, t: float, start_rate: float) -> float:
+    """Target msgs/s t seconds into a phase; start_rate is where the previous phase ended"""
+    kind = phase['type']
+    if kind == 'ramp':
+        begin = phase['from_rate'] if phase.get('from_rate') is not None else start_rate
+        return begin + (phase['to_rate'] - begin) * min(t / phase['duration_s'], 1.0)
+    if kind == 'burst':
+        # Base rate, with burst_rate for the first burst_s of every period_s
+        in_burst = t % phase['period_s'] < phase['burst_s']
+        return phase['burst_rate'] if in_burst else phase['rate']
+    if kind == 'diurnal':
+        # Cosine day curve peaking at peak_s into each period
+        low, high = phase['min_rate'], phase['max_rate']
+        angle = 2 * math.pi * (t - (phase.get('peak_s') or 0.0)) / phase['period_s']
+        return low + (high - low) * (1 + math.cos(angle)) / 2
+    return phase['rate'] # soak
+
+
+class TokenBucket:
+    """Admits publishes at a rate that may change every refill"""
+
+    def __init__(self, depth_s: float = BUCKET_DEPTH_S):
+        self.depth_s = depth_s
+        self.tokens = 0.0
+        self._last: Optional[float] = None
+
+    def refill(self, now: float, rate: float):
+        if self._last is not None:
+            capacity = max(rate * self.depth_s, 1.0)
+            self.tokens = min(self.tokens + (now - self._last) * rate, capacity)
+        self._last = now
+
+    def take(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class ProfileRunner:
+    """One load profile in progress: target rate over time, its token bucket and counters.
+
+    share scales every rate, for engines that run a fraction of the fleet
+    (worker shards). A finished profile (non-looping, past its last phase)
+    stops limiting.
+    """
+
+    def __init__(self, profile: Dict, now: float, share: float = 1.0):
+        self.profile = profile
+        self.name = profile['name']
+        self.match = profile.get('match')
+        self.share = share
+        self.started = now
+        self.duration_s = sum(phase['duration_s'] for phase in profile['phases'])
+        self.bucket = TokenBucket()
+        self.bucket.refill(now, 0.0) # Tokens accrue from the start
+        self.target = 0.0
+        self.phase = 0
+        self.finished = False
+        self.admitted = 0
+        self.throttled = 0
+        self.achieved = 0.0
+        self._window_start = now
+        self._window_admitted = 0
+
+    def covers(self, publish_topic: str) -> bool:
+        return self.match is None or mqtt.topic_matches_sub(self.match, publish_topic)
+
+    def target_at(self, now: float) -> Optional[float]:
+        """Target msgs/s (this engine's share), or None once finished"""
+        elapsed = now - self.started
+        if elapsed >= self.duration_s:
+            if not self.profile.get('loop'):
+                return None
+            elapsed %= self.duration_s
+        rate = 0.0
+        for index, phase in enumerate(self.profile['phases']):
+            if elapsed < phase['duration_s']:
+                self.phase = index
+                return phase_rate(phase, elapsed, rate) * self.share
+            rate = phase_rate(phase, phase['duration_s'], rate)
+            elapsed -= phase['duration_s']
+        return rate * self.share
+
+    def refill(self, now: float):
+        target = self.target_at(now)
+        if target is None:
+            self.finished = True
+            self.target = 0.0
+        else:
+            self.target = target
+            self.bucket.refill(now, target)
+        if now - self._window_start >= RATE_WINDOW_S:
+            self.achieved = (self.admitted - self._window_admitted) / (now - self._window_start)
+            self._window_start = now
+            self._window_admitted = self.admitted
+
+    def admit(self) -> bool:
+        if self.finished:
+            return True
+        if self.bucket.take():
+            self.admitted += 1
+            return True
+        self.throttled += 1
+        return False
+
+    def state(self, now: float) -> Dict:
+        return {
+            "name": self.name,
+            "match": self.match,
+            "phase": self.phase,
+            "elapsed_s": round(now - self.started, 3),
+            "finished": self.finished,
+            "target_rate": round(self.target, 3),
+            "achieved_rate": round(self.achieved, 3),
+            "admitted": self.admitted,
+            "throttled": self.throttled,
+        }
@@ -0,0 +1,109 @@
+import json
+import logging
+from string import Template
+from typing import Any, Dict, List, Optional, Tuple
+
+import paho.mqtt.client as mqtt
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+def _path(field: Optional[str]) -> Tuple[str, ...]:
+    return tuple(field.split(".")) if field else ()
+
+def lookup(document: Any, path: Tuple[str, ...]) -> Any:
+    """Value at a dotted path of a decoded JSON payload (_MISSING if absent)"""
+    for key in path:
+        if not isinstance(document, dict) or key not in document:
+            return _MISSING
+        document = document[key]
+    return document
+
+def _as_text(value: Any) -> str:
+    """JSON scalars as they'd be written in a rule's equals: true, 21.5, on"""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+class CompiledRule:
+    """One device rule with its topic filter, field path and reply template prepared"""
+
+    __slots__ = ("action", "topic", "path", "equals", "param_name", "value_path",
+                 "interval_ms", "min_val", "max_val", "reply_topic", "reply_template")
+
+    def __init__(self, rule: Dict, device: Dict):
+        self.action = rule["action"]
+        self.topic = rule.get("topic")
+        self.path = _path(rule.get("field"))
+        self.equals = rule.get("equals")
+        self.param_name = rule.get("param_name")
+        self.value_path = _path(rule.get("value_field"))
+        self.interval_ms = rule.get("interval_ms")
+        self.min_val = rule.get("min_val")
+        self.max_val = rule.get("max_val")
+        reply_topic = rule.get("reply_topic") or f"{device['publish_topic']}/reply"
+        self.reply_topic = reply_topic.replace("{uuid}", device["uuid"]).replace("{name}", device["name"])
+        self.reply_template = Template(rule["reply_payload"]) if rule.get("reply_payload") else None
+
+    @property
+    def needs_document(self) -> bool:
+        return bool(self.path or self.value_path or self.action == "reply")
+
+    def matches(self, topic: str, document: Any) -> bool:
+        if self.topic is not None and not mqtt.topic_matches_sub(self.topic, topic):
+            return False
+        if not self.path:
+            return True
+        value = lookup(document, self.path)
+        if value is _MISSING:
+            return False
+        return self.equals is None or _as_text(value) == self.equals
+
+    def value(self, document: Any) -> Optional[float]:
+        """The number taken from the payload (value_field), or None"""
+        if not self.value_path:
+            return None
+        value = lookup(document, self.value_path)
+        if isinstance(value, bool) or value is _MISSING:
+            return None
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+
+class RuleSet:
+    """A device's rules, evaluated in order against each message it receives"""
+
+    def __init__(self, device: Dict, rules: List[Dict]):
+        self.device = device
+        self.rules = [CompiledRule(rule, device) for rule in rules]
+        self.needs_document = any(rule.needs_document for rule in self.rules)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def evaluate(self, topic: str, payload: str) -> Tuple[Any, List[CompiledRule]]:
+        """(decoded payload, matching rules); the payload is decoded once, and only if a rule looks inside"""
+        document = None
+        if self.needs_document:
+            try:
+                document = json.loads(payload)
+            except ValueError:
+                document = payload # Not JSON: only rules without a field can match
+        return document, [rule for rule in self.rules if rule.matches(topic, document)]
+
+    def reply(self, rule: CompiledRule, topic: str, payload: str, document: Any, iso_now: str) -> str:
+        """Payload of a reply rule's response"""
+        if rule.reply_template is None:
+            return json.dumps({
+                "device_id": self.device["name"],
+                "time": iso_now,
+                "topic": topic,
+                "request": document,
+            })
+        fields = {key: _as_text(value) for key, value in document.items()} if isinstance(document, dict) else {}
+        fields.update(uuid=self.device["uuid"], name=self.device["name"], topic=topic, payload=payload, time=iso_now)
+        return rule.reply_template.safe_substitute(fields)
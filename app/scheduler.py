@@ -0,0 +1,138 @@
+import heapq
+import itertools
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class DeviceScheduler:
+    """Min-heap of device deadlines (monotonic seconds).
+
+    Only devices that are due get popped. Stale heap entries left behind by
+    remove/interval changes are skipped lazily instead of rebuilding the heap.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, str]] = []
+        self._live: Dict[str, Tuple[float, int]] = {}  # UUID -> (due, token) of the current heap entry
+        self._intervals: Dict[str, float] = {}  # UUID -> interval in seconds
+        self._phases: Dict[str, int] = {}  # UUID -> phase offset in ms
+        self._anchors: Dict[str, float] = {}  # UUID -> grid deadline to resume after a deferred retry
+        self._tokens = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def __contains__(self, uuid: str) -> bool:
+        return uuid in self._live
+
+    def _push(self, uuid: str, due: float):
+        token = next(self._tokens)
+        self._live[uuid] = (due, token)
+        heapq.heappush(self._heap, (due, token, uuid))
+
+    def schedule(self, uuid: str, interval_ms: int, now: Optional[float] = None, phase_ms: Optional[int] = None):
+        """Add a device, or update its interval and phase.
+
+        phase_ms delays the first publish of a new device (modulo its interval) so
+        devices sharing an interval don't all fire on the same tick. For a
+        scheduled device a new interval keeps the phase, and a new phase_ms
+        shifts the deadline grid by the difference (None keeps the phase).
+        """
+        if now is None:
+            now = time.monotonic()
+        interval = max(interval_ms, 1) / 1000.0
+        old_interval = self._intervals.get(uuid)
+        self._intervals[uuid] = interval
+        old_phase = self._phases.get(uuid, 0)
+        if phase_ms is None:
+            phase_ms = old_phase # Keep the current phase
+        self._phases[uuid] = phase_ms
+
+        if uuid not in self._live:
+            # New devices publish straight away unless given a phase offset
+            offset = (phase_ms % max(interval_ms, 1)) / 1000.0
+            self._push(uuid, now + offset)
+            return
+        # A pending deferred retry is measured from the grid slot it stands in for
+        due = self._anchors.get(uuid, self._live[uuid][0])
+        next_due = due
+        if old_interval != interval:
+            # Anchor the new interval on the last publish so the phase is kept
+            next_due = max(due - old_interval + interval, now)
+        if phase_ms != old_phase:
+            next_due += ((phase_ms - old_phase) % max(interval_ms, 1)) / 1000.0
+            if next_due - interval >= now:
+                next_due -= interval # The earliest slot of the shifted grid
+        if next_due != due:
+            self._anchors.pop(uuid, None)
+            self._push(uuid, next_due)
+
+    def defer(self, uuid: str, retry_at: float) -> bool:
+        """Retry a just-popped device at retry_at without moving its phase grid.
+
+        Returns False when the retry would not happen before the device's next
+        regular deadline; that publish is then simply skipped.
+        """
+        if uuid not in self._live:
+            return False
+        grid_due = self._anchors.get(uuid, self._live[uuid][0])
+        if retry_at >= grid_due:
+            return False
+        self._anchors[uuid] = grid_due
+        self._push(uuid, retry_at)
+        return True
+
+    def reschedule(self, uuid: str, due: float):
+        """Override a device's next deadline (e.g. the next row of a timestamped CSV replay)"""
+        if uuid in self._live:
+            self._anchors.pop(uuid, None)
+            self._push(uuid, due)
+
+    def remove(self, uuid: str):
+        self._intervals.pop(uuid, None)
+        self._phases.pop(uuid, None)
+        self._anchors.pop(uuid, None)
+        self._live.pop(uuid, None)
+        # Stale heap entries are dropped when they surface; compact if they dominate
+        if len(self._heap) > 64 and len(self._heap) > 4 * len(self._live):
+            self._compact()
+
+    def _compact(self):
+        self._heap = [(due, token, uuid) for uuid, (due, token) in self._live.items()]
+        heapq.heapify(self._heap)
+
+    def next_due(self) -> Optional[float]:
+        """Deadline of the earliest live entry, or None when nothing is scheduled."""
+        heap = self._heap
+        while heap:
+            due, token, uuid = heap[0]
+            if self._live.get(uuid, (None, None))[1] == token:
+                return due
+            heapq.heappop(heap)
+        return None
+
+    def pop_due(self, now: Optional[float] = None) -> List[Tuple[str, float]]:
+        """Pop every device whose deadline has passed and queue its next deadline.
+
+        Returns (uuid, due) pairs. Next deadlines stay on the device's phase grid
+        (due + k * interval), so publish times don't drift with loop overhead.
+        """
+        if now is None:
+            now = time.monotonic()
+        heap = self._heap
+        due_entries = []
+        while heap and heap[0][0] <= now:
+            due, token, uuid = heapq.heappop(heap)
+            if self._live.get(uuid, (None, None))[1] != token:
+                continue
+            due_entries.append((uuid, due))
+
+        for uuid, due in due_entries:
+            interval = self._intervals[uuid]
+            # A deferred retry resumes the regular grid
+            next_due = self._anchors.pop(uuid, due + interval)
+            if next_due <= now:
+                # Fell behind by more than one interval: skip missed slots, keep phase
+                next_due += interval * (int((now - next_due) / interval) + 1)
+            self._push(uuid, next_due)
+        return due_entries
@@ -0,0 +1,187 @@
+import math
+import random
+from array import array
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # Optional: without NumPy signals are computed one value at a time
+    np = None
+
+# Per-parameter signal shapes for numeric (int/float) RANDOM params:
+#   uniform      independent draws between min_val and max_val (the default)
+#   random_walk  moves up to step per publish, bounded by the range
+#   sine         min..max sinusoid with period_s, shifted by phase_s
+#   drift        moves step per publish, wrapping around the range (sawtooth)
+#   step         holds a random level for period_s, then jumps to a new one
+#   spike        flat at mid-range, with spikes (see spike_prob)
+#   gaussian     normal around mid-range, standard deviation noise
+# Any of them can add Gaussian noise (std noise) and spikes of one range width
+# up or down with probability spike_prob per publish.
+GENERATORS = ('uniform', 'random_walk', 'sine', 'drift', 'step', 'spike', 'gaussian')
+# Generators whose next value depends on the previous one
+STATEFUL = ('random_walk', 'drift', 'step')
+
+DEFAULT_PERIOD_S = 60.0
+DEFAULT_WALK_STEP = 0.05  # Fraction of the range
+DEFAULT_DRIFT_STEP = 0.01  # Fraction of the range
+DEFAULT_SPIKE_PROB = 0.01  # spike generator only
+DEFAULT_GAUSSIAN_SIGMAS = 3.0  # gaussian: half the range is this many standard deviations
+
+def generator_of(param: Dict) -> str:
+    """Signal generator of a param; rows from older databases have none"""
+    if param['type'] not in ('int', 'float'):
+        return 'uniform'
+    return param.get('generator') or 'uniform'
+
+
+class SignalState:
+    """Generator state for one payload schema: a row per device, a column per param.
+
+    Levels and their last change time live in two flat float arrays (NaN =
+    not started), so thousands of devices cost two arrays, not an object each.
+    """
+
+    def __init__(self, width: int):
+        self.width = width
+        self.slots: Dict[str, int] = {}
+        self._free: List[int] = []
+        self.values = array('d')
+        self.since = array('d')
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def row(self, uuid: str) -> int:
+        slot = self.slots.get(uuid)
+        if slot is not None:
+            return slot
+        if self._free:
+            slot = self._free.pop()
+            start = slot * self.width
+            for i in range(start, start + self.width):
+                self.values[i] = math.nan
+                self.since[i] = 0.0
+        else:
+            slot = len(self.values) // self.width
+            self.values.extend([math.nan] * self.width)
+            self.since.extend([0.0] * self.width)
+        self.slots[uuid] = slot
+        return slot
+
+    def release(self, uuid: str):
+        slot = self.slots.pop(uuid, None)
+        if slot is not None:
+            self._free.append(slot)
+
+    def views(self):
+        """(values, since) as writable (rows, width) NumPy arrays over the same memory"""
+        shape = (-1, self.width)
+        return (np.frombuffer(self.values, dtype=np.float64).reshape(shape),
+                np.frombuffer(self.since, dtype=np.float64).reshape(shape))
+
+
+def _wrap(value: float, lo: float, hi: float) -> float:
+    span = hi - lo
+    return lo + (value - lo) % span if span > 0 else lo
+
+def next_value(p: Dict, now: float, state: Optional[SignalState] = None, slot: int = 0, column: int = 0) -> float:
+    """Scalar path: the next value of one numeric param (a fresh start without state)"""
+    generator = generator_of(p)
+    lo, hi = p['min_val'], p['max_val']
+    mid, half = (lo + hi) / 2, (hi - lo) / 2
+    index = slot * state.width + column if state is not None else None
+    previous = state.values[index] if state is not None else math.nan
+    noise = p.get('noise') or 0.0
+
+    if generator == 'random_walk':
+        step = p.get('step') or (hi - lo) * DEFAULT_WALK_STEP
+        value = mid if math.isnan(previous) else min(max(previous + random.uniform(-step, step), lo), hi)
+    elif generator == 'sine':
+        period = p.get('period_s') or DEFAULT_PERIOD_S
+        value = mid + half * math.sin(2 * math.pi * (now + (p.get('phase_s') or 0.0)) / period)
+    elif generator == 'drift':
+        step = p.get('step') or (hi - lo) * DEFAULT_DRIFT_STEP
+        if math.isnan(previous):
+            value = lo if step >= 0 else hi
+        else:
+            value = _wrap(previous + step, lo, hi)
+    elif generator == 'step':
+        hold = p.get('period_s') or DEFAULT_PERIOD_S
+        if math.isnan(previous) or now - state.since[index] >= hold:
+            value = random.uniform(lo, hi)
+            if state is not None:
+                state.since[index] = now
+        else:
+            value = previous
+    elif generator == 'gaussian':
+        value = random.gauss(mid, noise or half / DEFAULT_GAUSSIAN_SIGMAS)
+        noise = 0.0 # Already the spread
+    elif generator == 'spike':
+        value = mid
+    else:
+        value = random.uniform(lo, hi)
+
+    if state is not None and generator in STATEFUL:
+        state.values[index] = value
+    if noise:
+        value += random.gauss(0.0, noise)
+    spike_prob = p.get('spike_prob')
+    if spike_prob is None and generator == 'spike':
+        spike_prob = DEFAULT_SPIKE_PROB
+    if spike_prob and random.random() < spike_prob:
+        value += (hi - lo) * random.choice((-1, 1))
+    return value
+
+
+def _column(params: List[Dict], name: str, default):
+    """A per-device setting as an array, missing ones replaced by default (scalar or array)"""
+    raw = np.array([math.nan if p.get(name) is None else p[name] for p in params], dtype=np.float64)
+    return np.where(np.isnan(raw), default, raw)
+
+def signal_column(generator: str, params: List[Dict], state: SignalState, rows, column: int, now: float, rng):
+    """Batch path: next values of one param for many devices of a schema, as a float array"""
+    n = len(params)
+    lo = np.array([p['min_val'] for p in params], dtype=np.float64)
+    hi = np.array([p['max_val'] for p in params], dtype=np.float64)
+    mid, half = (lo + hi) / 2, (hi - lo) / 2
+    noise = _column(params, 'noise', 0.0)
+    values, since = state.views()
+    previous = values[rows, column]
+    fresh = np.isnan(previous)
+
+    if generator == 'random_walk':
+        step = _column(params, 'step', (hi - lo) * DEFAULT_WALK_STEP)
+        value = np.where(fresh, mid, np.clip(previous + rng.uniform(-1.0, 1.0, n) * step, lo, hi))
+    elif generator == 'sine':
+        period = _column(params, 'period_s', DEFAULT_PERIOD_S)
+        phase = _column(params, 'phase_s', 0.0)
+        value = mid + half * np.sin(2 * np.pi * (now + phase) / period)
+    elif generator == 'drift':
+        step = _column(params, 'step', (hi - lo) * DEFAULT_DRIFT_STEP)
+        span = hi - lo
+        wrapped = np.where(span > 0, lo + np.mod(previous + step - lo, np.where(span > 0, span, 1.0)), lo)
+        value = np.where(fresh, np.where(step >= 0, lo, hi), wrapped)
+    elif generator == 'step':
+        hold = _column(params, 'period_s', DEFAULT_PERIOD_S)
+        jump = fresh | (now - since[rows, column] >= hold)
+        value = np.where(jump, lo + rng.random(n) * (hi - lo), previous)
+        since[rows[jump], column] = now
+    elif generator == 'gaussian':
+        spread = np.where(noise > 0, noise, half / DEFAULT_GAUSSIAN_SIGMAS)
+        value = mid + rng.standard_normal(n) * spread
+        noise = None
+    elif generator == 'spike':
+        value = mid.copy()
+    else:
+        value = lo + rng.random(n) * (hi - lo)
+
+    if generator in STATEFUL:
+        values[rows, column] = value
+    if noise is not None and noise.any():
+        value = value + rng.standard_normal(n) * noise
+    spike_prob = _column(params, 'spike_prob', DEFAULT_SPIKE_PROB if generator == 'spike' else 0.0)
+    if spike_prob.any():
+        hits = rng.random(n) < spike_prob
+        value = value + hits * (hi - lo) * rng.choice((-1.0, 1.0), n)
+    return value
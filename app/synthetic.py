@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import math
+import time
+from array import array
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import paho.mqtt.client as mqtt
+
+from app.encoders import PayloadEncoder
+from app.metrics import Histogram
+from app.payloads import BatchPayloadGenerator
+from app.transport import MqttTransport
+
+logger = logging.getLogger(__name__)
+
+# Most messages published between yields to the event loop
+SYNTHETIC_BATCH = 1000
+# A deficit older than this is written off (counted as missed) instead of being sent in one burst
+MAX_BACKLOG_S = 1.0
+# Achieved rate and CPU use are measured over windows of this length
+WINDOW_S = 1.0
+# CPU use (of one core) at which the run is reported as saturated
+SATURATION_CPU = 0.9
+
+def fan_out(rate: float, interval_ms: int) -> int:
+    """Virtual devices needed to reach rate msgs/s when each publishes every interval_ms"""
+    return max(1, math.ceil(rate * interval_ms / 1000.0))
+
+
+class SyntheticLoad:
+    """Publishes rate msgs/s from virtual devices that exist only as indexes.
+
+    Device n publishes to topic.format(n=n) as name.format(n=n), in turn with
+    all the others. The send loop is closed on the ideal timeline: each pass
+    publishes every message that should have gone out by now (at most
+    SYNTHETIC_BATCH before yielding), so time lost to a slow pass is made up
+    on the next; a deficit beyond MAX_BACKLOG_S is dropped and counted.
+
+    Sharded engines run every shard_count-th device, starting at shard_index,
+    at the matching share of the rate.
+
+    QoS 1/2 runs respect each connection's in-flight window like device
+    publishes: with qos_policy "defer" the pass stops and is retried after
+    defer_s, with "skip" the message is dropped (counted as missed).
+    """
+
+    def __init__(self, config: Dict, transports: Callable[[], List[MqttTransport]],
+                 encoder_backend: str = "template", shard_index: int = 0, shard_count: int = 1,
+                 qos_policy: str = "defer", defer_s: float = 0.01):
+        self.config = config
+        self.qos_policy = qos_policy
+        self.defer_s = defer_s
+        self.transports = transports
+        self.devices = config['devices'] or fan_out(config['rate'], config['interval_ms'])
+        # This shard's devices: shard_index, shard_index + shard_count, ...
+        self.indexes = range(shard_index, self.devices, shard_count)
+        self.rate = config['rate'] * len(self.indexes) / self.devices
+        self.params = config['params']
+        fields = PayloadEncoder.compile({"name": ""}, params=self.params).fields
+        fields["device_id"] = ("value", None) # Set per virtual device
+        self.encoder = PayloadEncoder(fields, encoder_backend)
+        self.generator = BatchPayloadGenerator()
+        self.sequences = array('q', [0]) * len(self.indexes)
+        self.latency = Histogram() # Seconds between a message's slot on the ideal timeline and its publish
+        self.sent = 0
+        self.bytes = 0
+        self.missed = 0
+        self.errors = 0
+        self.started: Optional[float] = None
+        self.finished = False
+        self.achieved = 0.0
+        self.cpu = 0.0
+        self.falling_behind = False # Backlog was written off in the last window
+        self._window = (0.0, 0.0, 0, 0) # (wall, cpu, sent, missed) at the window start
+        self._task: Optional[asyncio.Task] = None
+        self.on_published: Optional[Callable[[int], None]] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.finished = True
+
+    async def _run(self):
+        start = self.started = time.monotonic()
+        self._window = (start, time.process_time(), 0, 0)
+        duration = self.config.get('duration_s')
+        if not self.indexes:
+            self.finished = True
+            return
+        try:
+            while duration is None or time.monotonic() - start < duration:
+                now = time.monotonic()
+                self._measure(now)
+                issued = self.sent + self.missed + self.errors
+                due = int((now - start) * self.rate) - issued
+                # At least one message, or rates below 1/MAX_BACKLOG_S would write everything off
+                backlog = max(1, int(self.rate * MAX_BACKLOG_S))
+                if due > backlog:
+                    self.missed += due - backlog
+                    issued += due - backlog
+                    due = backlog
+                if due <= 0:
+                    # Next message's slot, or the end of the run if that comes first
+                    wait = (issued + 1) / self.rate - (now - start)
+                    if duration is not None:
+                        wait = min(wait, duration - (now - start))
+                    await asyncio.sleep(max(wait, 0.0005))
+                    continue
+                count = min(due, SYNTHETIC_BATCH)
+                self.latency.observe(now - start - issued / self.rate) # Oldest message of the batch
+                if await self._publish(issued, count):
+                    await asyncio.sleep(self.defer_s) # In-flight window full: let acknowledgements arrive
+                else:
+                    await asyncio.sleep(0)
+        except Exception as e:
+            logger.error(f"Synthetic load stopped: {e}")
+        finally:
+            self.finished = True
+
+    async def _publish(self, first: int, count: int) -> bool:
+        """Publish messages first .. first + count - 1 of the timeline, round-robin over this shard's devices.
+
+        Returns True if a full in-flight window deferred the rest of the batch.
+        """
+        config = self.config
+        shard_size = len(self.indexes)
+        slots = [(first + i) % shard_size for i in range(count)]
+        names = [config['name'].format(n=self.indexes[slot]) for slot in slots]
+        iso_now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        values = self.generator.generate([(name, self.params) for name in names], iso_now)
+        transports = self.transports()
+        published = 0
+        sent_bytes = 0
+        deferred = False
+        for slot, name in zip(slots, names):
+            n = self.indexes[slot]
+            transport = transports[n % len(transports)]
+            if config['qos'] and transport.inflight.full():
+                if self.qos_policy == "defer":
+                    # The rest of the batch stays due and goes out on a later pass
+                    transport.inflight.deferred += 1
+                    deferred = True
+                    break
+                transport.inflight.dropped += 1
+                self.missed += 1
+                continue
+            if transport.queue_depth >= transport.max_queued:
+                await transport.wait_writable()
+            self.sequences[slot] += 1
+            device_values = values[name]
+            device_values["device_id"] = name
+            try:
+                payload = self.encoder.encode(iso_now, self.sequences[slot], device_values)
+                info = transport.publish(config['topic'].format(n=n), payload, qos=config['qos'])
+                if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                    self.errors += 1
+                    continue
+                published += 1
+                sent_bytes += len(payload)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Synthetic publish failed: {e}")
+        self.sent += published
+        self.bytes += sent_bytes
+        if self.on_published:
+            self.on_published(published)
+        return deferred
+
+    def _measure(self, now: float):
+        wall, cpu, sent, missed = self._window
+        if now - wall >= WINDOW_S:
+            cpu_now = time.process_time()
+            self.achieved = (self.sent - sent) / (now - wall)
+            self.cpu = (cpu_now - cpu) / (now - wall)
+            self.falling_behind = self.missed > missed
+            self._window = (now, cpu_now, self.sent, self.missed)
+
+    def state(self) -> Dict:
+        return {
+            "running": not self.finished,
+            "target_rate": round(self.rate, 3),
+            "achieved_rate": round(self.achieved, 3),
+            "devices": len(self.indexes),
+            "sent": self.sent,
+            "bytes": self.bytes,
+            "missed": self.missed,
+            "errors": self.errors,
+            "elapsed_s": round(time.monotonic() - self.started, 3) if self.started else 0.0,
+            "cpu_percent": round(self.cpu * 100, 1),
+            # Can't keep up: the loop is CPU-bound or writing off backlog
+            "saturated": self.cpu >= SATURATION_CPU or self.falling_behind,
+            "publish_latency": self.latency.state(),
+        }
+
@@ -0,0 +1,103 @@
+from typing import Any, Dict, Hashable, List, Set
+
+
+class _Node:
+    __slots__ = ("children", "subscribers")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.subscribers: Set[Hashable] = set()
+
+
+class TopicTrie:
+    """MQTT subscription filters indexed by level, for routing inbound messages.
+
+    Filters may use the + (one level) and # (this level and everything below)
+    wildcards. match() walks one branch per topic level (plus the wildcard
+    branches), so its cost depends on topic depth, not on how many filters
+    are registered. As in MQTT, wildcards at the first level don't match
+    $-prefixed topics such as $SYS/...
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._filters: Dict[str, int] = {}  # filter -> number of subscribers
+
+    def __len__(self) -> int:
+        return len(self._filters)
+
+    def __contains__(self, topic_filter: str) -> bool:
+        return topic_filter in self._filters
+
+    def add(self, topic_filter: str, subscriber: Hashable):
+        node = self._root
+        for level in topic_filter.split("/"):
+            node = node.children.setdefault(level, _Node())
+        if subscriber not in node.subscribers:
+            node.subscribers.add(subscriber)
+            self._filters[topic_filter] = self._filters.get(topic_filter, 0) + 1
+
+    def remove(self, topic_filter: str, subscriber: Hashable) -> bool:
+        """Drop one subscription; empty branches are pruned. False if it wasn't there."""
+        path = [self._root]
+        for level in topic_filter.split("/"):
+            node = path[-1].children.get(level)
+            if node is None:
+                return False
+            path.append(node)
+        node = path[-1]
+        if subscriber not in node.subscribers:
+            return False
+        node.subscribers.discard(subscriber)
+        count = self._filters[topic_filter] - 1
+        if count:
+            self._filters[topic_filter] = count
+        else:
+            del self._filters[topic_filter]
+
+        levels = topic_filter.split("/")
+        for depth in range(len(levels), 0, -1):
+            child = path[depth]
+            if child.subscribers or child.children:
+                break
+            del path[depth - 1].children[levels[depth - 1]]
+        return True
+
+    def subscribers(self, topic_filter: str) -> Set[Hashable]:
+        """Subscribers registered on exactly this filter"""
+        node = self._root
+        for level in topic_filter.split("/"):
+            node = node.children.get(level)
+            if node is None:
+                return set()
+        return set(node.subscribers)
+
+    def match(self, topic: str) -> Set[Any]:
+        """Every subscriber whose filter matches the topic"""
+        levels = topic.split("/")
+        matched: Set[Any] = set()
+        nodes: List[_Node] = [self._root]
+        for depth, level in enumerate(levels):
+            wildcards = not (depth == 0 and level.startswith("$"))
+            next_nodes = []
+            for node in nodes:
+                if wildcards:
+                    rest = node.children.get("#")
+                    if rest is not None:
+                        matched |= rest.subscribers
+                    plus = node.children.get("+")
+                    if plus is not None:
+                        next_nodes.append(plus)
+                child = node.children.get(level)
+                if child is not None:
+                    next_nodes.append(child)
+            nodes = next_nodes
+            if not nodes:
+                return matched
+        for node in nodes:
+            matched |= node.subscribers
+            # "a/#" also matches "a" itself
+            rest = node.children.get("#")
+            if rest is not None:
+                matched |= rest.subscribers
+        return matched
@@ -0,0 +1,346 @@
+import abc
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import paho.mqtt.client as mqtt
+
+from app.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+TRANSPORTS = ("asyncio", "thread")
+
+
+class InflightWindow:
+    """Bounded set of QoS 1/2 publishes awaiting PUBACK (QoS 1) or PUBCOMP (QoS 2).
+
+    dropped/deferred are counted by the caller when it hits a full window.
+    """
+
+    def __init__(self, size: int, timeout_s: float = 30.0):
+        self.size = size
+        self.timeout_s = timeout_s
+        self.pending: Dict[int, float] = {} # mid -> send time (insertion order = send order)
+        self.acked = 0
+        self.dropped = 0
+        self.deferred = 0
+        self.expired = 0
+        self.ack_latency = Histogram()
+
+    def full(self, now: Optional[float] = None) -> bool:
+        if len(self.pending) < self.size:
+            return False
+        # Forget publishes the broker will never acknowledge (e.g. lost with the session)
+        if now is None:
+            now = time.monotonic()
+        cutoff = now - self.timeout_s
+        for mid, sent in list(self.pending.items()):
+            if sent > cutoff:
+                break
+            del self.pending[mid]
+            self.expired += 1
+        return len(self.pending) >= self.size
+
+    def add(self, mid: int, now: float):
+        self.pending[mid] = now
+
+    def complete(self, mid: int, now: float):
+        sent = self.pending.pop(mid, None)
+        if sent is not None:
+            self.acked += 1
+            self.ack_latency.observe(now - sent)
+
+    def state(self) -> Dict:
+        return {
+            "window": self.size,
+            "inflight": len(self.pending),
+            "acked": self.acked,
+            "dropped": self.dropped,
+            "deferred": self.deferred,
+            "expired": self.expired,
+            "ack_latency": self.ack_latency.state(),
+        }
+
+
+class MqttTransport(abc.ABC):
+    """One MQTT connection as the engine sees it.
+
+    Wraps a paho client. Whatever the implementation, on_message/on_connect
+    handlers run on the asyncio loop thread, so engine state is never touched
+    from paho's network thread (unless on_message is marked threadsafe, in
+    which case it is called directly from wherever paho receives). Publishing applies backpressure once more than
+    max_queued packets are waiting to be written.
+    """
+
+    def __init__(self, client: mqtt.Client, host: str, port: int, username: Optional[str] = None,
+                 password: Optional[str] = None, keepalive: int = 60, max_queued: int = 10000,
+                 inflight_window: int = 100):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+        self.max_queued = max_queued
+        self.reconnect_min_s = 1.0
+        self.reconnect_max_s = 60.0
+        self.on_message: Optional[Callable[..., Any]] = None # (client, userdata, msg)
+        self.on_message_threadsafe = False # Skip the hand-over to the loop thread for on_message
+        self.on_connect: Optional[Callable[..., Any]] = None # (client, userdata, flags, rc, properties)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._drained = asyncio.Event()
+        self.inflight = InflightWindow(inflight_window)
+        self.client = client
+
+    @property
+    def client(self) -> mqtt.Client:
+        return self._client
+
+    @client.setter
+    def client(self, client: mqtt.Client):
+        self._client = client
+        client.on_message = self._handle_message
+        client.on_connect = self._handle_connect
+        client.on_publish = self._handle_publish
+        # Let paho put the whole window on the wire instead of its default 20
+        client.max_inflight_messages_set(self.inflight.size)
+
+    def reconnect_delay_set(self, min_delay: float, max_delay: float):
+        self.reconnect_min_s = min_delay
+        self.reconnect_max_s = max_delay
+
+    def _handle_message(self, client, userdata, msg):
+        if self.on_message_threadsafe:
+            self.on_message(client, userdata, msg)
+        elif self.on_message:
+            self._dispatch(self.on_message, client, userdata, msg)
+
+    def _handle_connect(self, client, userdata, flags, rc, properties=None):
+        if self.on_connect:
+            self._dispatch(self.on_connect, client, userdata, flags, rc, properties)
+
+    def _handle_publish(self, client, userdata, mid, reason_code=None, properties=None):
+        # Fires on PUBACK/PUBCOMP for QoS 1/2 (and on send for QoS 0, which isn't tracked)
+        self._dispatch(self._publish_complete, mid, time.monotonic())
+
+    def _publish_complete(self, mid: int, now: float):
+        self.inflight.complete(mid, now)
+
+    def _dispatch(self, handler, *args):
+        handler(*args)
+
+    def is_connected(self) -> bool:
+        return self._client.is_connected()
+
+    @property
+    def queue_depth(self) -> int:
+        """Packets queued in paho waiting for the socket"""
+        return len(getattr(self._client, "_out_packet", ()))
+
+    def publish(self, topic: str, payload, qos: int = 0, retain: bool = False) -> mqtt.MQTTMessageInfo:
+        info = self._client.publish(topic, payload, qos=qos, retain=retain)
+        # A refused publish is never acknowledged and would hold its slot for good
+        if qos and info.rc == mqtt.MQTT_ERR_SUCCESS:
+            self.inflight.add(info.mid, time.monotonic())
+        return info
+
+    async def wait_writable(self, timeout: float = 1.0):
+        """Block the publisher while the outgoing queue is over its limit"""
+        while self.queue_depth >= self.max_queued and self.is_connected():
+            self._drained.clear()
+            try:
+                await asyncio.wait_for(self._drained.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def subscribe(self, topic: str, qos: int = 0):
+        return self._client.subscribe(topic, qos)
+
+    def unsubscribe(self, topic: str):
+        return self._client.unsubscribe(topic)
+
+    def _credentials(self):
+        if self.username and self.password:
+            self._client.username_pw_set(self.username, self.password)
+
+    @abc.abstractmethod
+    def connect(self):
+        """Start connecting in the background; on_connect fires once the broker accepts"""
+
+    @abc.abstractmethod
+    def disconnect(self):
+        """Close the connection and stop its network loop"""
+
+
+class ThreadedTransport(MqttTransport):
+    """paho's own network thread (loop_start); callbacks are handed over to the event loop"""
+
+    def _dispatch(self, handler, *args):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            handler(*args)
+        else:
+            loop.call_soon_threadsafe(handler, *args)
+
+    def connect(self):
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._loop = None
+        self._credentials()
+        self._client.reconnect_delay_set(max(1, round(self.reconnect_min_s)), max(1, round(self.reconnect_max_s)))
+        self._client.connect_async(self.host, self.port, self.keepalive)
+        self._client.loop_start()
+
+    def disconnect(self):
+        self._client.disconnect()
+        self._client.loop_stop()
+
+    async def wait_writable(self, timeout: float = 1.0):
+        # The network thread can't set an asyncio.Event; poll instead
+        while self.queue_depth >= self.max_queued and self.is_connected():
+            await asyncio.sleep(0.005)
+
+
+class AsyncioTransport(MqttTransport):
+    """paho driven from the asyncio loop: socket reads/writes via add_reader/add_writer.
+
+    No network thread: receiving, publishing and keepalive all happen on the
+    event loop. Only the blocking TCP connect runs in a worker thread.
+    """
+
+    # Keepalive/ping housekeeping period
+    MISC_INTERVAL_S = 1.0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._fd: Optional[int] = None
+        self._misc_task: Optional[asyncio.Task] = None
+        self._connect_task: Optional[asyncio.Task] = None
+        self._loop_thread: Optional[int] = None
+        self._stopping = False
+
+    @property
+    def client(self) -> mqtt.Client:
+        return self._client
+
+    @client.setter
+    def client(self, client: mqtt.Client):
+        MqttTransport.client.fset(self, client)
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    def _on_loop(self, fn, *args):
+        # Socket callbacks also fire from the connect thread
+        if threading.get_ident() == self._loop_thread:
+            fn(*args)
+        elif self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(fn, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._on_loop(self._register_reader, sock.fileno())
+
+    def _register_reader(self, fd: int):
+        self._fd = fd
+        self._loop.add_reader(fd, self._client.loop_read)
+        if self._misc_task is None or self._misc_task.done():
+            self._misc_task = self._loop.create_task(self._misc_loop())
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._on_loop(self._socket_closed)
+
+    def _socket_closed(self):
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            self._loop.remove_writer(self._fd)
+            self._fd = None
+        if self._misc_task:
+            self._misc_task.cancel()
+            self._misc_task = None
+        self._drained.set()
+        if not self._stopping:
+            self._start_connect(reconnect=True)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._on_loop(self._register_writer, sock.fileno())
+
+    def _register_writer(self, fd: int):
+        if fd == self._fd or self._fd is None:
+            self._loop.add_writer(fd, self._on_writable)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._on_loop(self._unregister_writer)
+
+    def _unregister_writer(self):
+        if self._fd is not None:
+            self._loop.remove_writer(self._fd)
+        self._drained.set()
+
+    def _on_writable(self):
+        self._client.loop_write()
+        if self.queue_depth < self.max_queued // 2:
+            self._drained.set()
+
+    async def _misc_loop(self):
+        while self._client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(self.MISC_INTERVAL_S)
+
+    def connect(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stopping = False
+        self._credentials()
+        self._start_connect(reconnect=False)
+
+    def _start_connect(self, reconnect: bool):
+        if self._connect_task is None or self._connect_task.done():
+            self._connect_task = self._loop.create_task(self._connect_loop(reconnect))
+
+    async def _connect_loop(self, reconnect: bool):
+        # Jittered exponential backoff so a fleet of connections doesn't retry in lockstep
+        delay = self.reconnect_min_s * random.uniform(1.0, 2.0)
+        if reconnect:
+            await asyncio.sleep(delay)
+        while not self._stopping:
+            try:
+                if reconnect:
+                    await asyncio.to_thread(self._client.reconnect)
+                else:
+                    await asyncio.to_thread(self._client.connect, self.host, self.port, self.keepalive)
+                return
+            except Exception as e:
+                logger.warning(f"MQTT connect to {self.host}:{self.port} failed: {e}; retrying in {delay:.1f}s")
+                # connect() stored host/port before failing; later attempts only need reconnect()
+                reconnect = True
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.reconnect_max_s) * random.uniform(0.8, 1.2)
+
+    def disconnect(self):
+        self._stopping = True
+        if self._connect_task:
+            self._connect_task.cancel()
+            self._connect_task = None
+        if self._fd is not None:
+            self._client.disconnect()
+            # Flush the DISCONNECT packet; paho closes the socket once it is written
+            self._client.loop_write()
+            if self._fd is not None:
+                self._socket_closed()
+        if self._misc_task:
+            self._misc_task.cancel()
+            self._misc_task = None
+
+
+def make_transport(kind: str, client_id: str, host: str, port: int, **kwargs) -> MqttTransport:
+    """kind: asyncio (default, no network thread) or thread (paho loop_start)"""
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+    if kind == "thread":
+        return ThreadedTransport(client, host, port, **kwargs)
+    if kind != "asyncio":
+        logger.warning(f"Unknown MQTT transport '{kind}', using asyncio")
+    return AsyncioTransport(client, host, port, **kwargs)
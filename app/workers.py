@@ -0,0 +1,191 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# How long the coordinator waits for a worker to answer a control command
+CONTROL_TIMEOUT_S = 10.0
+
+def shard_of(uuid: str, shard_count: int) -> int:
+    """Stable device -> worker assignment (same in every process, unlike hash())"""
+    return zlib.crc32(uuid.encode()) % shard_count
+
+def run_worker(shard_index: int, shard_count: int, conn, db_path: str, events_conn=None, listening=None):
+    """Process entry point: one event loop, one MQTT client and one engine per shard"""
+    import app.database
+    app.database.DB_PATH = db_path
+    try:
+        asyncio.run(_worker_main(shard_index, shard_count, conn, events_conn, listening))
+    except KeyboardInterrupt:
+        pass
+
+async def _worker_main(shard_index: int, shard_count: int, conn, events_conn=None, listening=None):
+    from app.engine import SimulationEngine
+    from app.events import EventForwarder, hub
+
+    if events_conn is not None:
+        # Device and message events go to the coordinator's hub, where the SSE clients are
+        hub.forwarder = EventForwarder(events_conn, listening)
+        hub.forwarder.start()
+    engine = SimulationEngine(shard_index=shard_index, shard_count=shard_count)
+    await engine.start()
+    loop = asyncio.get_running_loop()
+    try:
+        while engine.running:
+            try:
+                command = await loop.run_in_executor(None, conn.recv)
+            except (EOFError, OSError):
+                # Coordinator went away
+                break
+            reply = await handle_command(engine, command)
+            # Echoed so the coordinator can drop replies to commands it gave up on
+            reply["seq"] = command.get("seq")
+            conn.send(reply)
+            if command.get("op") == "stop":
+                break
+    finally:
+        if engine.running:
+            await engine.stop()
+        if hub.forwarder is not None:
+            await hub.forwarder.stop()
+
+async def handle_command(engine, command: Dict[str, Any]) -> Dict[str, Any]:
+    """Execute one control-channel command against a worker's engine"""
+    op = command.get("op")
+    try:
+        if op == "stats":
+            return {"ok": True, "stats": engine.local_stats()}
+        if op == "messages":
+            return {"ok": True, "messages": await engine.device_messages(command.get("uuids"), command.get("limit", 5))}
+        if op == "query_messages":
+            return {"ok": True, "messages": await engine.query_messages(**command["query"])}
+        if op == "reload":
+            await engine.device_changed(command["uuid"])
+            return {"ok": True}
+        if op == "remove":
+            await engine.device_removed(command["uuid"])
+            return {"ok": True}
+        if op == "set_load_profile":
+            await engine.set_load_profile(command["profile"])
+            return {"ok": True}
+        if op == "clear_load_profile":
+            return {"ok": True, "cleared": await engine.clear_load_profile(command["name"])}
+        if op == "start_synthetic":
+            await engine.start_synthetic(command["config"])
+            return {"ok": True}
+        if op == "stop_synthetic":
+            await engine.stop_synthetic()
+            return {"ok": True}
+        if op == "sync":
+            await engine.sync_devices()
+            return {"ok": True}
+        if op == "stop":
+            await engine.stop()
+            return {"ok": True}
+        return {"ok": False, "error": f"Unknown command: {op}"}
+    except Exception as e:
+        logger.error(f"Worker {engine.shard_index} failed on {op}: {e}")
+        return {"ok": False, "error": str(e)}
+
+
+class WorkerPool:
+    """Coordinator side of the sharded engine: spawns workers and talks to them over pipes.
+
+    Besides the request/reply control pipe, each worker gets a one-way pipe
+    for hub events; batches arriving on it are passed to on_events.
+    """
+
+    def __init__(self, count: int, on_events: Optional[Callable[[List[Tuple[str, Any]]], None]] = None):
+        self.count = count
+        self.on_events = on_events
+        self.processes: List[multiprocessing.Process] = []
+        self.conns: List[Any] = []
+        self.event_conns: List[Any] = []
+        self._locks: List[asyncio.Lock] = []
+        self._seq = itertools.count(1)
+        self._readers: List[asyncio.Task] = []
+        self.listening = None # Shared flag: the coordinator's hub has clients
+
+    def start(self, db_path: str):
+        # spawn, not fork: the parent already runs an event loop and paho threads
+        ctx = multiprocessing.get_context("spawn")
+        self.listening = ctx.Value("b", 0, lock=False)
+        for index in range(self.count):
+            parent_conn, child_conn = ctx.Pipe()
+            events_in, events_out = ctx.Pipe(duplex=False)
+            process = ctx.Process(
+                target=run_worker,
+                args=(index, self.count, child_conn, db_path, events_out, self.listening),
+                name=f"sim-worker-{index}",
+                daemon=True,
+            )
+            process.start()
+            child_conn.close()
+            events_out.close()
+            self.processes.append(process)
+            self.conns.append(parent_conn)
+            self.event_conns.append(events_in)
+            self._locks.append(asyncio.Lock())
+            self._readers.append(asyncio.create_task(self._read_events(events_in)))
+        logger.info(f"Started {self.count} simulation workers")
+
+    async def _read_events(self, conn):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                batch = await loop.run_in_executor(None, conn.recv)
+            except (EOFError, OSError):
+                return # Worker exited
+            if self.on_events:
+                try:
+                    self.on_events(batch)
+                except Exception as e:
+                    logger.error(f"Error relaying worker events: {e}")
+
+    def _exchange(self, index: int, command: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        conn = self.conns[index]
+        seq = next(self._seq)
+        conn.send({**command, "seq": seq})
+        deadline = time.monotonic() + CONTROL_TIMEOUT_S
+        while True:
+            if not conn.poll(max(deadline - time.monotonic(), 0)):
+                raise TimeoutError(f"Worker {index} did not answer {command.get('op')}")
+            reply = conn.recv()
+            if reply.get("seq") == seq:
+                return reply
+            # Late reply to a command that timed out earlier
+            logger.warning(f"Dropped stale reply from worker {index} to command {reply.get('seq')}")
+
+    async def request(self, index: int, command: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # One in-flight command per pipe keeps replies matched to requests
+        async with self._locks[index]:
+            try:
+                return await asyncio.to_thread(self._exchange, index, command)
+            except (EOFError, OSError, TimeoutError) as e:
+                logger.error(f"Control channel to worker {index} failed: {e}")
+                return None
+
+    async def broadcast(self, command: Dict[str, Any]) -> List[Optional[Dict[str, Any]]]:
+        return await asyncio.gather(*(self.request(i, command) for i in range(self.count)))
+
+    async def stop(self):
+        await self.broadcast({"op": "stop"})
+        for process in self.processes:
+            await asyncio.to_thread(process.join, CONTROL_TIMEOUT_S)
+            if process.is_alive():
+                process.terminate()
+        # Workers are gone, so the event readers have hit end of file
+        await asyncio.gather(*self._readers, return_exceptions=True)
+        for conn in self.conns + self.event_conns:
+            conn.close()
+        self.processes.clear()
+        self.conns.clear()
+        self.event_conns.clear()
+        self._locks.clear()
+        self._readers.clear()
+        logger.info("Simulation workers stopped")
@@ -0,0 +1,47 @@
+"""Compare payload serialization: dict + json.dumps vs. precompiled encoders.
+
+    uv run python -m benchmarks.bench_encoders --messages 200000
+"""
+import argparse
+import json
+import time
+
+from app.encoders import PayloadEncoder, orjson
+from benchmarks.bench_payloads import PARAMS
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200000)
+    args = parser.parse_args()
+
+    device = {'uuid': 'bench', 'name': 'bench-device'}
+    values = {'temperature': 21.37, 'humidity': 45.2, 'battery': 87, 'door_open': False,
+              'reading_time': "2024-01-01T00:00:00Z", 'site': 'plant-1'}
+    iso_now = "2024-01-01T00:00:00Z"
+
+    def baseline(seq):
+        payload = {"device_id": device['name'], "time": iso_now, "sequence_id": seq}
+        payload.update(values)
+        return json.dumps(payload)
+
+    encoders = {"json (dict)": baseline}
+    template = PayloadEncoder.compile(device, params=PARAMS, backend="template")
+    encoders["template"] = lambda seq: template.encode(iso_now, seq, values)
+    if orjson is not None:
+        fast = PayloadEncoder.compile(device, params=PARAMS, backend="orjson")
+        encoders["orjson"] = lambda seq: fast.encode(iso_now, seq, values)
+
+    results = {}
+    for label, fn in encoders.items():
+        start = time.perf_counter()
+        for seq in range(args.messages):
+            fn(seq)
+        results[label] = time.perf_counter() - start
+        print(f"{label:>12}: {results[label] / args.messages * 1e6:.2f} us/message")
+
+    base = results["json (dict)"]
+    for label, elapsed in results.items():
+        print(f"{label:>12}: {base / elapsed:.1f}x vs json.dumps")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""Sustained SimulationEngine throughput against a local stand-in MQTT broker.
+
+    uv run python -m benchmarks.bench_engine --devices 1000 10000 100000 --modes RANDOM CSV_PLAYBACK
+    uv run python -m benchmarks.bench_engine --devices 10000 --compare benchmarks/results/<commit>.json
+
+Every scenario (mode x device count) runs in a fresh process with its own
+SQLite DB and engine, publishing over a real socket to benchmarks.broker.
+After a warmup, it measures over --duration seconds, rounded to whole publish
+intervals and starting between two publish deadlines: msgs/s published and
+received by the broker, tick duration and lateness, publish lateness, CPU
+and RSS of the engine process. Results are written as JSON, keyed by commit,
+so runs can be compared across commits with --compare.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Not on Windows: peak RSS is not reported
+    resource = None
+
+from benchmarks.bench_payloads import PARAMS
+from benchmarks.broker import BrokerProcess
+
+RESULTS_DIR = os.path.join("benchmarks", "results")
+# Rows in the shared CSV every CSV_PLAYBACK device replays
+CSV_ROWS = 1000
+# Seconds allowed for the engine to connect and load the fleet
+READY_TIMEOUT_S = 600
+# Histogram figures kept in the results
+PERCENTILES = ("p50", "p95", "p99", "max", "mean")
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _rss_mb() -> float:
+    """Current resident set size (Linux /proc; 0 elsewhere)"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError, AttributeError):
+        return 0.0
+
+def _peak_rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KB on Linux, bytes on macOS
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+def _write_csv(path: str):
+    with open(path, "w") as f:
+        f.write("temperature,humidity,battery,site\n")
+        for i in range(CSV_ROWS):
+            f.write(f"{15 + i % 20}.{i % 10},{40 + i % 30}.5,{100 - i % 100},plant-{i % 3}\n")
+
+async def _populate(mode: str, devices: int, interval_ms: int, spread: bool, csv_path: str):
+    from app import database
+    from app.api.devices import INSERT_DEVICE_SQL, INSERT_PARAM_SQL, _device_row, _param_row
+    from app.models import Device
+
+    template = Device(
+        uuid="template", name="bench", publish_topic="bench", status="RUNNING", mode=mode, interval_ms=interval_ms,
+        csv_file_path=csv_path if mode == "CSV_PLAYBACK" else None,
+        params=PARAMS if mode == "RANDOM" else [],
+    )
+    async with database.connect() as db:
+        for first in range(0, devices, 5000):
+            chunk = range(first, min(first + 5000, devices))
+            rows = []
+            for n in chunk:
+                if spread:
+                    # Even phases over the interval instead of one burst per interval
+                    template.phase_offset_ms = n * interval_ms // devices
+                rows.append(_device_row(template, f"bench-{n}", f"bench-{n}", f"bench/{n}/telemetry", None))
+            await db.executemany(INSERT_DEVICE_SQL, rows)
+            await db.executemany(INSERT_PARAM_SQL, [_param_row(f"bench-{n}", p) for n in chunk for p in template.params])
+        await db.commit()
+
+def _summary(hist) -> dict:
+    snapshot = hist.snapshot()
+    return {"count": snapshot["count"], **{key: round(snapshot[key], 6) for key in PERCENTILES}}
+
+def _window_start(engine, interval_s: float) -> float:
+    """Next instant halfway between two publish deadlines (monotonic clock)
+
+    Burst fleets are idle there, so a window of whole intervals starting at it
+    holds every burst exactly once; spread fleets publish evenly at any phase.
+    """
+    now = time.monotonic()
+    due = engine.scheduler.next_due()
+    if due is None:
+        return now
+    return now + (due - interval_s / 2 - now) % interval_s
+
+async def _scenario(mode: str, devices: int, args, workdir: str, broker: BrokerProcess) -> dict:
+    from app import database
+    from app.engine import SimulationEngine
+
+    database.DB_PATH = os.path.join(workdir, f"bench-{mode}-{devices}.db")
+    csv_path = os.path.join(workdir, "bench.csv")
+    await database.init_db()
+    await _populate(mode, devices, args.interval_ms, args.spread, csv_path)
+
+    engine = SimulationEngine()
+    started = time.monotonic()
+    await engine.start()
+    try:
+        while not (engine.is_mqtt_connected and len(engine.active_devices) == devices):
+            if time.monotonic() - started > READY_TIMEOUT_S:
+                raise RuntimeError(f"Engine not ready after {READY_TIMEOUT_S}s ({len(engine.active_devices)} devices loaded)")
+            await asyncio.sleep(0.1)
+        ready_s = time.monotonic() - started
+        await asyncio.sleep(args.warmup)
+
+        # Whole publish intervals, so a fleet publishing in one burst per interval
+        # is counted once per interval, not once more when a burst lands on an edge
+        interval_s = args.interval_ms / 1000
+        elapsed = max(1, round(args.duration / interval_s)) * interval_s
+        await asyncio.sleep(_window_start(engine, interval_s) - time.monotonic())
+
+        for hist in (engine.tick_duration, engine.tick_lateness, engine.publish_lateness, engine.serialize_time):
+            hist.reset()
+        published, received, received_bytes = engine.messages_published, broker.messages, broker.payload_bytes
+        wall, cpu = time.monotonic(), time.process_time()
+        await asyncio.sleep(wall + elapsed - time.monotonic())
+        published = engine.messages_published - published
+        cpu = time.process_time() - cpu
+        # Give the broker a moment to read what was written just before the end
+        deadline = time.monotonic() + 2.0
+        while broker.messages - received < published and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        received = min(broker.messages - received, published)
+        received_bytes = broker.payload_bytes - received_bytes
+
+        return {
+            "mode": mode,
+            "devices": devices,
+            "interval_ms": args.interval_ms,
+            "spread": args.spread,
+            "target_rate": round(devices * 1000 / args.interval_ms, 1),
+            "measured_s": round(elapsed, 3),
+            "published_rate": round(published / elapsed, 1),
+            "received_rate": round(received / elapsed, 1),
+            "received_mb_s": round(received_bytes / elapsed / 2**20, 3),
+            "publish_errors": engine.publish_errors,
+            "tick_duration_s": _summary(engine.tick_duration),
+            "tick_lateness_s": _summary(engine.tick_lateness),
+            "publish_lateness_s": _summary(engine.publish_lateness),
+            "serialize_s": _summary(engine.serialize_time),
+            "cpu_percent": round(cpu / elapsed * 100, 1),
+            "rss_mb": _rss_mb(),
+            "peak_rss_mb": _peak_rss_mb(),
+            "ready_s": round(ready_s, 2),
+        }
+    finally:
+        await engine.stop()
+
+def _run_scenario(mode, devices, args, workdir, broker, conn):
+    """Child process body: a fresh interpreter state per scenario keeps CPU and RSS figures separate"""
+    os.environ["MQTT_HOST"] = broker.host
+    os.environ["MQTT_PORT"] = str(broker.port)
+    # One engine process; CPU and RSS are measured for this process only
+    os.environ["ENGINE_WORKERS"] = "1"
+    try:
+        conn.send({"ok": True, "result": asyncio.run(_scenario(mode, devices, args, workdir, broker))})
+    except Exception as e:
+        conn.send({"ok": False, "error": repr(e)})
+
+def _compare(results, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    key = lambda r: (r["mode"], r["devices"], r["interval_ms"], r["spread"])
+    previous = {key(r): r for r in baseline["results"]}
+    print(f"\nvs. {baseline.get('commit') or baseline_path}:")
+    matched = [(previous[key(r)], r) for r in results if key(r) in previous]
+    if not matched:
+        print("  no scenarios in common")
+    for before, result in matched:
+        rate_change = (result["received_rate"] / before["received_rate"] - 1) * 100 if before["received_rate"] else 0.0
+        print(f"{result['mode']:>12} {result['devices']:>7}: received {before['received_rate']:.0f} -> "
+              f"{result['received_rate']:.0f} msgs/s ({rate_change:+.1f}%), tick lateness p99 "
+              f"{before['tick_lateness_s']['p99'] * 1000:.1f} -> {result['tick_lateness_s']['p99'] * 1000:.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--modes", nargs="+", choices=("RANDOM", "CSV_PLAYBACK"), default=["RANDOM", "CSV_PLAYBACK"])
+    parser.add_argument("--interval-ms", type=int, default=1000)
+    parser.add_argument("--spread", action="store_true", help="spread device phases evenly over the interval")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds before measuring")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured per scenario (rounded to whole intervals)")
+    parser.add_argument("--output", help=f"results file (default: {RESULTS_DIR}/<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    commit = _git_commit()
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit or 'local'}.json")
+    broker = BrokerProcess()
+    broker.start()
+    print(f"Stand-in broker on {broker.host}:{broker.port}")
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            _write_csv(os.path.join(workdir, "bench.csv"))
+            for mode in args.modes:
+                for devices in args.devices:
+                    receiver, sender = multiprocessing.Pipe(duplex=False)
+                    process = multiprocessing.Process(target=_run_scenario, args=(mode, devices, args, workdir, broker, sender))
+                    process.start()
+                    reply = receiver.recv()
+                    process.join()
+                    if not reply["ok"]:
+                        print(f"{mode:>12} {devices:>7}: failed: {reply['error']}")
+                        continue
+                    result = reply["result"]
+                    results.append(result)
+                    print(f"{mode:>12} {devices:>7}: {result['received_rate']:.0f}/{result['target_rate']:.0f} msgs/s, "
+                          f"tick lateness p99 {result['tick_lateness_s']['p99'] * 1000:.1f} ms, "
+                          f"CPU {result['cpu_percent']:.0f}%, RSS {result['rss_mb']:.0f} MB")
+    finally:
+        broker.stop()
+
+    report = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "env": {key: os.environ[key] for key in ("PAYLOAD_ENCODER", "HIGH_RES_TIMING", "MQTT_TRANSPORT", "MQTT_POOL_SIZE") if key in os.environ},
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+    if args.compare:
+        _compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
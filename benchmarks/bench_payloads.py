@@ -0,0 +1,47 @@
+"""Compare scalar vs. batched RANDOM payload generation.
+
+    uv run python -m benchmarks.bench_payloads --devices 10000 --rounds 20
+"""
+import argparse
+import time
+
+from app.payloads import BatchPayloadGenerator, generate_values, np
+
+PARAMS = [
+    {'param_name': 'temperature', 'type': 'float', 'min_val': 15.0, 'max_val': 35.0, 'precision': 2},
+    {'param_name': 'humidity', 'type': 'float', 'min_val': 20.0, 'max_val': 80.0, 'precision': 1},
+    {'param_name': 'battery', 'type': 'int', 'min_val': 0, 'max_val': 100, 'precision': None},
+    {'param_name': 'door_open', 'type': 'bool', 'min_val': 0, 'max_val': 1, 'precision': None},
+    {'param_name': 'reading_time', 'type': 'timestamp', 'min_val': 0, 'max_val': 0, 'precision': None},
+    {'param_name': 'site', 'type': 'string', 'min_val': 0, 'max_val': 0, 'precision': None, 'string_value': 'plant-1'},
+]
+
+def bench(label, fn, rounds, devices):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    elapsed = time.perf_counter() - start
+    per_device_us = elapsed / (rounds * devices) * 1e6
+    print(f"{label:>8}: {elapsed:.3f}s total, {per_device_us:.2f} us/device")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    iso_now = "2024-01-01T00:00:00Z"
+    batch = [(f"dev-{i}", PARAMS) for i in range(args.devices)]
+    print(f"{args.devices} devices x {len(PARAMS)} params, {args.rounds} rounds")
+
+    scalar = bench("scalar", lambda: {uuid: generate_values(p, iso_now) for uuid, p in batch}, args.rounds, args.devices)
+    if np is None:
+        print("   batch: skipped (NumPy not installed)")
+        return
+    generator = BatchPayloadGenerator()
+    batched = bench("batch", lambda: generator.generate(batch, iso_now), args.rounds, args.devices)
+    print(f" speedup: {scalar / batched:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Minimal MQTT 3.1.1 stand-in broker for benchmarks.
+
+Accepts any client, acknowledges CONNECT/SUBSCRIBE/UNSUBSCRIBE/PINGREQ and
+QoS 1/2 publishes, and counts PUBLISH packets and payload bytes. Messages are
+not routed to subscribers: it is a sink that costs the engine a real socket
+and real MQTT framing, nothing more.
+
+Runs in its own process so its parsing doesn't share a core with the engine.
+"""
+import asyncio
+import multiprocessing
+from typing import Tuple
+
+CONNECT, PUBLISH, PUBREL, SUBSCRIBE, UNSUBSCRIBE, PINGREQ, DISCONNECT = 1, 3, 6, 8, 10, 12, 14
+CONNACK = b"\x20\x02\x00\x00"
+PINGRESP = b"\xd0\x00"
+READ_SIZE = 256 * 1024
+
+
+class StandInBroker:
+    """Counts what connected clients publish; counters are shared with the parent process"""
+
+    def __init__(self, messages, payload_bytes):
+        self.messages = messages
+        self.payload_bytes = payload_bytes
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        buffer = bytearray()
+        try:
+            while True:
+                chunk = await reader.read(READ_SIZE)
+                if not chunk:
+                    break
+                buffer += chunk
+                consumed, messages, payload_bytes, replies, closed = self._parse(buffer)
+                del buffer[:consumed]
+                # One counter update per read, not per packet
+                self.messages.value += messages
+                self.payload_bytes.value += payload_bytes
+                if replies:
+                    writer.write(b"".join(replies))
+                if closed:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _parse(buffer: bytearray) -> Tuple[int, int, int, list, bool]:
+        """(bytes consumed, publishes, payload bytes, replies, disconnected) for the complete packets in buffer"""
+        pos = 0
+        end = len(buffer)
+        messages = payload_bytes = 0
+        replies = []
+        while pos + 2 <= end:
+            header = buffer[pos]
+            # Remaining length: 1-4 bytes, 7 bits each
+            length = shift = 0
+            i = pos + 1
+            while True:
+                if i >= end:
+                    return pos, messages, payload_bytes, replies, False
+                byte = buffer[i]
+                length |= (byte & 0x7F) << shift
+                i += 1
+                if not byte & 0x80:
+                    break
+                shift += 7
+            if i + length > end:
+                break
+            kind = header >> 4
+            if kind == PUBLISH:
+                qos = (header >> 1) & 3
+                topic_length = (buffer[i] << 8) | buffer[i + 1]
+                variable = 2 + topic_length + (2 if qos else 0)
+                messages += 1
+                payload_bytes += length - variable
+                if qos:
+                    packet_id = bytes(buffer[i + variable - 2:i + variable])
+                    # PUBACK for QoS 1, PUBREC for QoS 2
+                    replies.append((b"\x40\x02" if qos == 1 else b"\x50\x02") + packet_id)
+            elif kind == PUBREL:
+                replies.append(b"\x70\x02" + bytes(buffer[i:i + 2]))
+            elif kind == CONNECT:
+                replies.append(CONNACK)
+            elif kind == SUBSCRIBE:
+                # Grant QoS 0 for every filter: (2-byte length, filter, requested QoS) each
+                filters = 0
+                j = i + 2
+                while j < i + length:
+                    j += 2 + ((buffer[j] << 8) | buffer[j + 1]) + 1
+                    filters += 1
+                replies.append(bytes([0x90, 2 + filters]) + bytes(buffer[i:i + 2]) + b"\x00" * filters)
+            elif kind == UNSUBSCRIBE:
+                replies.append(b"\xb0\x02" + bytes(buffer[i:i + 2]))
+            elif kind == PINGREQ:
+                replies.append(PINGRESP)
+            elif kind == DISCONNECT:
+                return i + length, messages, payload_bytes, replies, True
+            pos = i + length
+        return pos, messages, payload_bytes, replies, False
+
+
+def _serve(host: str, port, messages, payload_bytes, ready):
+    async def main():
+        broker = StandInBroker(messages, payload_bytes)
+        server = await asyncio.start_server(broker.handle, host, port.value)
+        port.value = server.sockets[0].getsockname()[1]
+        ready.set()
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+class BrokerProcess:
+    """A StandInBroker in a child process; port 0 picks a free port"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self._port = multiprocessing.Value("i", port)
+        self._messages = multiprocessing.Value("q", 0, lock=False)
+        self._bytes = multiprocessing.Value("q", 0, lock=False)
+        self._ready = multiprocessing.Event()
+        self.process = None
+
+    @property
+    def port(self) -> int:
+        return self._port.value
+
+    @property
+    def messages(self) -> int:
+        return self._messages.value
+
+    @property
+    def payload_bytes(self) -> int:
+        return self._bytes.value
+
+    def start(self, timeout: float = 10.0):
+        self.process = multiprocessing.Process(
+            target=_serve, args=(self.host, self._port, self._messages, self._bytes, self._ready),
+            name="mqtt-stand-in", daemon=True,
+        )
+        self.process.start()
+        if not self._ready.wait(timeout):
+            self.stop()
+            raise RuntimeError("Stand-in broker did not start")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join(5)
+            self.process = None
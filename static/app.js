@@ -6,6 +6,13 @@ let paramsList = []; // Temporary params for new device
 let isEditing = false;
 let editUuid = null;
 
+// Device list paging (cursor of every page visited so far)
+const PAGE_SIZE = 50;
+let pageCursors = [null];
+let pageIndex = 0;
+let nextCursor = null;
+let totalDevices = 0;
+
 // DOM Elements
 const deviceGrid = document.getElementById('deviceGrid');
 const statsTotal = document.getElementById('statsTotal');
@@ -20,38 +27,103 @@ const submitBtn = document.getElementById('submitBtn');
 document.addEventListener('DOMContentLoaded', () => {
     fetchDevices();
     fetchStats();
-    setInterval(() => {
-        fetchDevices();
-        fetchStats();
-    }, 2000); // Poll for status updates
+    connectEvents();
 });
 
+// Live updates: the server pushes deltas instead of the page polling
+let renderPending = false;
+
+function connectEvents() {
+    const source = new EventSource(`${API_URL}/events`);
+    // (Re)connected: deltas may have been missed, start from a fresh snapshot
+    source.onopen = () => resync();
+    source.addEventListener('resync', resync);
+    source.addEventListener('stats', e => renderStats(JSON.parse(e.data)));
+    source.addEventListener('device', e => applyDeviceEvent(JSON.parse(e.data)));
+    source.addEventListener('message', e => {
+        const m = JSON.parse(e.data);
+        const device = devices.find(d => d.uuid === m.uuid);
+        if (!device) return;
+        device.messages = [...(device.messages || []), m].slice(-5);
+        scheduleRender();
+    });
+    source.addEventListener('listener', e => {
+        listenerMessages = [...listenerMessages, JSON.parse(e.data)].slice(-50);
+        renderListenerMessages();
+    });
+    source.addEventListener('listener_cleared', () => {
+        listenerMessages = [];
+        renderListenerMessages();
+    });
+}
+
+function resync() {
+    fetchDevices();
+    fetchStats();
+    fetchListenerMessages();
+}
+
+function applyDeviceEvent(event) {
+    const device = devices.find(d => d.uuid === event.uuid);
+    if (event.action === 'status' || event.action === 'updated') {
+        if (!device) return; // Not on this page
+        if (event.action === 'status') device.status = event.status;
+        else Object.assign(device, event.device);
+        scheduleRender();
+    } else {
+        // Created, deleted or changed server-side: page contents may shift
+        fetchDevices();
+    }
+}
+
+function scheduleRender() {
+    // Coalesce bursts of events into one render per frame
+    if (renderPending) return;
+    renderPending = true;
+    requestAnimationFrame(() => {
+        renderPending = false;
+        renderDevices();
+    });
+}
+
 async function fetchStats() {
     try {
         const res = await fetch(`${API_URL}/stats`);
-        const stats = await res.json();
-
-        const connEl = document.getElementById('mqttConnStatus');
-        if (connEl) {
-            connEl.textContent = stats.mqtt_connected ? 'Connected' : 'Disconnected';
-            connEl.style.color = stats.mqtt_connected ? 'var(--success)' : 'var(--danger)';
-        }
-
-        // Update stats cards if they exist
-        const statsTotal = document.getElementById('statsTotal');
-        const statsRunning = document.getElementById('statsRunning');
-        if (statsTotal) statsTotal.textContent = stats.total_devices;
-        if (statsRunning) statsRunning.textContent = stats.running_devices;
+        renderStats(await res.json());
     } catch (e) {
         console.error("Failed to fetch stats", e);
     }
 }
 
+function renderStats(stats) {
+    const connEl = document.getElementById('mqttConnStatus');
+    if (connEl) {
+        connEl.textContent = stats.mqtt_connected ? 'Connected' : 'Disconnected';
+        connEl.style.color = stats.mqtt_connected ? 'var(--success)' : 'var(--danger)';
+    }
+
+    // Update stats cards if they exist (the total comes from the paged device list)
+    const statsRunning = document.getElementById('statsRunning');
+    if (statsRunning) statsRunning.textContent = stats.running_devices;
+    // Only pushed stats carry a rate
+    const statsRate = document.getElementById('statsRate');
+    if (statsRate && stats.messages_per_s !== undefined) statsRate.textContent = stats.messages_per_s;
+}
+
 async function fetchDevices() {
     try {
-        const res = await fetch(`${API_URL}/devices`);
+        const cursor = pageCursors[pageIndex];
+        const res = await fetch(`${API_URL}/devices?limit=${PAGE_SIZE}` + (cursor ? `&cursor=${cursor}` : ''));
         devices = await res.json();
+        nextCursor = res.headers.get('X-Next-Cursor');
+        totalDevices = parseInt(res.headers.get('X-Total-Count') || devices.length);
+        if (devices.length === 0 && pageIndex > 0) {
+            // Page emptied by deletions: step back
+            pageIndex--;
+            return fetchDevices();
+        }
         renderDevices();
+        renderPager();
         updateStats();
     } catch (e) {
         console.error("Failed to fetch devices", e);
@@ -59,8 +131,29 @@ async function fetchDevices() {
 }
 
 function updateStats() {
-    statsTotal.textContent = devices.length;
-    statsRunning.textContent = devices.filter(d => d.status === 'RUNNING').length;
+    statsTotal.textContent = totalDevices;
+}
+
+function renderPager() {
+    const first = pageIndex * PAGE_SIZE + 1;
+    document.getElementById('pageInfo').textContent = totalDevices
+        ? `${first}–${first + devices.length - 1} of ${totalDevices}`
+        : 'No devices';
+    document.getElementById('prevPageBtn').disabled = pageIndex === 0;
+    document.getElementById('nextPageBtn').disabled = !nextCursor;
+}
+
+function nextPage() {
+    if (!nextCursor) return;
+    pageCursors[pageIndex + 1] = nextCursor;
+    pageIndex++;
+    fetchDevices();
+}
+
+function prevPage() {
+    if (pageIndex === 0) return;
+    pageIndex--;
+    fetchDevices();
 }
 
 function renderDevices() {
@@ -336,15 +429,13 @@ function toggleSidebar(sidebarId) {
     const sidebar = document.getElementById(sidebarId);
     sidebar.classList.toggle('active');
 
-    // Start polling if listener sidebar is opened
+    // Listener messages arrive as events; refresh the backlog when the panel opens
     if (sidebarId === 'listenerSidebar' && sidebar.classList.contains('active')) {
-        startListenerPolling();
-    } else if (sidebarId === 'listenerSidebar') {
-        stopListenerPolling();
+        fetchListenerMessages();
     }
 }
 
-let listenerPollInterval = null;
+let listenerMessages = [];
 let subscribedTopic = null;
 
 async function toggleSubscription() {
@@ -388,32 +479,19 @@ async function toggleSubscription() {
     }
 }
 
-function startListenerPolling() {
-    if (listenerPollInterval) return;
-    fetchListenerMessages();
-    listenerPollInterval = setInterval(fetchListenerMessages, 1000);
-}
-
-function stopListenerPolling() {
-    if (listenerPollInterval) {
-        clearInterval(listenerPollInterval);
-        listenerPollInterval = null;
-    }
-}
-
 async function fetchListenerMessages() {
     try {
         const res = await fetch(`${API_URL}/mqtt/listener-messages`);
-        const messages = await res.json();
-        renderListenerMessages(messages);
+        listenerMessages = await res.json();
+        renderListenerMessages();
     } catch (e) {
         console.error("Failed to fetch listener messages", e);
     }
 }
 
-function renderListenerMessages(messages) {
+function renderListenerMessages() {
     const container = document.getElementById('listenerMessages');
-    container.innerHTML = messages.reverse().map(m => `
+    container.innerHTML = [...listenerMessages].reverse().map(m => `
         <div class="listener-msg">
             <span class="time">[${new Date(m.timestamp * 1000).toLocaleTimeString()}]</span>
             <span class="topic">${m.topic}:</span>
@@ -424,7 +502,6 @@ function renderListenerMessages(messages) {
 
 async function clearListenerMessages() {
     await fetch(`${API_URL}/mqtt/listener-messages`, { method: 'DELETE' });
-    fetchListenerMessages();
 }
 
 async function sendManualMqtt() {
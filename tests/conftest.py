@@ -52,6 +52,7 @@ async def db():
 def mock_mqtt(mocker):
     # Mock the MQTT client in the engine
     mock_client = MagicMock()
+    mock_client.publish.return_value.rc = 0 # MQTT_ERR_SUCCESS
     mocker.patch('paho.mqtt.client.Client', return_value=mock_client)
     # Also patch the instance on the engine
     engine.mqtt_client = mock_client
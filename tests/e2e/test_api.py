@@ -1,5 +1,6 @@
 import pytest
 from fastapi import status
+from app.engine import engine
 
 @pytest.mark.asyncio
 async def test_create_and_get_device(client):
@@ -65,3 +66,239 @@ async def test_delete_device(client):
     # Verify 404
     response = client.get("/api/devices/d1")
     assert response.status_code == status.HTTP_404_NOT_FOUND
+
+@pytest.mark.asyncio
+async def test_stats_exposes_publish_lateness(client):
+    response = client.get("/api/stats")
+    assert response.status_code == status.HTTP_200_OK
+    stats = response.json()
+    assert "publish_lateness" in stats
+    assert {"count", "p50", "p99", "buckets"} <= stats["publish_lateness"].keys()
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client):
+    client.post("/api/devices", json={"uuid": "m1", "name": "M1", "publish_topic": "t/m1"})
+    client.post("/api/devices", json={"uuid": "m2", "name": "M2", "publish_topic": "t/m2"})
+    client.post("/api/devices/m1/start")
+
+    stats = client.get("/api/stats").json()
+    assert (stats["total_devices"], stats["running_devices"]) == (2, 1)
+
+    response = client.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    assert "iot_simulator_devices 2.0" in lines
+    assert "iot_simulator_running_devices 1.0" in lines
+    for family in ("tick_duration_seconds", "serialize_seconds", "sync_duration_seconds", "publish_lateness_seconds"):
+        assert f"# TYPE iot_simulator_{family} histogram" in lines
+    assert any(line.startswith("iot_simulator_inbound_received_total ") for line in lines)
+    assert any(line.startswith("iot_simulator_mqtt_outgoing_queue ") for line in lines)
+
+@pytest.mark.asyncio
+async def test_start_stop_applies_to_engine_immediately(client):
+    from app.engine import engine
+    client.post("/api/devices", json={"uuid": "d1", "name": "Dev1", "publish_topic": "t1"})
+
+    client.post("/api/devices/d1/start")
+    assert "d1" in engine.active_devices
+
+    client.post("/api/devices/d1/stop")
+    assert "d1" not in engine.active_devices
+
+@pytest.mark.asyncio
+async def test_upload_csv_validates_and_converts(client):
+    import os
+    from app.columnar import columnar_path
+    client.post("/api/devices", json={"uuid": "csv-dev", "name": "CsvDev", "publish_topic": "t/csv"})
+    csv_text = 'timestamp,note\n2024-01-01T00:00:00Z,"multi\nline"\n2024-01-01T00:00:01Z,plain\n'
+    try:
+        response = client.post("/api/devices/csv-dev/upload-csv", files={"file": ("data.csv", csv_text, "text/csv")})
+        assert response.status_code == status.HTTP_200_OK
+        body = response.json()
+        assert body["rows"] == 2
+        assert body["columns"] == ["timestamp", "note"]
+        assert os.path.exists(columnar_path(body["file_path"]))
+        assert client.get("/api/devices/csv-dev").json()["mode"] == "CSV_PLAYBACK"
+
+        # Rejected uploads leave the stored file alone
+        response = client.post("/api/devices/csv-dev/upload-csv", files={"file": ("data.csv", "a,b\n1,2,3\n", "text/csv")})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "3 fields" in response.json()["detail"]
+        with open(body["file_path"]) as f:
+            assert f.read() == csv_text
+
+        # No usable filename: rejected, not a server error
+        response = client.post("/api/devices/csv-dev/upload-csv", files={"file": ("uploads/", csv_text, "text/csv")})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "filename" in response.json()["detail"]
+    finally:
+        for path in ("data/csv/csv-dev_data.csv", columnar_path("data/csv/csv-dev_data.csv")):
+            if os.path.exists(path):
+                os.remove(path)
+
+@pytest.mark.asyncio
+async def test_upload_csv_failure_leaves_no_files(client, mocker):
+    import os
+    from app.api import devices
+    client.post("/api/devices", json={"uuid": "csv-fail", "name": "CsvFail", "publish_topic": "t/csv"})
+    store_chunk = devices._store_chunk
+
+    def failing_store(buffer, ingest, chunk):
+        store_chunk(buffer, ingest, chunk)
+        raise OSError("No space left on device")
+
+    mocker.patch('app.api.devices._store_chunk', side_effect=failing_store)
+    with pytest.raises(OSError):
+        client.post("/api/devices/csv-fail/upload-csv", files={"file": ("data.csv", "a,b\n1,2\n", "text/csv")})
+    assert [name for name in os.listdir("data/csv") if name.startswith("csv-fail_")] == []
+
+@pytest.mark.asyncio
+async def test_bulk_create_devices(client):
+    import json
+    from app.engine import engine
+    request = {
+        "template": {
+            "uuid": "", "name": "Sensor", "publish_topic": "fleet/{n}/data", "status": "RUNNING",
+            "params": [{"param_name": "temp", "type": "int", "min_val": 1, "max_val": 5}],
+        },
+        "count": 12,
+        "uuid_pattern": "bulk-{n}",
+    }
+    response = client.post("/api/devices/bulk", json=request)
+    assert response.status_code == status.HTTP_200_OK
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[-1]["status"] == "done"
+    assert lines[-1]["created"] == 12
+
+    device = client.get("/api/devices/bulk-3").json()
+    assert device["name"] == "Sensor-3"
+    assert device["publish_topic"] == "fleet/3/data"
+    assert device["params"][0]["param_name"] == "temp"
+    # Running fleet is picked up by the engine straight away, params included
+    assert "bulk-12" in engine.active_devices
+    assert engine.device_params["bulk-12"][0]["max_val"] == 5
+
+    # A clash rolls back the whole batch
+    request["start_index"] = 12
+    lines = [json.loads(line) for line in client.post("/api/devices/bulk", json=request).text.splitlines()]
+    assert lines[-1]["status"] == "error"
+    assert client.get("/api/devices/bulk-13").status_code == status.HTTP_404_NOT_FOUND
+
+    request["uuid_pattern"] = "bulk-{missing}"
+    assert client.post("/api/devices/bulk", json=request).status_code == status.HTTP_400_BAD_REQUEST
+    request["uuid_pattern"] = "bulk-same"
+    assert client.post("/api/devices/bulk", json=request).status_code == status.HTTP_400_BAD_REQUEST
+
+@pytest.mark.asyncio
+async def test_bulk_create_expands_fleet_off_the_event_loop(client, mocker):
+    import asyncio
+    from app.api import devices
+    expand = devices._expand_template
+    on_loop = []
+
+    def recording_expand(request):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return expand(request)
+
+    mocker.patch('app.api.devices._expand_template', side_effect=recording_expand)
+    request = {"template": {"uuid": "", "name": "Sensor", "publish_topic": "t/{n}"}, "count": 3, "uuid_pattern": "off-{n}"}
+    assert client.post("/api/devices/bulk", json=request).status_code == status.HTTP_200_OK
+    assert on_loop == [False]
+
+@pytest.mark.asyncio
+async def test_list_devices_paginated_filtered_projected(client):
+    for i in range(5):
+        client.post("/api/devices", json={
+            "uuid": f"page-{i}", "name": f"Page{i}", "publish_topic": "t",
+            "params": [{"param_name": "p", "type": "int", "min_val": i, "max_val": i}],
+        })
+    client.post("/api/devices/page-1/start")
+    client.post("/api/devices/page-3/start")
+
+    response = client.get("/api/devices?limit=2")
+    assert [d["uuid"] for d in response.json()] == ["page-0", "page-1"]
+    assert response.headers["X-Total-Count"] == "5"
+    assert response.json()[1]["params"][0]["min_val"] == 1
+    assert response.json()[0]["retain"] is False
+
+    seen = []
+    cursor = None
+    while True:
+        url = "/api/devices?limit=2" + (f"&cursor={cursor}" if cursor else "")
+        response = client.get(url)
+        seen += [d["uuid"] for d in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == [f"page-{i}" for i in range(5)]
+
+    running = client.get("/api/devices?status=RUNNING&fields=name,status").json()
+    assert running == [
+        {"uuid": "page-1", "name": "Page1", "status": "RUNNING"},
+        {"uuid": "page-3", "name": "Page3", "status": "RUNNING"},
+    ]
+    assert client.get("/api/devices?fields=bogus").status_code == status.HTTP_400_BAD_REQUEST
+
+@pytest.mark.asyncio
+async def test_query_message_history(client):
+    client.post("/api/devices", json={"uuid": "hist-1", "name": "Hist", "publish_topic": "t", "subscribe_topic": "cmd/hist-1"})
+    for i in range(3):
+        engine.received_messages.add("hist-1", {"timestamp": 100.0 + i, "topic": "cmd/hist-1", "payload": str(i)})
+
+    response = client.get("/api/messages?device=hist-1&since=101")
+    assert response.status_code == status.HTTP_200_OK
+    assert [m["payload"] for m in response.json()] == ["2", "1"]
+    assert response.json()[0]["uuid"] == "hist-1"
+    assert client.get("/api/messages?topic=other/%23").json() == []
+    assert client.get("/api/messages?source=listener").json() == []
+
+@pytest.mark.asyncio
+async def test_device_rules_round_trip(client):
+    device = {
+        "uuid": "rules-1", "name": "Valve", "publish_topic": "valves/1", "subscribe_topic": "cmd/valves/1",
+        "rules": [{"action": "reply", "field": "ping"}, {"action": "set_interval", "field": "every", "value_field": "every"}],
+    }
+    assert client.post("/api/devices", json=device).status_code == status.HTTP_200_OK
+    rules = client.get("/api/devices/rules-1").json()["rules"]
+    assert [r["action"] for r in rules] == ["reply", "set_interval"]
+
+    # Updates without rules keep them; an explicit list replaces them
+    client.put("/api/devices/rules-1", json={k: v for k, v in device.items() if k != "rules"})
+    assert len(client.get("/api/devices/rules-1").json()["rules"]) == 2
+    client.put("/api/devices/rules-1", json={**device, "rules": []})
+    assert client.get("/api/devices/rules-1").json()["rules"] == []
+
+    bad = {**device, "uuid": "rules-2", "rules": [{"action": "set_range", "min_val": 1}]}
+    assert client.post("/api/devices", json=bad).status_code == 422
+
+@pytest.mark.asyncio
+async def test_load_profiles_api(client):
+    profile = {"name": "warmup", "phases": [
+        {"type": "ramp", "duration_s": 60, "to_rate": 1000},
+        {"type": "burst", "duration_s": 60, "rate": 1000, "burst_rate": 5000, "burst_s": 5, "period_s": 30},
+    ]}
+    assert client.post("/api/load-profiles", json=profile).status_code == status.HTTP_200_OK
+    profiles = client.get("/api/load-profiles").json()
+    assert [p["name"] for p in profiles] == ["warmup"]
+    assert profiles[0]["finished"] is False
+
+    bad = {"name": "bad", "phases": [{"type": "burst", "duration_s": 10, "rate": 5}]}
+    assert client.post("/api/load-profiles", json=bad).status_code == 422
+    assert client.delete("/api/load-profiles/warmup").status_code == status.HTTP_200_OK
+    assert client.delete("/api/load-profiles/warmup").status_code == status.HTTP_404_NOT_FOUND
+
+@pytest.mark.asyncio
+async def test_synthetic_load_api(client):
+    assert client.post("/api/synthetic", json={"rate": 100, "topic": "bad/{x}"}).status_code == status.HTTP_400_BAD_REQUEST
+    assert client.post("/api/synthetic", json={"rate": 100, "interval_ms": 50, "duration_s": 10}).status_code == status.HTTP_200_OK
+    state = client.get("/api/synthetic").json()
+    assert state["devices"] == 5
+    assert state["target_rate"] == 100
+    assert "p99" in state["publish_latency"]
+    assert client.delete("/api/synthetic").status_code == status.HTTP_200_OK
+    assert client.get("/api/synthetic").json()["running"] is False
@@ -0,0 +1,49 @@
+import asyncio
+import pytest
+from app.database import ConnectionPool, StatusWriter, open_connection
+
+@pytest.mark.asyncio
+async def test_connections_use_wal(db):
+    conn = await open_connection()
+    try:
+        cursor = await conn.execute("PRAGMA journal_mode")
+        assert (await cursor.fetchone())[0] == "wal"
+    finally:
+        await conn.close()
+
+@pytest.mark.asyncio
+async def test_pool_rolls_back_abandoned_transactions(db):
+    pool = ConnectionPool(1)
+    await pool.open()
+    try:
+        async with pool.acquire() as conn:
+            await conn.execute("INSERT INTO devices (uuid, name, publish_topic) VALUES ('leak', 'Leak', 't')")
+        async with pool.acquire() as conn:
+            assert not conn.in_transaction
+            cursor = await conn.execute("SELECT COUNT(*) FROM devices WHERE uuid='leak'")
+            assert (await cursor.fetchone())[0] == 0
+    finally:
+        await pool.close()
+
+@pytest.mark.asyncio
+async def test_status_writer_groups_concurrent_updates(db):
+    for i in range(3):
+        await db.execute("INSERT INTO devices (uuid, name, publish_topic) VALUES (?, ?, 't')", (f"s{i}", f"S{i}"))
+    await db.commit()
+
+    writer = StatusWriter()
+    await writer.open()
+    try:
+        results = await asyncio.gather(
+            writer.set_status("s0", "RUNNING"),
+            writer.set_status("s1", "RUNNING"),
+            writer.set_status("missing", "RUNNING"),
+        )
+        assert results == [True, True, False]
+        assert writer.batches == 1
+        assert writer.updates == 3
+    finally:
+        await writer.close()
+
+    cursor = await db.execute("SELECT uuid FROM devices WHERE status='RUNNING' ORDER BY uuid")
+    assert [row[0] for row in await cursor.fetchall()] == ["s0", "s1"]
@@ -0,0 +1,161 @@
+import os
+from app.datasets import CsvDataset, DatasetCache
+from app.engine import CsvPlayer
+from app import engine as engine_module
+
+def write_csv(path, text):
+    path.write_text(text)
+    return str(path)
+
+def test_dataset_parses_like_dictreader(tmp_path):
+    path = write_csv(tmp_path / "data.csv", "a,b\n1,2\n\n3\n4,5,6\n")
+    dataset = CsvDataset.load(path)
+    assert dataset.headers == ["a", "b"]
+    assert len(dataset) == 3
+    assert dataset.columns == [["1", "3", "4"], ["2", None, "5"]]
+    assert dataset.row(1) == {"a": "3", "b": None}
+
+def test_dataset_cache_shares_and_releases(tmp_path):
+    path = write_csv(tmp_path / "data.csv", "a\n1\n")
+    cache = DatasetCache()
+    first = cache.acquire(path)
+    second = cache.acquire(path)
+    assert first is second
+    assert len(cache) == 1
+
+    cache.release(first)
+    assert path in cache
+    cache.release(second)
+    assert path not in cache
+
+def test_dataset_cache_reloads_rewritten_file(tmp_path):
+    path = write_csv(tmp_path / "data.csv", "a\n1\n")
+    cache = DatasetCache()
+    old = cache.acquire(path)
+    write_csv(tmp_path / "data.csv", "a\n1\n2\n")
+    os.utime(path, ns=(old.signature[1] + 10**9, old.signature[1] + 10**9))
+    new = cache.acquire(path)
+    assert new is not old
+    assert len(new) == 2
+
+    # The old copy's holder releasing it leaves the new one cached and counted
+    closed = []
+    old.close = lambda: closed.append(old)
+    cache.release(old)
+    assert closed == [old]
+    assert cache.acquire(path) is new
+    cache.release(new)
+    assert path in cache
+    cache.release(new)
+    assert path not in cache
+
+def test_csv_players_share_one_dataset(tmp_path):
+    path = write_csv(tmp_path / "data.csv", "col1\nv1\nv2\n")
+    players = [CsvPlayer(path, loop=True) for _ in range(3)]
+    assert len({id(p.dataset) for p in players}) == 1
+    assert not hasattr(players[0], "file") # No per-device file handle
+
+    # Cursors advance independently
+    assert players[0].next_row() == {"col1": "v1"}
+    assert players[0].next_row() == {"col1": "v2"}
+    assert players[1].next_row() == {"col1": "v1"}
+
+    for player in players:
+        player.close()
+    assert path not in engine_module.datasets
+
+def test_dataset_offsets_from_timestamp_column(tmp_path):
+    path = write_csv(tmp_path / "data.csv",
+                     "timestamp,v\n2024-03-20T10:00:00Z,1\n2024-03-20T10:00:02Z,2\nbad,3\n2024-03-20T09:00:00Z,4\n")
+    # Unparseable and out-of-order times hold the previous offset
+    assert CsvDataset.load(path).offsets() == [0.0, 2.0, 2.0, 2.0]
+    assert CsvDataset.load(write_csv(tmp_path / "plain.csv", "v\n1\n")).offsets() is None
+
+def test_csv_player_replays_at_recorded_times(tmp_path):
+    path = write_csv(tmp_path / "data.csv", "ts,v\n0,a\n0,b\n2,c\n")
+    player = CsvPlayer(path, loop=True, speed=2.0)
+    assert player.timestamped
+
+    # Rows sharing a timestamp go out together; the 2s row is due 1s later at 2x speed
+    assert [r["v"] for r in player.due_rows(100.0, limit=10)] == ["a", "b"]
+    assert player.next_due(100.0) == 101.0
+    assert player.due_rows(100.5, limit=10) == []
+
+    # Late by 0.25s: the row is still sent and the lag reported
+    assert [r["v"] for r in player.due_rows(101.25, limit=10)] == ["c"]
+    assert player.lag == 0.25
+    # Loops after the average row spacing (1s of recorded time)
+    assert player.next_due(101.25) == 101.0 + 0.5
+    player.close()
+
+def test_csv_player_as_fast_as_possible_batches(tmp_path):
+    path = write_csv(tmp_path / "data.csv", "ts,v\n0,a\n10,b\n20,c\n")
+    player = CsvPlayer(path, loop=False, speed=0)
+    assert len(player.due_rows(0.0, limit=2)) == 2
+    assert player.next_due(0.0) == 0.0
+    assert len(player.due_rows(0.0, limit=2)) == 1
+    assert player.next_due(0.0) is None
+    player.close()
+
+def test_csv_ingest_handles_any_chunking(tmp_path):
+    from app.columnar import columnar_path
+    from app.datasets import CsvIngest
+    text = 'ts,note,v\n0,"a ""quoted""\nnote",1\n\n1,é,\n2,short\n'
+    path = write_csv(tmp_path / "data.csv", text)
+    expected = CsvDataset.load(path)
+
+    data = text.encode()
+    for size in (1, 3, 7, len(data)):
+        ingest = CsvIngest(path)
+        for i in range(0, len(data), size):
+            ingest.feed(data[i:i + size])
+        ingest.finish()
+        ingest.commit()
+        assert ingest.rows == 3
+        os.utime(columnar_path(path)) # Newer than the CSV, so it is what gets loaded
+        dataset = CsvDataset.open(path)
+        assert dataset.signature[0] == columnar_path(path)
+        assert [list(c) for c in dataset.columns] == expected.columns
+        assert dataset.offsets() == [0.0, 1.0, 2.0]
+        dataset.close()
+
+def test_csv_ingest_splits_records_like_csv_reader(tmp_path):
+    from app.columnar import columnar_path
+    from app.datasets import CsvIngest
+    # Stray quotes inside unquoted fields are literal and must not swallow the following lines
+    text = 'a,b\r\n1,x"y\r\n2,"q""r"s\r\n3,"multi\r\nline"\r\n4,z'
+    path = write_csv(tmp_path / "data.csv", text)
+    with open(path, "w", newline="") as f:
+        f.write(text)
+    expected = CsvDataset.load(path)
+    assert expected.columns[0] == ["1", "2", "3", "4"]
+
+    data = text.encode()
+    for size in (1, 2, 5, len(data)):
+        ingest = CsvIngest(path)
+        for i in range(0, len(data), size):
+            ingest.feed(data[i:i + size])
+        ingest.finish()
+        ingest.commit()
+        os.utime(columnar_path(path))
+        dataset = CsvDataset.open(path)
+        assert [list(c) for c in dataset.columns] == expected.columns
+        dataset.close()
+
+def test_csv_ingest_rejects_bad_files(tmp_path):
+    import pytest
+    from app.datasets import CsvIngest, CsvUploadError
+    for text, message in (
+        ("", "empty"),
+        ("a,a\n1,2\n", "Duplicate"),
+        ("a,b\n", "no data rows"),
+        ("a\n1,2\n", "2 fields"),
+        ('a\n"open\n', "Unterminated"),
+    ):
+        ingest = CsvIngest(str(tmp_path / "bad.csv"))
+        with pytest.raises(CsvUploadError, match=message):
+            ingest.feed(text.encode())
+            ingest.finish()
+    with pytest.raises(CsvUploadError, match="UTF-8"):
+        CsvIngest(str(tmp_path / "bad.csv")).feed(b"a\n\xff\xfe\n")
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,45 @@
+import json
+import pytest
+from app.encoders import PayloadEncoder, orjson, resolve_backend
+
+DEVICE = {'uuid': 'u1', 'name': 'Dev "1"'}
+PARAMS = [
+    {'param_name': 'temp', 'type': 'float'},
+    {'param_name': 'count', 'type': 'int'},
+    {'param_name': 'ok', 'type': 'bool'},
+    {'param_name': 'seen_at', 'type': 'timestamp'},
+    {'param_name': 'site', 'type': 'string', 'string_value': 'lab-ü'},
+    {'param_name': 'unset', 'type': 'string', 'string_value': None},
+]
+VALUES = {'temp': 21.5, 'count': 3, 'ok': False, 'seen_at': '2024-01-01T00:00:00Z', 'site': 'lab-ü'}
+
+def _reference(device, values, iso_now, sequence_id):
+    payload = {"device_id": device['name'], "time": iso_now, "sequence_id": sequence_id}
+    payload.update(values)
+    return json.dumps(payload)
+
+def test_template_encoder_matches_json_dumps():
+    encoder = PayloadEncoder.compile(DEVICE, params=PARAMS)
+    for seq in (1, 2, 1000):
+        assert encoder.encode('2024-01-01T00:00:00Z', seq, VALUES) == _reference(DEVICE, VALUES, '2024-01-01T00:00:00Z', seq)
+
+def test_template_encoder_param_overrides_header_key():
+    params = [{'param_name': 'time', 'type': 'int'}, {'param_name': 'x', 'type': 'float'}]
+    values = {'time': 7, 'x': 0.1}
+    encoder = PayloadEncoder.compile(DEVICE, params=params)
+    assert encoder.encode('T', 5, values) == _reference(DEVICE, values, 'T', 5)
+
+def test_csv_encoder_from_headers():
+    row = {'temperature': '22.5', 'status': 'NORMAL'}
+    encoder = PayloadEncoder.compile(DEVICE, headers=list(row))
+    assert encoder.encode('T', 1, row) == _reference(DEVICE, row, 'T', 1)
+
+@pytest.mark.skipif(orjson is None, reason="orjson not installed")
+def test_orjson_backend_is_equivalent():
+    encoder = PayloadEncoder.compile(DEVICE, params=PARAMS, backend=resolve_backend("orjson"))
+    data = encoder.encode('2024-01-01T00:00:00Z', 9, VALUES)
+    assert json.loads(data) == json.loads(_reference(DEVICE, VALUES, '2024-01-01T00:00:00Z', 9))
+
+def test_resolve_backend_falls_back():
+    assert resolve_backend("bogus") == "template"
+    assert resolve_backend("json") == "json"
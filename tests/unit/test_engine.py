@@ -1,4 +1,5 @@
 import pytest
+import asyncio
 import os
 import csv
 import json
@@ -68,6 +69,14 @@ async def test_engine_publish_random(mock_mqtt):
     assert payload['temp'] == 20
     assert 'time' in payload
     assert payload['sequence_id'] == 1
+    counts = engine.local_stats()['published_by_mode']['RANDOM']
+    assert counts == {'messages': 1, 'bytes': len(args[1])}
+    assert engine.serialize_time.count == 1
+
+    mock_mqtt.publish.return_value.rc = 4 # MQTT_ERR_NO_CONN
+    assert not await engine.publish_device(device)
+    assert engine.publish_errors == 1
+    assert engine.local_stats()['published_by_mode']['RANDOM']['messages'] == 1
 
 @pytest.mark.asyncio
 async def test_engine_sync_devices(db, mock_mqtt):
@@ -143,6 +152,7 @@ async def test_engine_manual_listener(mock_mqtt):
     msg.payload = b'{"data": "hello"}'
     
     engine.on_message(None, None, msg)
+    engine.inbound.drain()
     
     assert len(engine.manual_received_messages) == 1
     assert engine.manual_received_messages[0]["topic"] == "test/manual/sub"
@@ -156,5 +166,279 @@ async def test_engine_manual_listener(mock_mqtt):
     msg2.topic = "test/manual/sub"
     msg2.payload = b'ignore me'
     engine.on_message(None, None, msg2)
+    engine.inbound.drain()
     
     assert len(engine.manual_received_messages) == 1 # Still 1
+
+@pytest.mark.asyncio
+async def test_engine_device_events_apply_incrementally(db, mock_mqtt):
+    engine = SimulationEngine()
+    for uuid in ("uuid1", "uuid2"):
+        await db.execute("""
+            INSERT INTO devices (uuid, name, status, mode, publish_topic, subscribe_topic, interval_ms)
+            VALUES (?, ?, 'RUNNING', 'RANDOM', 'topic1', 'cmd/shared', 1000)
+        """, (uuid, uuid))
+    await db.execute("""
+        INSERT INTO device_params (device_uuid, param_name, type, min_val, max_val)
+        VALUES ('uuid1', 'temp', 'int', 1, 5)
+    """)
+    await db.commit()
+
+    await engine.device_changed("uuid1")
+    await engine.device_changed("uuid2")
+    assert set(engine.active_devices) == {"uuid1", "uuid2"}
+    assert "uuid1" in engine.scheduler
+    assert engine.device_params["uuid1"][0]["param_name"] == "temp"
+    assert engine.topic_map == {"cmd/shared": ["uuid1", "uuid2"]}
+    # One SUBSCRIBE for the shared topic, and none on a full resync
+    await engine.sync_devices()
+    assert mock_mqtt.subscribe.call_count == 1
+
+    await db.execute("UPDATE devices SET status='STOPPED' WHERE uuid='uuid1'")
+    await db.commit()
+    await engine.device_changed("uuid1")
+    assert "uuid1" not in engine.active_devices
+    assert "uuid1" not in engine.scheduler
+    assert not mock_mqtt.unsubscribe.called
+
+    await engine.device_removed("uuid2")
+    assert engine.topic_map == {}
+    mock_mqtt.unsubscribe.assert_called_once_with("cmd/shared")
+
+def test_engine_qos_backpressure_policy(mock_mqtt, mocker):
+    engine = SimulationEngine()
+    device = {'uuid': 'qos-dev', 'qos': 1, 'interval_ms': 1000}
+    engine.scheduler.schedule('qos-dev', 1000, now=0.0)
+    engine.scheduler.pop_due(0.0)
+
+    window = engine.transport.inflight
+    assert not engine._window_full(device)
+    for mid in range(window.size):
+        window.add(mid, now=1e12) # Never expires during the test
+
+    mocker.patch('app.engine.QOS_BACKPRESSURE_POLICY', 'skip')
+    assert engine._window_full(device)
+    assert (window.dropped, window.deferred) == (1, 0)
+
+    mocker.patch('app.engine.QOS_BACKPRESSURE_POLICY', 'defer')
+    mocker.patch('app.engine.time.monotonic', return_value=0.5)
+    assert engine._window_full(device)
+    assert (window.dropped, window.deferred) == (1, 1)
+    assert engine.scheduler.next_due() == pytest.approx(0.5 + 0.01)
+    assert engine.local_stats()["qos"]["deferred"] == 1
+
+@pytest.mark.asyncio
+async def test_engine_ticks_small_fleet_with_signal_generators(mock_mqtt):
+    engine = SimulationEngine()
+    for n in range(3):
+        uuid = f"sine-{n}"
+        engine.active_devices[uuid] = {'uuid': uuid, 'name': uuid, 'mode': 'RANDOM', 'publish_topic': f"t/{n}",
+                                       'qos': 0, 'retain': False, 'interval_ms': 1000}
+        engine.device_params[uuid] = [{'param_name': 'v', 'type': 'float', 'min_val': 0.0, 'max_val': 10.0,
+                                       'precision': 2, 'generator': 'sine', 'period_s': 4.0}]
+        engine.scheduler.schedule(uuid, 1000, now=0.0)
+
+    engine.running = True
+    task = asyncio.create_task(engine._tick_loop())
+    await asyncio.sleep(0.05)
+    engine.running = False
+    await task
+    assert engine.messages_published == 3
+    assert all(0.0 <= json.loads(c.args[1])['v'] <= 10.0 for c in mock_mqtt.publish.call_args_list)
+
+@pytest.mark.asyncio
+async def test_engine_reloads_csv_rewritten_under_same_name(mock_mqtt, tmp_path):
+    csv_file = tmp_path / "data.csv"
+    csv_file.write_text("temp\n1\n")
+    engine = SimulationEngine()
+    device = {'uuid': 'csv', 'name': 'Csv', 'mode': 'CSV_PLAYBACK', 'publish_topic': 't', 'qos': 0, 'retain': False,
+              'interval_ms': 1000, 'csv_file_path': str(csv_file), 'csv_loop': True}
+    await engine._apply_device(None, dict(device))
+    old = engine.csv_players['csv']
+    await engine._apply_device(None, dict(device))
+    assert engine.csv_players['csv'] is old # Unchanged file: same player
+
+    csv_file.write_text("temp\n2\n3\n")
+    mtime = old.dataset.signature[1] + 10**9
+    os.utime(csv_file, ns=(mtime, mtime))
+    await engine._apply_device(None, dict(device), reload_params=True)
+    player = engine.csv_players['csv']
+    assert player is not old and old.dataset is None
+    assert player.next_row() == {'temp': '2'}
+    player.close()
+
+@pytest.mark.asyncio
+async def test_engine_timestamp_replay_publishes_due_rows(mock_mqtt, tmp_path, mocker):
+    csv_file = tmp_path / "capture.csv"
+    csv_file.write_text("timestamp,temp\n2024-01-01T00:00:00Z,1\n2024-01-01T00:00:00Z,2\n2024-01-01T00:01:00Z,3\n")
+    engine = SimulationEngine()
+    device = {'uuid': 'replay', 'name': 'Replay', 'mode': 'CSV_PLAYBACK', 'publish_topic': 't',
+              'qos': 0, 'retain': False, 'interval_ms': 1000}
+    player = CsvPlayer(str(csv_file), loop=False, speed=60.0)
+    engine.csv_players['replay'] = player
+    engine.scheduler.schedule('replay', 1000, now=0.0)
+    mocker.patch('app.engine.time.monotonic', return_value=5.0)
+
+    await engine._replay_csv(device, player, "2024-01-01T00:00:00Z")
+    temps = [json.loads(c.args[1])['temp'] for c in mock_mqtt.publish.call_args_list]
+    assert temps == ['1', '2']
+    assert engine.messages_published == 2
+    # The third row is a minute later in the file, one second at 60x
+    assert engine.scheduler.next_due() == 6.0
+    assert engine.local_stats()["csv_replay"]["rows_replayed"] == 2
+
+    # Refused by the client: not counted as published
+    mock_mqtt.publish.return_value.rc = 4 # MQTT_ERR_NO_CONN
+    mocker.patch('app.engine.time.monotonic', return_value=7.0)
+    await engine._replay_csv(device, player, "2024-01-01T00:00:00Z")
+    assert mock_mqtt.publish.call_count == 3
+    assert (engine.messages_published, engine.publish_errors) == (2, 1)
+    player.close()
+
+@pytest.mark.asyncio
+async def test_engine_timestamp_replay_stops_at_full_window(mock_mqtt, tmp_path, mocker):
+    csv_file = tmp_path / "capture.csv"
+    csv_file.write_text("timestamp,temp\n" + "".join(f"2024-01-01T00:00:00Z,{n}\n" for n in range(3)))
+    engine = SimulationEngine()
+    device = {'uuid': 'replay', 'name': 'Replay', 'mode': 'CSV_PLAYBACK', 'publish_topic': 't',
+              'qos': 1, 'retain': False, 'interval_ms': 1000}
+    player = CsvPlayer(str(csv_file), loop=False, speed=1.0)
+    engine.csv_players['replay'] = player
+    engine.scheduler.schedule('replay', 1000, now=0.0)
+    mocker.patch('app.engine.time.monotonic', return_value=5.0)
+    window = engine.transport.inflight
+    for mid in range(window.size - 1):
+        window.add(-mid - 1, now=1e12)
+
+    # One slot left: the first row takes it, the other two wait for the next tick
+    await engine._replay_csv(device, player, "2024-01-01T00:00:00Z")
+    assert mock_mqtt.publish.call_count == 1
+    assert engine.scheduler.next_due() == 5.0
+    assert player.rows_replayed == 1
+
+    window.pending.clear()
+    await engine._replay_csv(device, player, "2024-01-01T00:00:00Z")
+    temps = [json.loads(c.args[1])['temp'] for c in mock_mqtt.publish.call_args_list]
+    assert temps == ['0', '1', '2']
+    assert player.rows_replayed == 3
+    player.close()
+
+@pytest.mark.asyncio
+async def test_engine_routes_wildcard_subscriptions(mock_mqtt):
+    engine = SimulationEngine()
+    engine._subscribe_device("dev1", "cmd/+/set")
+    engine._subscribe_device("dev2", "cmd/#")
+    await engine.subscribe_manual("cmd/dev1/#")
+
+    msg = MagicMock()
+    msg.topic = "cmd/dev1/set"
+    msg.payload = b'{"on": true}'
+    engine.on_message(None, None, msg)
+    engine.inbound.drain()
+    assert set(engine.received_messages) == {"dev1", "dev2"}
+    assert len(engine.manual_received_messages) == 1
+
+    # Unsubscribed device no longer receives; the others still do
+    engine._unsubscribe_device("dev2", "cmd/#")
+    msg.topic = "cmd/dev9/set"
+    engine.on_message(None, None, msg)
+    engine.inbound.drain()
+    assert len(engine.received_messages["dev1"]) == 2
+    assert len(engine.received_messages["dev2"]) == 1
+    assert len(engine.manual_received_messages) == 1
+
+@pytest.mark.asyncio
+async def test_engine_message_history_outlives_stop(db, mock_mqtt):
+    engine = SimulationEngine()
+    await db.execute("""
+        INSERT INTO devices (uuid, name, status, mode, publish_topic, subscribe_topic, interval_ms)
+        VALUES ('dev1', 'dev1', 'RUNNING', 'RANDOM', 'topic1', 'cmd/dev1', 1000)
+    """)
+    await db.commit()
+    await engine.device_changed("dev1")
+
+    msg = MagicMock()
+    msg.topic = "cmd/dev1"
+    for i in range(8):
+        msg.payload = str(i).encode()
+        engine.on_message(None, None, msg)
+    engine.inbound.drain()
+    assert len(engine.received_messages["dev1"]) == 8 # Deeper than the 5-message preview
+    assert [m["payload"] for m in (await engine.device_messages())["dev1"]] == ["3", "4", "5", "6", "7"]
+
+    await db.execute("UPDATE devices SET status='STOPPED' WHERE uuid='dev1'")
+    await db.commit()
+    await engine.device_changed("dev1")
+    assert [m["payload"] for m in await engine.query_messages(key="dev1", limit=2)] == ["7", "6"]
+
+    await engine.device_removed("dev1")
+    assert "dev1" not in engine.received_messages
+
+@pytest.mark.asyncio
+async def test_engine_rules_react_to_commands(db, mock_mqtt):
+    engine = SimulationEngine()
+    await db.execute("""
+        INSERT INTO devices (uuid, name, status, mode, publish_topic, subscribe_topic, interval_ms)
+        VALUES ('dev1', 'Thermostat', 'RUNNING', 'RANDOM', 'sensors/dev1', 'cmd/dev1/#', 1000)
+    """)
+    await db.execute("""
+        INSERT INTO device_params (device_uuid, param_name, type, min_val, max_val, precision)
+        VALUES ('dev1', 'temp', 'float', 18, 22, 1)
+    """)
+    await db.executemany("""
+        INSERT INTO device_rules (device_uuid, topic, field, action, value_field, reply_topic)
+        VALUES ('dev1', ?, ?, ?, ?, ?)
+    """, [
+        ("cmd/dev1/ping", None, "reply", None, "acks/dev1"),
+        (None, "interval", "set_interval", "interval", None),
+        (None, "setpoint", "set_range", "setpoint", None),
+    ])
+    await db.execute("UPDATE device_rules SET param_name = 'temp' WHERE action = 'set_range'")
+    await db.commit()
+    await engine.sync_devices()
+    assert len(engine.device_rules["dev1"]) == 3
+
+    msg = MagicMock()
+    msg.topic = "cmd/dev1/ping"
+    msg.payload = b'{"id": 1}'
+    engine.on_message(None, None, msg)
+    msg.topic = "cmd/dev1/set"
+    msg.payload = b'{"interval": 250, "setpoint": 30}'
+    engine.on_message(None, None, msg)
+    engine.inbound.drain()
+
+    topic, reply = mock_mqtt.publish.call_args_list[-1][0][:2]
+    assert topic == "acks/dev1"
+    assert json.loads(reply)["request"] == {"id": 1}
+    assert engine.device_params["dev1"][0]["min_val"] == 28 # Re-centered, same width
+    assert engine.device_params["dev1"][0]["max_val"] == 32
+    stats = engine.local_stats()["rules"]
+    assert stats["matched"] == 2
+    assert stats["replies"] == 1
+    assert stats["latency"]["count"] == 2
+
+    # Rule changes survive the periodic resync, but not an edit
+    await engine.sync_devices()
+    assert engine.active_devices["dev1"]["interval_ms"] == 250
+    await engine.device_changed("dev1")
+    assert engine.active_devices["dev1"]["interval_ms"] == 1000
+    assert engine.device_params["dev1"][0]["min_val"] == 18
+
+@pytest.mark.asyncio
+async def test_engine_load_profile_limits_covered_devices(mock_mqtt):
+    engine = SimulationEngine()
+    await engine.set_load_profile({'name': 'ramp', 'match': 'sensors/#', 'phases': [
+        {'type': 'soak', 'duration_s': 60, 'rate': 10},
+    ]})
+    runner = engine.load_profiles['ramp']
+    covered = {'uuid': 'a', 'publish_topic': 'sensors/a'}
+    other = {'uuid': 'b', 'publish_topic': 'meters/b'}
+
+    runner.refill(runner.started + 0.25) # 2.5 tokens
+    assert [engine._admit(covered) for _ in range(3)] == [True, True, False]
+    assert all(engine._admit(other) for _ in range(10))
+    assert engine.local_stats()['load_profiles'][0]['throttled'] == 1
+
+    assert await engine.clear_load_profile('ramp')
+    assert engine._admit(covered)
+    assert not await engine.clear_load_profile('ramp')
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import pytest
+from app.events import EventHub
+
+@pytest.mark.asyncio
+async def test_hub_streams_events_as_sse():
+    hub = EventHub()
+    hub.publish("device", {"uuid": "nobody-listening"}) # No-op without clients
+    subscriber = hub.subscribe()
+    stream = hub.stream(subscriber)
+    assert await stream.__anext__() == ": connected\n\n"
+
+    hub.publish("device", {"action": "status", "uuid": "d1", "status": "RUNNING"})
+    chunk = await stream.__anext__()
+    event, data = chunk.strip().split("\n")
+    assert event == "event: device"
+    assert json.loads(data[len("data: "):])["status"] == "RUNNING"
+
+    await stream.aclose()
+    assert hub.client_count == 0
+
+@pytest.mark.asyncio
+async def test_hub_slow_client_gets_resync():
+    hub = EventHub(queue_size=2)
+    subscriber = hub.subscribe()
+    stream = hub.stream(subscriber)
+    await stream.__anext__()
+    for i in range(5):
+        hub.publish("message", {"n": i})
+    assert subscriber.lagged
+
+    chunks = [await stream.__anext__() for _ in range(3)]
+    assert [c.split("\n")[0] for c in chunks] == ["event: message", "event: message", "event: resync"]
+    # Deltas flow again after the resync
+    hub.publish("message", {"n": 5})
+    assert '"n": 5' in await stream.__anext__()
+    await stream.aclose()
+
+@pytest.mark.asyncio
+async def test_hub_pushes_stats_with_rate_only_when_changed():
+    hub = EventHub()
+    subscriber = hub.subscribe()
+    counts = iter([100, 300, 300, 300, 300])
+
+    async def source():
+        return {"mqtt_connected": True, "total_devices": 2, "running_devices": 2, "messages_published": next(counts)}
+
+    hub.start_stats(source, interval_s=0.01)
+    first = await asyncio.wait_for(subscriber.queue.get(), 1)
+    second = await asyncio.wait_for(subscriber.queue.get(), 1)
+    third = await asyncio.wait_for(subscriber.queue.get(), 1)
+    await asyncio.sleep(0.05) # Remaining polls repeat the third summary
+    await hub.stop_stats()
+
+    assert first[0] == "stats" and first[1]["messages_per_s"] == 0.0
+    assert second[1]["messages_published"] == 300 and second[1]["messages_per_s"] > 0
+    assert third[1]["messages_per_s"] == 0.0
+    assert subscriber.queue.empty()
+
+@pytest.mark.asyncio
+async def test_worker_events_forwarded_in_batches(mocker):
+    import multiprocessing
+    from app.events import EventForwarder
+    from app.workers import WorkerPool
+    mocker.patch("app.events.FORWARD_INTERVAL_S", 0.01)
+
+    coordinator = EventHub()
+    listening = multiprocessing.Value("b", 0, lock=False)
+    coordinator.share_listening(listening)
+    receive, send = multiprocessing.Pipe(duplex=False)
+    worker = EventHub()
+    worker.forwarder = EventForwarder(send, listening, max_batch=2)
+    worker.forwarder.start()
+
+    worker.publish("message", {"n": 0}) # Nobody connected to the coordinator: dropped
+    subscriber = coordinator.subscribe()
+    assert listening.value == 1
+    for i in range(1, 4):
+        worker.publish("message", {"n": i})
+
+    # The coordinator's reader republishes each batch
+    pool = WorkerPool(1, on_events=lambda batch: [coordinator.publish(e, d) for e, d in batch])
+    reader = asyncio.create_task(pool._read_events(receive))
+    received = [await asyncio.wait_for(subscriber.queue.get(), 2) for _ in range(3)]
+    assert received == [("message", {"n": 1}), ("message", {"n": 2}), ("resync", {})]
+
+    await worker.forwarder.stop()
+    send.close()
+    await asyncio.wait_for(reader, 2)
+    coordinator.unsubscribe(subscriber)
+    assert listening.value == 0
@@ -0,0 +1,42 @@
+import asyncio
+import threading
+import pytest
+from app.inbound import InboundPipeline
+
+def test_pipeline_bounded_drops_oldest():
+    batches = []
+    pipeline = InboundPipeline(batches.append, maxsize=3, batch_size=2)
+    for i in range(5):
+        pipeline.put("t", str(i).encode())
+    assert len(pipeline) == 3
+    assert pipeline.stats()["dropped"] == 2
+
+    pipeline.drain()
+    assert [[payload for _, payload, _ in batch] for batch in batches] == [[b"2", b"3"], [b"4"]]
+    assert pipeline.stats() == {"queued": 0, "received": 5, "processed": 3, "dropped": 2, "batches": 2, "max_depth": 3}
+
+def test_pipeline_survives_handler_errors():
+    def handler(batch):
+        raise ValueError("bad batch")
+    pipeline = InboundPipeline(handler)
+    pipeline.put("t", b"x")
+    pipeline.drain()
+    assert pipeline.stats()["processed"] == 1
+
+@pytest.mark.asyncio
+async def test_pipeline_consumes_from_other_threads():
+    received = []
+    pipeline = InboundPipeline(received.extend, batch_size=100)
+    pipeline.start()
+    await asyncio.sleep(0) # Consumer goes idle
+
+    thread = threading.Thread(target=lambda: [pipeline.put("t", b"x") for _ in range(1000)])
+    thread.start()
+    thread.join()
+    for _ in range(100):
+        if len(received) == 1000:
+            break
+        await asyncio.sleep(0.01)
+    assert len(received) == 1000
+    assert pipeline.stats()["batches"] >= 10
+    await pipeline.stop()
@@ -0,0 +1,63 @@
+import json
+from app.messages import MessageRing, MessageStore, entry_size
+
+def msg(ts, topic="cmd/dev1/set", payload="x"):
+    return {"timestamp": ts, "topic": topic, "payload": payload}
+
+def test_ring_bounded_by_depth_and_bytes():
+    ring = MessageRing(3, 10_000)
+    evicted = [m for i in range(5) for m in ring.append(msg(i))]
+    assert [m["timestamp"] for m in ring] == [2, 3, 4]
+    assert [m["timestamp"] for m in evicted] == [0, 1]
+
+    size = entry_size(msg(0))
+    ring = MessageRing(100, 2 * size)
+    for i in range(5):
+        ring.append(msg(i))
+    assert len(ring) == 2
+    assert ring.bytes == 2 * size
+    # A single message over budget is still kept
+    ring.append(msg(5, payload="y" * 3 * size))
+    assert [m["timestamp"] for m in ring] == [5]
+
+def test_ring_query_by_topic_and_time():
+    ring = MessageRing(100, 1_000_000)
+    for i in range(10):
+        ring.append(msg(i, topic=f"cmd/dev{i % 2}/set"))
+    assert [m["timestamp"] for m in ring.query("cmd/dev1/#")] == [9, 7, 5, 3, 1]
+    assert [m["timestamp"] for m in ring.query(since=4, until=6)] == [6, 5, 4]
+    assert [m["timestamp"] for m in ring.query(limit=2)] == [9, 8]
+    assert [m["timestamp"] for m in ring.latest(3)] == [7, 8, 9]
+
+def test_store_global_budget_evicts_oldest_overall():
+    size = entry_size(msg(0))
+    store = MessageStore(depth=100, key_budget=1_000_000, global_budget=4 * size)
+    for i in range(3):
+        store.add("a", msg(i))
+    for i in range(3, 6):
+        store.add("b", msg(i))
+    assert [m["timestamp"] for m in store["a"]] == [2]
+    assert [m["timestamp"] for m in store["b"]] == [3, 4, 5]
+    assert store.stats()["messages"] == 4
+    assert store.stats()["evicted"] == 2
+    assert store.bytes == 4 * size
+
+    store.discard("b")
+    assert "b" not in store
+    assert store.bytes == size
+    assert store.latest(5) == {"a": [msg(2)]}
+
+def test_store_spills_evicted_messages(tmp_path):
+    spill = tmp_path / "spill.ndjson"
+    store = MessageStore(depth=2, key_budget=1_000_000, global_budget=1_000_000, spill_path=str(spill))
+    for i in range(5):
+        store.add("a", msg(i))
+    store.flush()
+    assert [json.loads(line)["timestamp"] for line in spill.read_text().splitlines()] == [0, 1, 2]
+    assert store.stats()["spilled"] == 3
+
+    assert [m["timestamp"] for m in store.query("a")] == [4, 3]
+    assert [m["timestamp"] for m in store.query("a", spilled=True)] == [4, 3, 2, 1, 0]
+    assert [m["timestamp"] for m in store.query(since=1, until=3, spilled=True)] == [3, 2, 1]
+    assert store.query("other", spilled=True) == []
+    store.close()
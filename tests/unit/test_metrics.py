@@ -0,0 +1,37 @@
+from app.metrics import Histogram, PrometheusText
+
+def test_histogram_buckets_and_quantiles():
+    hist = Histogram(buckets=[0.001, 0.01, 0.1])
+    for value in [0.0005, 0.0005, 0.005, 0.05, 5.0]:
+        hist.observe(value)
+
+    snap = hist.snapshot()
+    assert snap["count"] == 5
+    assert snap["max"] == 5.0
+    assert snap["buckets"] == {"0.001": 2, "0.01": 1, "0.1": 1, "+Inf": 1}
+    assert hist.quantile(0.4) == 0.001
+    assert hist.quantile(0.99) == 5.0
+
+    hist.reset()
+    assert hist.snapshot()["count"] == 0
+
+def test_prometheus_text_families():
+    hist = Histogram(buckets=[0.01, 0.1])
+    for value in [0.005, 0.05, 1.0]:
+        hist.observe(value)
+
+    out = PrometheusText()
+    out.counter("sent_total", "Messages", 3, {"mode": "RANDOM"})
+    out.counter("sent_total", "Messages", 1, {"mode": 'say "hi"'})
+    out.histogram("lag_seconds", "Lag", hist.snapshot())
+    lines = out.render().splitlines()
+
+    assert lines.count("# TYPE sent_total counter") == 1
+    assert 'sent_total{mode="RANDOM"} 3.0' in lines
+    assert 'sent_total{mode="say \\"hi\\""} 1.0' in lines
+    assert "# TYPE lag_seconds histogram" in lines
+    # Buckets are cumulative
+    assert 'lag_seconds_bucket{le="0.01"} 1' in lines
+    assert 'lag_seconds_bucket{le="0.1"} 2' in lines
+    assert 'lag_seconds_bucket{le="+Inf"} 3' in lines
+    assert "lag_seconds_count 3" in lines
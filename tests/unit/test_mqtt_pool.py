@@ -0,0 +1,48 @@
+from unittest.mock import MagicMock
+from app.mqtt_pool import MqttConnectionPool, parse_pool_size
+
+def _pool(size):
+    opened = []
+    def factory(client_id):
+        client = MagicMock()
+        client.client_id = client_id
+        opened.append(client)
+        return client
+    pool = MqttConnectionPool(size, "sim", transport_factory=factory)
+    return pool, opened
+
+def test_parse_pool_size():
+    assert parse_pool_size("1") == 1
+    assert parse_pool_size("8") == 8
+    assert parse_pool_size("per-device") is None
+
+def test_single_connection_uses_primary():
+    pool, opened = _pool(1)
+    pool.start()
+    pool.assign("a")
+    assert pool.client_for("a") is None
+    assert opened == []
+
+def test_shared_pool_assigns_stably():
+    pool, opened = _pool(3)
+    pool.start()
+    assert [c.client_id for c in opened] == ["sim-pool-0", "sim-pool-1", "sim-pool-2"]
+    assert all(c.connect.called and c.reconnect_delay_set.called for c in opened)
+    assert pool.client_for("device-x") is pool.client_for("device-x")
+    assert {id(pool.client_for(f"d{i}")) for i in range(50)} == {id(c) for c in opened}
+
+    pool.stop()
+    assert all(c.disconnect.called for c in opened)
+    assert pool.clients() == []
+
+def test_per_device_clients_follow_device_lifecycle():
+    pool, opened = _pool(None)
+    pool.start()
+    pool.assign("dev-1")
+    pool.assign("dev-1")
+    assert [c.client_id for c in opened] == ["dev-1"]
+    assert pool.client_for("dev-1") is opened[0]
+
+    pool.release("dev-1")
+    assert opened[0].disconnect.called
+    assert pool.client_for("dev-1") is None
@@ -0,0 +1,50 @@
+import pytest
+from app.payloads import BatchPayloadGenerator, generate_values, np
+
+PARAMS = [
+    {'param_name': 'count', 'type': 'int', 'min_val': 1, 'max_val': 3, 'precision': None},
+    {'param_name': 'temp', 'type': 'float', 'min_val': 20.0, 'max_val': 30.0, 'precision': 1},
+    {'param_name': 'ok', 'type': 'bool', 'min_val': 0, 'max_val': 1, 'precision': None},
+    {'param_name': 'ts', 'type': 'timestamp', 'min_val': 0, 'max_val': 0, 'precision': None},
+    {'param_name': 'site', 'type': 'string', 'min_val': 0, 'max_val': 0, 'precision': None, 'string_value': 'lab'},
+]
+
+def _check(values):
+    assert set(values) == {'count', 'temp', 'ok', 'ts', 'site'}
+    assert type(values['count']) is int and 1 <= values['count'] <= 3
+    assert type(values['temp']) is float and 20.0 <= values['temp'] <= 30.0
+    assert values['temp'] == round(values['temp'], 1)
+    assert type(values['ok']) is bool
+    assert values['ts'] == "2024-01-01T00:00:00Z"
+    assert values['site'] == 'lab'
+
+def test_scalar_generate_values():
+    _check(generate_values(PARAMS, "2024-01-01T00:00:00Z"))
+
+@pytest.mark.skipif(np is None, reason="NumPy not installed")
+def test_batch_generator_matches_scalar_semantics():
+    generator = BatchPayloadGenerator(seed=1)
+    batch = [(f"dev-{i}", PARAMS) for i in range(50)]
+    # A device with a different schema is generated alongside
+    batch.append(("other", PARAMS[:1]))
+
+    values = generator.generate(batch, "2024-01-01T00:00:00Z")
+    assert len(values) == 51
+    for i in range(50):
+        _check(values[f"dev-{i}"])
+    assert set(values["other"]) == {'count'}
+
+@pytest.mark.skipif(np is None, reason="NumPy not installed")
+def test_batch_generator_per_device_ranges_and_precision():
+    generator = BatchPayloadGenerator(seed=2)
+    batch = []
+    for i in range(20):
+        batch.append((f"dev-{i}", [
+            {'param_name': 'v', 'type': 'float', 'min_val': i, 'max_val': i + 0.5, 'precision': i % 2},
+        ]))
+
+    values = generator.generate(batch, "t")
+    for i in range(20):
+        v = values[f"dev-{i}"]['v']
+        assert i <= v <= i + 0.5
+        assert v == round(v, i % 2)
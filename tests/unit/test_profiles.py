@@ -0,0 +1,44 @@
+import pytest
+from app.profiles import ProfileRunner, TokenBucket, phase_rate
+
+def test_phase_rates():
+    ramp = {'type': 'ramp', 'duration_s': 10, 'to_rate': 100}
+    assert phase_rate(ramp, 5, 0) == 50
+    assert phase_rate({**ramp, 'from_rate': 20}, 5, 0) == 60
+    burst = {'type': 'burst', 'duration_s': 60, 'rate': 10, 'burst_rate': 500, 'burst_s': 2, 'period_s': 10}
+    assert [phase_rate(burst, t, 0) for t in (0, 1.5, 2, 11)] == [500, 500, 10, 500]
+    diurnal = {'type': 'diurnal', 'duration_s': 100, 'min_rate': 10, 'max_rate': 110, 'period_s': 100, 'peak_s': 25}
+    assert phase_rate(diurnal, 25, 0) == pytest.approx(110)
+    assert phase_rate(diurnal, 75, 0) == pytest.approx(10)
+
+def test_runner_walks_phases_and_finishes():
+    profile = {'name': 'p', 'phases': [
+        {'type': 'ramp', 'duration_s': 10, 'to_rate': 100},
+        {'type': 'soak', 'duration_s': 10, 'rate': 100},
+        {'type': 'ramp', 'duration_s': 10, 'to_rate': 0},
+    ]}
+    runner = ProfileRunner(profile, now=0.0, share=0.5)
+    assert runner.target_at(5) == 25 # Half of 50: this engine's share
+    assert runner.target_at(15) == 50
+    assert runner.target_at(25) == 25 # Second ramp starts where the soak ended
+    assert runner.target_at(30) is None
+    assert ProfileRunner({**profile, 'loop': True}, now=0.0).target_at(35) == 50
+
+def test_token_bucket_holds_target_rate():
+    profile = {'name': 'p', 'phases': [{'type': 'soak', 'duration_s': 100, 'rate': 200}]}
+    runner = ProfileRunner(profile, now=0.0)
+    # 1000 devices asking every 100ms tick for 10s: demand 10000/s, target 200/s
+    for tick in range(1, 101):
+        now = tick * 0.1
+        runner.refill(now)
+        for _ in range(1000):
+            runner.admit()
+    assert runner.admitted == pytest.approx(200 * 10, rel=0.01)
+    assert runner.achieved == pytest.approx(200, rel=0.05)
+    assert runner.throttled == 100_000 - runner.admitted
+
+    # A lull is made up only up to the bucket depth
+    bucket = TokenBucket(depth_s=0.25)
+    bucket.refill(0, 100)
+    bucket.refill(10, 100)
+    assert sum(bucket.take() for _ in range(100)) == 25
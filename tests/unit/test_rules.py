@@ -0,0 +1,44 @@
+import json
+from app.rules import RuleSet
+
+DEVICE = {"uuid": "dev1", "name": "Thermostat", "publish_topic": "sensors/dev1"}
+
+def rule(action, **fields):
+    return {"action": action, **fields}
+
+def test_rules_match_topic_and_field():
+    rules = RuleSet(DEVICE, [
+        rule("reply", topic="cmd/+/ping"),
+        rule("set_interval", field="cmd", equals="fast", interval_ms=100),
+        rule("set_range", field="setpoint", param_name="temp", value_field="setpoint"),
+        rule("reply", field="power", equals="true"),
+    ])
+    actions = lambda topic, payload: [r.action for r in rules.evaluate(topic, payload)[1]]
+    assert actions("cmd/dev1/ping", "hello") == ["reply"] # Non-JSON payloads only match field-less rules
+    assert actions("cmd/dev1/set", '{"cmd": "fast"}') == ["set_interval"]
+    assert actions("cmd/dev1/set", '{"cmd": "slow"}') == []
+    assert actions("cmd/dev1/set", '{"setpoint": 21.5, "power": true}') == ["set_range", "reply"]
+
+    document, matched = rules.evaluate("cmd/dev1/set", '{"setpoint": 21.5}')
+    assert matched[0].value(document) == 21.5
+
+def test_rules_nested_fields_and_values():
+    rules = RuleSet(DEVICE, [rule("set_interval", field="config.mode", equals="1", value_field="config.every")])
+    document, matched = rules.evaluate("c", '{"config": {"mode": 1, "every": "250"}}')
+    assert matched[0].value(document) == 250.0
+    document, matched = rules.evaluate("c", '{"config": {"mode": 1, "every": "soon"}}')
+    assert matched[0].value(document) is None
+    assert rules.evaluate("c", '{"config": 1}')[1] == []
+
+def test_rules_reply_payloads():
+    rules = RuleSet(DEVICE, [
+        rule("reply"),
+        rule("reply", reply_topic="acks/{uuid}", reply_payload='{"id": "$id", "by": "$name", "ok": true}'),
+    ])
+    document, (default, templated) = rules.evaluate("cmd/dev1", '{"id": 7}')
+    assert default.reply_topic == "sensors/dev1/reply"
+    ack = json.loads(rules.reply(default, "cmd/dev1", '{"id": 7}', document, "2024-01-01T00:00:00Z"))
+    assert ack == {"device_id": "Thermostat", "time": "2024-01-01T00:00:00Z", "topic": "cmd/dev1", "request": {"id": 7}}
+
+    assert templated.reply_topic == "acks/dev1"
+    assert json.loads(rules.reply(templated, "cmd/dev1", '{"id": 7}', document, "t")) == {"id": "7", "by": "Thermostat", "ok": True}
@@ -0,0 +1,79 @@
+import pytest
+from app.scheduler import DeviceScheduler
+
+def test_scheduler_pops_only_due_devices():
+    scheduler = DeviceScheduler()
+    scheduler.schedule("fast", 100, now=0.0)
+    scheduler.schedule("slow", 1000, now=0.0)
+
+    # Both publish immediately on first schedule
+    assert sorted(u for u, _ in scheduler.pop_due(0.0)) == ["fast", "slow"]
+
+    assert scheduler.pop_due(0.05) == []
+    assert scheduler.pop_due(0.1) == [("fast", 0.1)]
+    assert scheduler.next_due() == 0.2
+
+def test_scheduler_keeps_phase_when_late():
+    scheduler = DeviceScheduler()
+    scheduler.schedule("dev", 100, now=0.0)
+    scheduler.pop_due(0.0)
+
+    # Late by 2.5 intervals: one publish, next deadline stays on the 100ms grid
+    assert scheduler.pop_due(0.35) == [("dev", 0.1)]
+    assert scheduler.next_due() == 0.4
+
+def test_scheduler_interval_change_and_remove():
+    scheduler = DeviceScheduler()
+    scheduler.schedule("dev", 1000, now=0.0)
+    scheduler.pop_due(0.0)
+
+    # Shorter interval is anchored on the last publish
+    scheduler.schedule("dev", 200, now=0.1)
+    assert scheduler.next_due() == 0.2
+    assert scheduler.pop_due(1.0)[0][0] == "dev"
+
+    scheduler.remove("dev")
+    assert "dev" not in scheduler
+    assert scheduler.pop_due(10.0) == []
+    assert scheduler.next_due() is None
+
+def test_scheduler_phase_offset_spreads_first_publish():
+    scheduler = DeviceScheduler()
+    scheduler.schedule("a", 10, now=0.0, phase_ms=0)
+    scheduler.schedule("b", 10, now=0.0, phase_ms=5)
+    scheduler.schedule("c", 10, now=0.0, phase_ms=25) # Wraps to 5ms
+
+    assert [u for u, _ in scheduler.pop_due(0.0)] == ["a"]
+    assert sorted(u for u, _ in scheduler.pop_due(0.005)) == ["b", "c"]
+
+def test_scheduler_phase_change_shifts_grid():
+    scheduler = DeviceScheduler()
+    scheduler.schedule("dev", 1000, now=0.0, phase_ms=100)
+    scheduler.pop_due(0.1)
+    assert scheduler.next_due() == 1.1
+
+    # Later phase: same interval, grid moved by the difference
+    scheduler.schedule("dev", 1000, now=0.5, phase_ms=400)
+    assert abs(scheduler.next_due() - 1.4) < 1e-9
+    # Earlier phase: the earliest slot still ahead of now
+    scheduler.schedule("dev", 1000, now=0.5, phase_ms=0)
+    assert abs(scheduler.next_due() - 1.0) < 1e-9
+    # No phase given (e.g. a rule changing the interval) keeps it
+    scheduler.schedule("dev", 1000, now=0.5)
+    assert abs(scheduler.next_due() - 1.0) < 1e-9
+
+def test_scheduler_defer_keeps_phase_grid():
+    scheduler = DeviceScheduler()
+    scheduler.schedule("dev", 100, now=0.0)
+    scheduler.pop_due(0.0)
+    scheduler.pop_due(0.1)
+
+    # Retry 10ms later, then resume on the 100ms grid
+    assert scheduler.defer("dev", 0.11)
+    assert scheduler.pop_due(0.11) == [("dev", 0.11)]
+    assert scheduler.next_due() == 0.2
+
+    # A retry that would reach the next slot is refused
+    scheduler.pop_due(0.2)
+    assert not scheduler.defer("dev", 0.35)
+    assert scheduler.next_due() == pytest.approx(0.3)
@@ -0,0 +1,82 @@
+import math
+import pytest
+from app.payloads import BatchPayloadGenerator, generate_values, np
+from app.signals import SignalState, next_value
+
+def param(generator, **fields):
+    return {'param_name': 'v', 'type': 'float', 'min_val': 0.0, 'max_val': 10.0, 'precision': 3,
+            'generator': generator, **fields}
+
+def series(p, count, now=1000.0, dt=1.0):
+    state = SignalState(1)
+    slot = state.row("dev")
+    return [next_value(p, now + i * dt, state, slot) for i in range(count)]
+
+def test_random_walk_bounded_and_continuous():
+    values = series(param('random_walk', step=0.5), 500)
+    assert values[0] == 5.0 # Starts mid-range
+    assert all(0.0 <= v <= 10.0 for v in values)
+    assert all(abs(b - a) <= 0.5 for a, b in zip(values, values[1:]))
+
+def test_sine_drift_and_step_shapes():
+    sine = param('sine', period_s=4.0, phase_s=1.0)
+    assert next_value(sine, 0.0) == pytest.approx(10.0) # Quarter period in: the peak
+    assert next_value(sine, 2.0) == pytest.approx(0.0)
+
+    assert series(param('drift', step=4.0), 4) == [0.0, 4.0, 8.0, 2.0] # Wraps around the range
+    assert series(param('drift', step=-4.0), 2) == [10.0, 6.0]
+
+    held = series(param('step', period_s=5.0), 12)
+    assert len(set(held[0:5])) == 1 and len(set(held[5:10])) == 1
+    assert held[4] != held[5]
+
+def test_noise_and_spikes():
+    flat = series(param('spike', spike_prob=0.0), 5)
+    assert flat == [5.0] * 5
+    spikes = series(param('spike', spike_prob=1.0), 50)
+    assert set(spikes) == {-5.0, 15.0} # One range width off the baseline
+    values = series(param('gaussian', noise=1.0), 2000)
+    assert 4.8 < sum(values) / len(values) < 5.2
+
+def test_state_rows_are_reused():
+    state = SignalState(2)
+    assert [state.row(u) for u in ("a", "b", "a")] == [0, 1, 0]
+    state.values[1] = 3.0
+    state.release("a")
+    assert state.row("c") == 0
+    assert math.isnan(state.values[1]) # Reset for the new device
+    assert len(state.values) == 4
+
+def test_scalar_generate_values_keeps_state_and_types():
+    params = [param('drift', step=1.0), {**param('random_walk'), 'param_name': 'n', 'type': 'int', 'precision': None}]
+    state = SignalState(2)
+    slot = state.row("dev")
+    first = generate_values(params, "t", state, slot)
+    second = generate_values(params, "t", state, slot)
+    assert (first['v'], second['v']) == (0.0, 1.0)
+    assert type(second['n']) is int
+
+@pytest.mark.skipif(np is None, reason="NumPy not installed")
+def test_batch_signals_follow_per_device_state():
+    generator = BatchPayloadGenerator(seed=3)
+    batch = [(f"dev-{i}", [param('drift', step=float(i)), param('random_walk', step=0.1)]) for i in range(1, 21)]
+    for p in batch:
+        p[1][1]['param_name'] = 'w'
+    first = generator.generate(batch, "t")
+    second = generator.generate(batch, "t")
+    for i in range(1, 21):
+        uuid = f"dev-{i}"
+        assert first[uuid]['v'] == 0.0
+        assert second[uuid]['v'] == pytest.approx(i % 10.0)
+        assert abs(second[uuid]['w'] - first[uuid]['w']) <= 0.1 + 1e-9
+
+    # A released device starts over
+    generator.release("dev-3")
+    assert generator.generate(batch, "t")["dev-3"]['v'] == 0.0
+
+def test_batch_of_one_stateful_device():
+    # Below BATCH_MIN_GROUP: the scalar path still gets a row in the (empty) schema state
+    generator = BatchPayloadGenerator(seed=4)
+    batch = [("solo", [param('sine', period_s=4.0)])]
+    assert 0.0 <= generator.generate(batch, "t")["solo"]['v'] <= 10.0
+    assert 0.0 <= generator.generate(batch, "t")["solo"]['v'] <= 10.0
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+import pytest
+from app.synthetic import SyntheticLoad, fan_out
+from app.transport import InflightWindow
+
+class FakeTransport:
+    queue_depth = 0
+    max_queued = 10000
+
+    def __init__(self, window=100, rc=0):
+        self.published = []
+        self.inflight = InflightWindow(window)
+        self.rc = rc
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, payload))
+        mid = len(self.published)
+        if qos:
+            self.inflight.add(mid, time.monotonic())
+        return SimpleNamespace(rc=self.rc, mid=mid)
+
+def config(**overrides):
+    return {"rate": 2000, "devices": None, "interval_ms": 100, "topic": "synthetic/{n}", "name": "v-{n}",
+            "params": [{"param_name": "t", "type": "float", "min_val": 1, "max_val": 2, "precision": 1}],
+            "qos": 0, "duration_s": 0.5, **overrides}
+
+def test_fan_out():
+    assert fan_out(200_000, 1000) == 200_000
+    assert fan_out(500, 100) == 50
+    assert fan_out(0.1, 1000) == 1
+
+@pytest.mark.asyncio
+async def test_synthetic_load_hits_rate_round_robin():
+    transport = FakeTransport()
+    load = SyntheticLoad(config(), lambda: [transport])
+    assert load.devices == 200
+    load.start()
+    await asyncio.sleep(0.6)
+    assert load.finished
+
+    assert 900 <= len(transport.published) <= 1000 # 2000/s for 0.5s
+    topics = [topic for topic, _ in transport.published]
+    assert topics[:3] == ["synthetic/0", "synthetic/1", "synthetic/2"]
+    assert topics[200] == "synthetic/0"
+    first = json.loads(transport.published[0][1])
+    assert first["device_id"] == "v-0" and first["sequence_id"] == 1 and 1 <= first["t"] <= 2
+    assert json.loads(transport.published[200][1])["sequence_id"] == 2
+
+    state = load.state()
+    assert state["sent"] == len(transport.published)
+    assert state["running"] is False
+    assert state["publish_latency"]["count"] > 0
+
+def test_synthetic_load_shards_devices():
+    loads = [SyntheticLoad(config(devices=10), lambda: [], shard_index=i, shard_count=3) for i in range(3)]
+    assert [list(load.indexes) for load in loads] == [[0, 3, 6, 9], [1, 4, 7], [2, 5, 8]]
+    assert sum(load.rate for load in loads) == pytest.approx(2000)
+
+@pytest.mark.asyncio
+async def test_synthetic_load_below_one_msg_per_s():
+    transport = FakeTransport()
+    load = SyntheticLoad(config(rate=0.9, devices=1, duration_s=1.3), lambda: [transport])
+    load.start()
+    await asyncio.sleep(1.4)
+    assert load.finished
+    # One message due after 1/0.9 s; nothing written off
+    assert (load.sent, load.missed) == (1, 0)
+
+@pytest.mark.asyncio
+async def test_synthetic_load_respects_inflight_window():
+    transport = FakeTransport(window=5)
+    load = SyntheticLoad(config(qos=1, duration_s=0.2), lambda: [transport], defer_s=0.01)
+    load.start()
+    await asyncio.sleep(0.3)
+    # Never acknowledged: the window stops the run at 5 in flight
+    assert len(transport.published) == 5
+    assert transport.inflight.deferred > 0
+
+    transport = FakeTransport(window=5)
+    load = SyntheticLoad(config(qos=1, duration_s=0.2), lambda: [transport], qos_policy="skip")
+    load.start()
+    await asyncio.sleep(0.3)
+    assert len(transport.published) == 5
+    assert load.missed == transport.inflight.dropped > 0
+
+@pytest.mark.asyncio
+async def test_synthetic_load_counts_refused_publishes_as_errors():
+    transport = FakeTransport(rc=4) # MQTT_ERR_NO_CONN
+    load = SyntheticLoad(config(duration_s=0.2), lambda: [transport])
+    load.start()
+    await asyncio.sleep(0.3)
+    assert load.sent == 0
+    assert load.errors == len(transport.published) > 0
@@ -0,0 +1,41 @@
+import paho.mqtt.client as mqtt
+from app.topics import TopicTrie
+
+def test_trie_matches_wildcards():
+    trie = TopicTrie()
+    trie.add("cmd/dev1/set", "exact")
+    trie.add("cmd/+/set", "plus")
+    trie.add("cmd/#", "hash")
+    trie.add("#", "all")
+    trie.add("+/+", "two-levels")
+
+    assert trie.match("cmd/dev1/set") == {"exact", "plus", "hash", "all"}
+    assert trie.match("cmd/dev2/set") == {"plus", "hash", "all"}
+    assert trie.match("cmd") == {"hash", "all"} # "cmd/#" includes its parent level
+    assert trie.match("other/x") == {"all", "two-levels"}
+    assert trie.match("$SYS/broker") == set() # No wildcard matching of $ topics at the first level
+
+def test_trie_agrees_with_paho():
+    filters = ["a/b/c", "a/+/c", "a/#", "+/b/#", "+", "#", "a/+", "+/+/+", "/+", "a//c", "$SYS/#"]
+    topics = ["a/b/c", "a/x/c", "a", "a/b", "b/b/z", "/x", "a//c", "x", "$SYS/uptime", "a/b/c/d"]
+    trie = TopicTrie()
+    for f in filters:
+        trie.add(f, f)
+    for topic in topics:
+        expected = {f for f in filters if mqtt.topic_matches_sub(f, topic)}
+        assert trie.match(topic) == expected, topic
+
+def test_trie_remove_prunes_and_counts():
+    trie = TopicTrie()
+    trie.add("a/+/c", "d1")
+    trie.add("a/+/c", "d2")
+    assert len(trie) == 1
+    assert trie.subscribers("a/+/c") == {"d1", "d2"}
+
+    assert trie.remove("a/+/c", "d1")
+    assert not trie.remove("a/+/c", "d1")
+    assert "a/+/c" in trie
+    assert trie.remove("a/+/c", "d2")
+    assert "a/+/c" not in trie
+    assert trie._root.children == {}
+    assert trie.match("a/b/c") == set()
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import pytest
+from app.transport import AsyncioTransport, InflightWindow, MqttTransport, ThreadedTransport, make_transport
+
+async def _read_packet(reader):
+    header = await reader.readexactly(1)
+    mult, length = 1, 0
+    while True:
+        b = (await reader.readexactly(1))[0]
+        length += (b & 0x7F) * mult
+        mult *= 128
+        if not b & 0x80:
+            break
+    return header[0] >> 4, await reader.readexactly(length)
+
+class StubBroker:
+    """Just enough MQTT 3.1.1 to connect, subscribe and exchange QoS 0 publishes"""
+
+    def __init__(self):
+        self.published = []
+        self.writers = []
+        self.subscribed = asyncio.Event()
+
+    async def handle(self, reader, writer):
+        self.writers.append(writer)
+        try:
+            while True:
+                kind, body = await _read_packet(reader)
+                if kind == 1: # CONNECT
+                    writer.write(b"\x20\x02\x00\x00")
+                elif kind == 3: # PUBLISH
+                    tlen = int.from_bytes(body[:2], "big")
+                    self.published.append((body[2:2 + tlen].decode(), body[2 + tlen:]))
+                elif kind == 8: # SUBSCRIBE
+                    writer.write(b"\x90\x03" + body[:2] + b"\x00")
+                    self.subscribed.set()
+                elif kind == 12: # PINGREQ
+                    writer.write(b"\xd0\x00")
+                elif kind == 14: # DISCONNECT
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        writer.close()
+
+    def send(self, topic: str, payload: bytes):
+        body = len(topic).to_bytes(2, "big") + topic.encode() + payload
+        self.writers[-1].write(bytes([0x30, len(body)]) + body)
+
+@pytest.fixture
+async def broker():
+    stub = StubBroker()
+    server = await asyncio.start_server(stub.handle, "127.0.0.1", 0)
+    stub.port = server.sockets[0].getsockname()[1]
+    yield stub
+    server.close()
+
+async def _connected(transport):
+    connected = asyncio.Event()
+    transport.on_connect = lambda *args: connected.set()
+    transport.connect()
+    await asyncio.wait_for(connected.wait(), 5)
+
+def test_make_transport_kinds():
+    assert isinstance(make_transport("asyncio", "a", "localhost", 1883), AsyncioTransport)
+    assert isinstance(make_transport("thread", "b", "localhost", 1883), ThreadedTransport)
+
+def test_incomplete_transport_fails_at_instantiation():
+    class NoDisconnect(MqttTransport):
+        def connect(self):
+            pass
+
+    with pytest.raises(TypeError):
+        NoDisconnect(None, "localhost", 1883)
+
+@pytest.mark.asyncio
+async def test_asyncio_transport_publishes_and_receives_on_loop(broker):
+    transport = make_transport("asyncio", "t1", "127.0.0.1", broker.port)
+    received = []
+    transport.on_message = lambda client, userdata, msg: received.append((msg.topic, threading.get_ident()))
+    await _connected(transport)
+
+    for _ in range(100):
+        transport.publish("out/topic", b"x")
+    transport.subscribe("in/#")
+    await asyncio.wait_for(broker.subscribed.wait(), 5)
+    broker.send("in/cmd", b"hello")
+    await asyncio.sleep(0.1)
+
+    assert len(broker.published) == 100
+    # Inbound handlers run on the event loop thread, not a paho network thread
+    assert received == [("in/cmd", threading.get_ident())]
+
+    transport.disconnect()
+    assert not transport.is_connected()
+
+@pytest.mark.asyncio
+async def test_asyncio_transport_reconnects(broker):
+    transport = make_transport("asyncio", "t2", "127.0.0.1", broker.port)
+    transport.reconnect_delay_set(0.01, 0.05)
+    await _connected(transport)
+
+    reconnected = asyncio.Event()
+    transport.on_connect = lambda *args: reconnected.set()
+    broker.writers[-1].close()
+    await asyncio.wait_for(reconnected.wait(), 5)
+    assert transport.is_connected()
+    transport.disconnect()
+
+@pytest.mark.asyncio
+async def test_wait_writable_returns_when_under_limit(broker):
+    transport = make_transport("asyncio", "t3", "127.0.0.1", broker.port, max_queued=1)
+    await _connected(transport)
+    transport.publish("out", b"x" * 10)
+    await asyncio.wait_for(transport.wait_writable(), 2)
+    assert transport.queue_depth < transport.max_queued
+    transport.disconnect()
+
+def test_refused_qos_publish_takes_no_window_slot():
+    transport = make_transport("thread", "t4", "127.0.0.1", 1)
+    # Never connected: paho refuses with MQTT_ERR_NO_CONN, no PUBACK will follow
+    assert transport.publish("out", b"x", qos=1).rc != 0
+    assert len(transport.inflight.pending) == 0
+
+def test_inflight_window_full_complete_and_expire():
+    window = InflightWindow(2, timeout_s=5.0)
+    window.add(1, now=0.0)
+    assert not window.full(now=0.0)
+    window.add(2, now=1.0)
+    assert window.full(now=1.0)
+
+    window.complete(2, now=1.5)
+    assert not window.full(now=1.5)
+    assert window.acked == 1
+    assert window.ack_latency.state()["count"] == 1
+
+    # Unacknowledged publishes older than the timeout stop holding the window
+    window.add(3, now=2.0)
+    assert window.full(now=4.0)
+    assert not window.full(now=5.5)
+    assert window.expired == 1
+    assert list(window.pending) == [3]
@@ -0,0 +1,69 @@
+import asyncio
+import multiprocessing
+import threading
+import pytest
+from app.engine import SimulationEngine
+from app.workers import WorkerPool, handle_command, shard_of
+
+def test_shard_of_is_stable_and_covers_all_shards():
+    uuids = [f"device-{i}" for i in range(200)]
+    shards = [shard_of(u, 4) for u in uuids]
+    assert shards == [shard_of(u, 4) for u in uuids]
+    assert set(shards) == {0, 1, 2, 3}
+
+def test_engine_owns_only_its_shard(mock_mqtt):
+    engines = [SimulationEngine(shard_index=i, shard_count=3) for i in range(3)]
+    for uuid in ("a", "b", "c", "d"):
+        assert sum(e.owns_device(uuid) for e in engines) == 1
+    assert SimulationEngine().owns_device("a")
+
+@pytest.mark.asyncio
+async def test_handle_command_stats(mock_mqtt):
+    engine = SimulationEngine(shard_index=1, shard_count=2)
+    engine.active_devices["x"] = {"uuid": "x", "status": "RUNNING"}
+    engine.publish_lateness.observe(0.002)
+
+    reply = await handle_command(engine, {"op": "stats"})
+    assert reply["ok"]
+    assert reply["stats"]["running_devices"] == 1
+    assert reply["stats"]["publish_lateness"]["count"] == 1
+
+    reply = await handle_command(engine, {"op": "bogus"})
+    assert not reply["ok"]
+
+@pytest.mark.asyncio
+async def test_worker_pool_round_trip(db):
+    import app.database
+    pool = WorkerPool(2)
+    pool.start(app.database.DB_PATH)
+    try:
+        replies = await pool.broadcast({"op": "stats"})
+        assert all(r and r["ok"] for r in replies)
+        assert [r["stats"]["running_devices"] for r in replies] == [0, 0]
+    finally:
+        await pool.stop()
+    assert pool.processes == []
+
+@pytest.mark.asyncio
+async def test_worker_pool_drops_reply_to_timed_out_command(mocker):
+    mocker.patch('app.workers.CONTROL_TIMEOUT_S', 0.2)
+    pool = WorkerPool(1)
+    parent, child = multiprocessing.Pipe()
+    pool.conns.append(parent)
+    pool._locks.append(asyncio.Lock())
+
+    def slow_worker():
+        sync = child.recv()
+        stats = child.recv()
+        # The sync reply arrives after the coordinator gave up on it
+        child.send({"ok": True, "seq": sync["seq"]})
+        child.send({"ok": True, "stats": {"running_devices": 0}, "seq": stats["seq"]})
+
+    thread = threading.Thread(target=slow_worker)
+    thread.start()
+    assert await pool.request(0, {"op": "sync"}) is None
+    reply = await pool.request(0, {"op": "stats"})
+    thread.join()
+    assert reply["stats"] == {"running_devices": 0}
+    parent.close()
+    child.close()
@@ -34,7 +34,7 @@ async def verify_listening():
             
         # Give some time for subscription to happen
         print("Waiting for subscription sync...")
-        await asyncio.sleep(6) # Sync loop runs every 5s
+        await asyncio.sleep(1) # Engine applies API changes immediately
         
         # 2. Publish Message to 'test/cmd'
         print("Publishing MQTT message...")